@@ -4,11 +4,9 @@
 import os
 import re
 import json
-import time
+import sqlite3
 import hashlib
-from datetime import datetime, timezone
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from functools import wraps
 from urllib.parse import urljoin, urlparse
 
 import requests
@@ -17,7 +15,6 @@ import numpy as np
 import dirtyjson
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer, CrossEncoder
 from langchain_mistralai.chat_models import ChatMistralAI
 from langchain_core.messages import HumanMessage
 from dateutil.parser import parse as date_parse
@@ -30,77 +27,83 @@ from rank_bm25 import BM25Okapi
 import spacy
 
 from config import (
-    MISTRAL_MODEL, MAX_RETRIES, DEBUG, MAX_CONCURRENT_CRAWLERS, MAX_SEARCH_RESULTS,
+    MISTRAL_MODEL, MISTRAL_ENDPOINT, GOOGLE_SEARCH_ENDPOINT, JINA_READER_ENDPOINT, DEBUG, MAX_CONCURRENT_CRAWLERS, MAX_SEARCH_RESULTS,
     TOP_N_URLS_TO_PROCESS, CRAWL_CACHE_DIR, EMBEDDING_MODEL, SPACY_MODEL,
-    VECTOR_DB_PATH, CROSS_ENCODER_MODEL, RAG_CANDIDATE_POOL_SIZE,
-    RAG_FINAL_EVIDENCE_COUNT, MIN_CONFIDENCE_THRESHOLD
+    VECTOR_DB_PATH, CROSS_ENCODER_MODEL,
+    RAG_FINAL_EVIDENCE_COUNT, MIN_CONFIDENCE_THRESHOLD, RULE_EXTRACTOR_ENABLED, RAG_RERANK_CASCADE,
+    INDEX_ENTITY_TYPES, NLP_BATCH_SIZE, INFERENCE_BACKEND, EMBEDDING_BATCH_SIZE, URL_RANKER_ENABLED,
+    URL_REPUTATION_DB, FETCH_HISTORY_DB, CRAWL_SKIPPED_EXTENSIONS
 )
 from schemas import (
-    DEFAULT_BLANK_FIELDS, CHOICE_OPTIONS, INFERABLE_FIELDS, BLACKLISTED_DOMAINS
+    DEFAULT_BLANK_FIELDS, CHOICE_OPTIONS, INFERABLE_FIELDS, BLACKLISTED_DOMAINS, FIELD_ENTITY_TYPES,
+    FESTIVAL_LEVEL_FIELDS
 )
-
-
-def retry(retries=MAX_RETRIES, delay=5):
-    def decorator(f):
-        @wraps(f)
-        def wrapper(*args, **kwargs):
-            for i in range(retries):
-                try:
-                    return f(*args, **kwargs)
-                except Exception as e:
-                    if i < retries - 1:
-                        is_rate_limit = "429" in str(e)
-                        current_delay = delay * (2 ** i) if not is_rate_limit else delay * (3 ** i)
-                        print(f"WARNING: Function '{f.__name__}' failed. Retrying in {current_delay:.1f}s...")
-                        time.sleep(current_delay)
-                    else:
-                        print(f"ERROR: Function '{f.__name__}' failed after {retries} retries.");
-                        return None
-
-        return wrapper
-
-    return decorator
-
-
-class Field:
-    def __init__(self, value=None, confidence=0.0, sources=None, inferred_by=""):
-        self.value, self.confidence, self.sources, self.inferred_by = value, confidence, sources or [], inferred_by
-        self.last_updated = datetime.now(timezone.utc).isoformat()
-
-    def to_dict(self):
-        return {"value": self.value, "confidence": self.confidence, "sources": self.sources,
-                "inferred_by": self.inferred_by, "last_updated": self.last_updated}
+from knowledge import Field, KnowledgeBase, get_caching_key
+from atomic_io import write_text_atomic
+from metrics import metrics
+from profiling import profiler
+from progress import reporter
+from retrieval_planner import RetrievalPlanner
+from evidence_compressor import EvidenceCompressor, estimate_tokens
+from rule_extractor import RuleExtractor
+from inference_backend import load_embedding_model, load_cross_encoder
+from url_ranker import UrlRanker, DomainReputationStore
+from fetch_planner import FetchPlanner, FetchHistory
+from resilience import guarded
+from streaming_download import download_text
+
+
+_SHARED_MODELS = {}
+
+
+def load_shared_models(vector_db_path: str = VECTOR_DB_PATH) -> dict:
+    """Loads the local models and the VectorDB client once per process; later agents (other race types,
+    jobs served by a warm worker) reuse them instead of paying the startup cost again. The first call picks
+    the VectorDB path, so sharded workers can each open their own store."""
+    if _SHARED_MODELS: return _SHARED_MODELS
+    print("Initializing ML models and VectorDB...")
+    embedding_model = load_embedding_model(EMBEDDING_MODEL)
+    cross_encoder = load_cross_encoder(CROSS_ENCODER_MODEL)
+    print(f"INFO: Local inference backend: {INFERENCE_BACKEND}")
+    try:
+        nlp = spacy.load(SPACY_MODEL)
+    except OSError:
+        print(f"FATAL: spaCy model not found. Run: python -m spacy download {SPACY_MODEL}");
+        import sys;
+        sys.exit(1)
+    chroma_client = chromadb.PersistentClient(path=vector_db_path, settings=Settings(anonymized_telemetry=False))
+    _SHARED_MODELS.update(embedding_model=embedding_model, cross_encoder=cross_encoder, nlp=nlp,
+                          chroma_client=chroma_client)
+    return _SHARED_MODELS
 
 
 class MistralAnalystAgent:
     def __init__(self, mistral_key_1: str, mistral_key_2: str, search_key: str, cse_id: str, schema: list):
         if not all([mistral_key_1, mistral_key_2, search_key, cse_id]): raise ValueError("API keys missing.")
-        self.llm_clients = [ChatMistralAI(api_key=key, model=MISTRAL_MODEL, temperature=0.0) for key in
+        endpoint = {"endpoint": MISTRAL_ENDPOINT} if MISTRAL_ENDPOINT else {}
+        self.llm_clients = [ChatMistralAI(api_key=key, model=MISTRAL_MODEL, temperature=0.0, **endpoint) for key in
                             [mistral_key_1, mistral_key_2]]
         self.llm_client_index = 0
         self.search_api_key, self.cse_id, self.schema = search_key, cse_id, schema
         self.field_instructions = self._generate_field_instructions()
         self.invalid_years = [str(y) for y in range(2015, 2025)]
-        print("Initializing ML models and VectorDB...")
-        self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
-        self.cross_encoder = CrossEncoder(CROSS_ENCODER_MODEL)
-        try:
-            self.nlp = spacy.load(SPACY_MODEL)
-        except OSError:
-            print(f"FATAL: spaCy model not found. Run: python -m spacy download {SPACY_MODEL}");
-            import sys;
-            sys.exit(1)
+        models = load_shared_models()
+        self.embedding_model, self.cross_encoder = models["embedding_model"], models["cross_encoder"]
+        self.nlp, self.chroma_client = models["nlp"], models["chroma_client"]
         self.md_parser = MarkdownIt()
-        self.chroma_client = chromadb.PersistentClient(path=VECTOR_DB_PATH,
-                                                       settings=Settings(anonymized_telemetry=False))
         self.chroma_collection = None
         self.bm25_index, self.mission_corpus, self.corpus_map = None, [], {}
+        self.corpus_entity_labels, self.corpus_index, self.corpus_embeddings = [], {}, None
         self.type_validation_cache, self.variant_validation_cache, self.semantic_merge_cache = {}, {}, {}
+        self.retrieval_planner = RetrievalPlanner()
+        self.rule_extractor = RuleExtractor(self.nlp)
+        self.evidence_compressor = EvidenceCompressor(self.embedding_model)
+        self.url_ranker = UrlRanker(DomainReputationStore(URL_REPUTATION_DB)) if URL_RANKER_ENABLED else None
+        self.fetch_planner = FetchPlanner(FetchHistory(FETCH_HISTORY_DB))
+        self.mission_search_results = []
         print("[SUCCESS] Models and VectorDB initialized.")
 
-    def get_caching_key(self, event_name: str) -> str:
-        base_name = re.sub(r'sprint|standard|olympic|full iron|half iron|70\.3', '', event_name, flags=re.IGNORECASE)
-        return re.sub(r'[^a-z0-9]+', '-', base_name.lower()).strip('-')
+    get_caching_key = staticmethod(get_caching_key)
 
     def _generate_field_instructions(self) -> dict:
         instructions = {}
@@ -113,18 +116,28 @@ class MistralAnalystAgent:
                 instructions[key] = f"Extract the data for '{key}'."
         return instructions
 
-    @retry()
+    @guarded("mistral")
     def _call_llm(self, prompt: str) -> str:
         client = self.llm_clients[self.llm_client_index]
         self.llm_client_index = (self.llm_client_index + 1) % len(self.llm_clients)
         messages = [HumanMessage(content=prompt)]
-        return client.invoke(messages).content
-
+        metrics.incr("llm_calls")
+        with metrics.span("llm_call"):
+            response = client.invoke(messages)
+        usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        if usage:
+            metrics.incr("llm_prompt_tokens", usage.get("prompt_tokens") or 0)
+            metrics.incr("llm_completion_tokens", usage.get("completion_tokens") or 0)
+        return response.content
+
+    @guarded("google_search", default=[])
     def _google_search(self, query: str, num_results=10) -> list:
         print(f"  - Searching Google for: '{query}'")
-        url = "https://www.googleapis.com/customsearch/v1"
+        url = GOOGLE_SEARCH_ENDPOINT
         params = {"key": self.search_api_key, "cx": self.cse_id, "q": query, "num": num_results}
-        response = requests.get(url, params=params)
+        metrics.incr("search_calls")
+        with metrics.span("google_search"):
+            response = requests.get(url, params=params)
         response.raise_for_status()
         return [{"title": i.get("title"), "link": i.get("link"), "snippet": i.get("snippet")} for i in
                 response.json().get("items", [])]
@@ -146,6 +159,17 @@ class MistralAnalystAgent:
         return clean_results
 
     def _step_1b_validate_and_select_urls(self, event_name: str, search_results: list, top_n: int) -> list:
+        if self.url_ranker:
+            try:
+                urls, reason = self.url_ranker.select(event_name, search_results, top_n)
+            except sqlite3.Error as e:
+                urls, reason = [], f"reputation store unavailable ({e})"
+            if urls:
+                print(f"[STEP 1B] URL ranker selected {len(urls)} URLs without the LLM ({reason}).")
+                metrics.incr("url_ranker_selections")
+                return urls
+            print(f"  - URL ranker deferred to the LLM: {reason}.")
+            metrics.incr("url_ranker_fallbacks")
         print(f"[STEP 1B] Validating search results with LLM...")
         prompt = f"You are an intelligence analyst. Identify the most relevant websites for '{event_name}' from the provided search results. Select the single best 'primary_url' (official page) and up to three 'secondary_urls' (news, registration sites).\n\nSearch Results:\n```json\n{json.dumps(search_results, indent=2)}\n```\n\nYour response MUST be a single valid JSON object with keys 'primary_url' and 'secondary_urls'."
         response_text = self._call_llm(prompt)
@@ -169,36 +193,41 @@ class MistralAnalystAgent:
         print(f"  - WARNING: Salvage failed. Falling back to top Google search results.")
         return [r['link'] for r in search_results[:top_n] if r.get('link')]
 
-    @retry(retries=2, delay=10)
+    @guarded("jina")
+    def _fetch_via_jina(self, url: str, timeout: float) -> str | None:
+        return download_text(f"{JINA_READER_ENDPOINT}{url}", timeout)
+
+    def _fetch_direct(self, url: str, timeout: float) -> str | None:
+        html = download_text(url, timeout, headers={'User-Agent': 'Mozilla/5.0'})
+        if not html: return None
+        with metrics.span("readability_extract"):
+            doc = Document(html)
+            html_content = etree.tostring(doc.summary_html(pretty_print=True))
+            text_content = " ".join(etree.fromstring(html_content).xpath("//text()"))
+        return re.sub(r'\s{2,}', ' ', text_content).strip() or None
+
     def _get_content_from_url(self, url: str) -> str | None:
         url_hash = hashlib.md5(url.encode()).hexdigest()
         cache_path = os.path.join(CRAWL_CACHE_DIR, f"{url_hash}.md")
         if os.path.exists(cache_path):
             if DEBUG: print(f"  - Using cached content for: {url}")
+            metrics.incr("crawl_cache_hits")
             with open(cache_path, 'r', encoding='utf-8') as f:
                 return f.read()
         print(f"  - Crawling: {url}")
-        try:
-            response = requests.get(f"https://r.jina.ai/{url}", timeout=60)
-            if response.status_code == 200 and response.text:
-                with open(cache_path, 'w', encoding='utf-8') as f: f.write(response.text); return response.text
-        except requests.RequestException as e:
-            print(f"  - WARNING: Jina crawl failed. Trying fallback ({e}).")
-        try:
-            response = requests.get(url, timeout=60, headers={'User-Agent': 'Mozilla/5.0'})
-            response.raise_for_status()
-            doc = Document(response.content)
-            html_content = etree.tostring(doc.summary_html(pretty_print=True))
-            text_content = " ".join(etree.fromstring(html_content).xpath("//text()"))
-            clean_text = re.sub(r'\s{2,}', ' ', text_content).strip()
-            if clean_text:
-                with open(cache_path, 'w', encoding='utf-8') as f: f.write(clean_text); return clean_text
-        except Exception as e:
-            print(f"  - [ERROR] Fallback crawl also failed for {url}: {e}")
-        return None
+        metrics.incr("crawl_fetches")
+        # The planner picks the historically faster path for this host and hedges with the other one.
+        content, strategy = self.fetch_planner.fetch(url, {"jina": self._fetch_via_jina, "direct": self._fetch_direct})
+        if not content:
+            print(f"  - [ERROR] All fetch strategies failed for {url}")
+            return None
+        if DEBUG: print(f"  - Fetched {url} via {strategy}")
+        write_text_atomic(cache_path, content)
+        return content
 
     def _chunk_and_index_text(self, text: str, url: str, event_id_str: str):
-        chunks = self._chunk_markdown_with_ast(text)
+        with metrics.span("chunk_markdown"):
+            chunks = self._chunk_markdown_with_ast(text)
         if not chunks: return
         print(f"    - Semantically chunked into {len(chunks)} passages from {url}")
         chunk_ids = [f"{event_id_str}_{hashlib.md5(chunk.encode()).hexdigest()}" for chunk in chunks]
@@ -217,12 +246,38 @@ class MistralAnalystAgent:
         print(f"    - Found {len(new_chunks_to_add)} new unique passages to index.")
         new_ids, new_documents = [item['id'] for item in new_chunks_to_add], [item['chunk'] for item in
                                                                               new_chunks_to_add]
-        new_embeddings = self.embedding_model.encode(new_documents).tolist()
-        new_metadatas = [{"source_url": url, "event_id": event_id_str} for _ in new_ids]
-        self.chroma_collection.add(ids=new_ids, embeddings=new_embeddings, documents=new_documents,
-                                   metadatas=new_metadatas)
+        with metrics.span("embed_passages"):
+            new_embeddings = self.embedding_model.encode(new_documents, batch_size=EMBEDDING_BATCH_SIZE).tolist()
+        new_metadatas = [{"source_url": url, "event_id": event_id_str, **flags} for flags in
+                         self._annotate_entities(new_documents)]
+        with metrics.span("chroma_add"):
+            self.chroma_collection.add(ids=new_ids, embeddings=new_embeddings, documents=new_documents,
+                                       metadatas=new_metadatas)
+        metrics.incr("passages_indexed", len(new_ids))
         self.mission_corpus.extend(new_documents)
 
+    @metrics.timed("ner_annotate")
+    def _annotate_entities(self, documents: list[str]) -> list[dict]:
+        """Runs NER in batches and returns one {'has_<type>': bool} metadata dict per document."""
+        annotations = []
+        for doc in self.nlp.pipe(documents, batch_size=NLP_BATCH_SIZE, disable=["parser", "lemmatizer"]):
+            labels = {ent.label_ for ent in doc.ents}
+            annotations.append({f"has_{label.lower()}": label in labels for label in INDEX_ENTITY_TYPES})
+        return annotations
+
+    def _backfill_entity_metadata(self, all_docs: dict):
+        """Annotates passages indexed before entity flags existed, so pre-filtering sees the whole corpus."""
+        flag_key = f"has_{INDEX_ENTITY_TYPES[0].lower()}"
+        metadatas = all_docs.get('metadatas') or [{} for _ in all_docs['ids']]
+        missing = [i for i, meta in enumerate(metadatas) if flag_key not in (meta or {})]
+        if not missing: return
+        print(f"  - Annotating {len(missing)} previously indexed passages with entity flags...")
+        annotations = self._annotate_entities([all_docs['documents'][i] for i in missing])
+        for i, flags in zip(missing, annotations): metadatas[i] = {**(metadatas[i] or {}), **flags}
+        self.chroma_collection.update(ids=[all_docs['ids'][i] for i in missing],
+                                      metadatas=[metadatas[i] for i in missing])
+        all_docs['metadatas'] = metadatas
+
     def _chunk_markdown_with_ast(self, markdown_text: str) -> list[str]:
         try:
             tokens = self.md_parser.parse(markdown_text)
@@ -241,18 +296,41 @@ class MistralAnalystAgent:
         if current_chunk: chunks.append(current_chunk.strip())
         return [c for c in chunks if c]
 
-    def _retrieve_and_fuse_evidence(self, query: str, top_k: int) -> list[dict]:
-        bm25_results = []
+    def _entity_eligible_indices(self, field_name: str | None) -> list[int] | None:
+        """Corpus positions carrying an entity type the field needs, or None when no pre-filter should apply."""
+        entity_types = FIELD_ENTITY_TYPES.get(field_name) if field_name else None
+        if not entity_types or len(self.corpus_entity_labels) != len(self.mission_corpus): return None
+        eligible = [i for i, labels in enumerate(self.corpus_entity_labels) if labels.intersection(entity_types)]
+        # Too few typed passages means NER likely missed the answer; fall back to the whole corpus.
+        if len(eligible) < RAG_FINAL_EVIDENCE_COUNT or len(eligible) == len(self.mission_corpus): return None
+        return eligible
+
+    def _retrieve_and_fuse_evidence(self, query: str, top_k: int, field_name: str = None) -> list[dict]:
+        eligible = self._entity_eligible_indices(field_name)
+        if eligible is not None: top_k = min(top_k, self.retrieval_planner.candidate_pool_size(len(eligible)))
+        bm25_results, doc_scores, query_embedding = [], None, None
         if self.bm25_index and self.mission_corpus:
-            doc_scores = self.bm25_index.get_scores(query.lower().split())
-            top_n_indices = np.argsort(doc_scores)[::-1][:top_k]
+            with metrics.span("bm25_scores"):
+                doc_scores = self.bm25_index.get_scores(query.lower().split())
+            if eligible is not None:
+                top_n_indices = sorted(eligible, key=lambda i: doc_scores[i], reverse=True)[:top_k]
+            else:
+                top_n_indices = np.argsort(doc_scores)[::-1][:top_k]
             bm25_results = [self.corpus_map[i] for i in top_n_indices]
-        collection_count = self.chroma_collection.count()
-        n_results = min(top_k, collection_count)
+        where = None
+        if eligible is not None:
+            n_results = min(top_k, len(eligible))
+            clauses = [{f"has_{label.lower()}": True} for label in FIELD_ENTITY_TYPES[field_name]]
+            where = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+        else:
+            n_results = min(top_k, self.chroma_collection.count())
         hnsw_results = []
         if n_results > 0:
-            query_embedding = self.embedding_model.encode(query).tolist()
-            chroma_results_set = self.chroma_collection.query(query_embeddings=[query_embedding], n_results=n_results)
+            with metrics.span("embed_query"):
+                query_embedding = np.asarray(self.embedding_model.encode(query), dtype=np.float32)
+            with metrics.span("chroma_query"):
+                chroma_results_set = self.chroma_collection.query(query_embeddings=[query_embedding.tolist()],
+                                                                  n_results=n_results, where=where)
             hnsw_results = [{"id": _id, "snippet": doc} for _id, doc in
                             zip(chroma_results_set['ids'][0], chroma_results_set['documents'][0])]
         fused_scores, k = {}, 60
@@ -265,36 +343,128 @@ class MistralAnalystAgent:
                         k + rank + 1)
         if not fused_scores: return []
         sorted_fused = sorted(fused_scores.items(), key=lambda i: i[1], reverse=True)
-        return [all_results[doc_id] for doc_id, score in sorted_fused[:top_k]]
-
-    def _rerank_evidence_with_cross_encoder(self, query: str, evidence: list[dict]) -> list[dict]:
-        if not evidence: return []
-        pairs = [(query, item['snippet']) for item in evidence]
-        scores = self.cross_encoder.predict(pairs)
-        for i, item in enumerate(evidence): item['rerank_score'] = scores[i]
-        return sorted(evidence, key=lambda x: x['rerank_score'], reverse=True)
-
-    def _update_knowledge_base_with_rag(self, knowledge_base: dict, event_name: str, variant_name: str):
-        print(f"    - Updating knowledge for '{variant_name}'...")
-        for field_name in self.schema:
-            field_obj = knowledge_base[variant_name].get(field_name, Field())
+        if query_embedding is not None: query_embedding /= (np.linalg.norm(query_embedding) or 1.0)
+        return [self._with_prefilter_features(all_results[doc_id], score, doc_scores, query_embedding)
+                for doc_id, score in sorted_fused[:top_k]]
+
+    def _with_prefilter_features(self, item: dict, fused_score: float, bm25_scores, query_embedding) -> dict:
+        """Copies a fused candidate with the scores retrieval already computed, for the cascade prefilter."""
+        candidate = {**item, 'fused_score': fused_score}
+        i = self.corpus_index.get(item['id'])
+        if i is None: return candidate
+        if bm25_scores is not None: candidate['bm25_score'] = float(bm25_scores[i])
+        if query_embedding is not None and self.corpus_embeddings is not None:
+            candidate['dense_score'] = float(self.corpus_embeddings[i] @ query_embedding)
+        return candidate
+
+    def _rerank_evidence_with_cross_encoder(self, query: str, evidence: list[dict],
+                                            field_name: str = None) -> list[dict]:
+        score_fn = metrics.timed("cross_encoder_predict")(self.cross_encoder.predict)
+        if RAG_RERANK_CASCADE: return self.retrieval_planner.cascade_rerank(score_fn, query, evidence, field_name)
+        return self.retrieval_planner.rerank(score_fn, query, evidence)
+
+    @staticmethod
+    def _field_query(field_name: str, event_name: str, variant_name: str | None) -> str:
+        if variant_name is None: return f"Information about '{field_name}' for the '{event_name}' event."
+        return f"Information about '{field_name}' for the '{event_name} - {variant_name}' race."
+
+    def _variant_disagrees(self, field_name: str, shared: Field, event_name: str, variant_name: str) -> bool:
+        """
+        True when the variant's own evidence for a festival-level field names the variant but not the shared
+        value, so the variant gets its own extraction. Only checked for entity-typed fields with short values,
+        where retrieval already restricts evidence to passages holding an entity of the field's type.
+        """
+        value = str(shared.value or "").strip().lower()
+        if not value or len(value) > 40 or field_name not in FIELD_ENTITY_TYPES: return False
+        event_words = set(re.findall(r'\w+', event_name.lower()))
+        variant_words = [w for w in re.findall(r'\w+', variant_name.lower())
+                         if w not in event_words and (len(w) > 2 or w.isdigit())]
+        if not variant_words: return False
+        evidence = self._retrieve_and_fuse_evidence(self._field_query(field_name, event_name, variant_name),
+                                                    top_k=RAG_FINAL_EVIDENCE_COUNT, field_name=field_name)
+        for e in evidence:
+            text = e["snippet"].lower()
+            if 2 * sum(w in text for w in variant_words) >= len(variant_words) and value not in text: return True
+        return False
+
+    def _extract_fields(self, knowledge_base: dict, event_name: str):
+        """
+        Festival-level fields are extracted once and shared by every variant (a variant re-extracts one only
+        when its evidence disagrees); variant-level fields are extracted per variant.
+        """
+        festival_fields = [f for f in self.schema if f in FESTIVAL_LEVEL_FIELDS] if len(knowledge_base) > 1 else []
+        variant_fields = [f for f in self.schema if f not in festival_fields]
+        shared = {}
+        if festival_fields:
+            self._update_knowledge_base_with_rag(knowledge_base, event_name, None, festival_fields, shared)
+        for variant in list(knowledge_base.keys()):
+            overrides = [f for f in festival_fields
+                         if f in shared and self._variant_disagrees(f, shared[f], event_name, variant)]
+            for field_name in festival_fields:
+                if field_name in shared and field_name not in overrides:
+                    knowledge_base[variant][field_name] = shared[field_name]
+            if overrides:
+                if DEBUG: print(f"      - '{variant}' has its own evidence for: {', '.join(overrides)}")
+                metrics.incr("festival_field_overrides", len(overrides))
+            self._update_knowledge_base_with_rag(knowledge_base, event_name, variant, variant_fields + overrides)
+            for field_name in overrides:
+                if not knowledge_base[variant].get(field_name, Field()).value:
+                    knowledge_base[variant][field_name] = shared[field_name]
+        # Extractions the variants did not have to repeat.
+        if festival_fields: metrics.incr("festival_field_reuses", len(shared) * (len(knowledge_base) - 1))
+        return knowledge_base
+
+    def _update_knowledge_base_with_rag(self, knowledge_base: dict, event_name: str, variant_name: str | None,
+                                        fields: list = None, record: dict = None):
+        """
+        Extracts `fields` (default: the whole schema) into `record` (default: the variant's entry). With
+        variant_name None the fields are extracted festival-wide, for sharing across variants.
+        """
+        print(f"    - Updating knowledge for '{variant_name or f'{event_name} (festival-level)'}'...")
+        record = knowledge_base[variant_name] if record is None else record
+        corpus_size = len(self.mission_corpus)
+        pool_size = self.retrieval_planner.candidate_pool_size(corpus_size)
+        for field_name in (self.schema if fields is None else fields):
+            field_obj = record.get(field_name, Field())
             if field_name in DEFAULT_BLANK_FIELDS or field_obj.confidence > 0.95: continue
             instruction = self.field_instructions.get(field_name, f"Extract data for '{field_name}'.")
-            query = f"Information about '{field_name}' for the '{event_name} - {variant_name}' race."
-            candidate_evidence = self._retrieve_and_fuse_evidence(query, top_k=RAG_CANDIDATE_POOL_SIZE)
-            reranked_evidence = self._rerank_evidence_with_cross_encoder(query, candidate_evidence)
+            query = self._field_query(field_name, event_name, variant_name)
+            candidate_evidence = self._retrieve_and_fuse_evidence(query, top_k=pool_size, field_name=field_name)
+            reranked_evidence = self._rerank_evidence_with_cross_encoder(query, candidate_evidence, field_name)
             final_evidence = reranked_evidence[:RAG_FINAL_EVIDENCE_COUNT]
             if not final_evidence: continue
+            if RULE_EXTRACTOR_ENABLED and self.rule_extractor.supports(field_name):
+                rule_value = self.rule_extractor.extract(field_name, variant_name or event_name, final_evidence)
+                if rule_value is not None:
+                    if DEBUG: print(f"      - Rule extractor filled '{field_name}': {rule_value}")
+                    metrics.incr("rule_extractor_hits")
+                    if self.rule_extractor.confidence > field_obj.confidence:
+                        record[field_name] = Field(value=rule_value, confidence=self.rule_extractor.confidence,
+                                                   sources=knowledge_base.cite(final_evidence),
+                                                   inferred_by="rule_extractor")
+                    continue
+            if not self.retrieval_planner.should_call_llm(final_evidence):
+                if DEBUG: print(
+                    f"      - Skipping LLM for '{field_name}': top rerank score {final_evidence[0]['rerank_score']:.2f} is below threshold.")
+                self.retrieval_planner.record(field_name, corpus_size, pool_size, final_evidence, llm_called=False)
+                metrics.incr("llm_calls_skipped")
+                continue
             json_response_admonition = "Your answer MUST be a single, concise string value."
             if field_name in ['newsCoverage', 'participationCriteria', 'refundPolicy']:
                 json_response_admonition = "Your answer MUST be a concise summary in a single string."
-            evidence_prompt = "\n".join([f"Evidence Snippet:\n---\n{e['snippet']}\n---" for e in final_evidence])
-            prompt = f"You are a data analyst. Based ONLY on the provided evidence, answer the question. Prioritize evidence that seems most relevant.\n\n## Event Focus\nEvent: {event_name}\nRace Variant: {variant_name}\n\n## Evidence\n{evidence_prompt}\n\n## Task\n{instruction}\n{json_response_admonition}\n\nRespond in a single valid JSON object with two keys: 'answer' and 'confidence'. The 'confidence' value MUST be a numerical float between 0.0 and 1.0 (e.g., 0.85), not a word like 'high'. DO NOT add text before or after the JSON."
+            with metrics.span("compress_evidence"):
+                evidence_texts = self.evidence_compressor.compress(query, final_evidence)
+            evidence_prompt = "\n".join([f"Evidence Snippet:\n---\n{text}\n---" for text in evidence_texts])
+            prompt = f"You are a data analyst. Based ONLY on the provided evidence, answer the question. Prioritize evidence that seems most relevant.\n\n## Event Focus\nEvent: {event_name}\nRace Variant: {variant_name or 'all variants (festival-wide)'}\n\n## Evidence\n{evidence_prompt}\n\n## Task\n{instruction}\n{json_response_admonition}\n\nRespond in a single valid JSON object with two keys: 'answer' and 'confidence'. The 'confidence' value MUST be a numerical float between 0.0 and 1.0 (e.g., 0.85), not a word like 'high'. DO NOT add text before or after the JSON."
+            prompt_tokens = estimate_tokens(prompt)
+            metrics.incr("rag_prompt_tokens_est", prompt_tokens)
             response_text = self._call_llm(prompt)
+            new_confidence, filled = 0.0, False
             try:
                 match = re.search(r'\{.*\}', response_text, re.DOTALL)
                 if match:
-                    result = dirtyjson.loads(match.group(0))
+                    with metrics.span("json_parse"):
+                        result = dirtyjson.loads(match.group(0))
                     new_value = result.get('answer')
                     if isinstance(new_value, (dict, list)): new_value = json.dumps(new_value)
                     try:
@@ -303,13 +473,15 @@ class MistralAnalystAgent:
                         if DEBUG: print(
                             f"      - WARNING: Invalid confidence value from LLM: '{result.get('confidence')}' for '{field_name}'. Defaulting to 0.")
                         new_confidence = 0.0
+                    filled = bool(new_value) and new_confidence >= MIN_CONFIDENCE_THRESHOLD
                     if new_value and new_confidence > field_obj.confidence:
-                        sources = [{"id": e.get("id"), "snippet": e["snippet"]} for e in final_evidence]
-                        knowledge_base[variant_name][field_name] = Field(value=new_value, confidence=new_confidence,
-                                                                         sources=sources,
-                                                                         inferred_by="rag_reranked_llm")
+                        record[field_name] = Field(value=new_value, confidence=new_confidence,
+                                                   sources=knowledge_base.cite(final_evidence),
+                                                   inferred_by="rag_reranked_llm")
             except (dirtyjson.error.Error, AttributeError, TypeError, ValueError) as e:
                 if DEBUG: print(f"      - WARNING: LLM response parsing failed for '{field_name}': {e}.")
+            self.retrieval_planner.record(field_name, corpus_size, pool_size, final_evidence, llm_called=True,
+                                          confidence=new_confidence, filled=filled, prompt_tokens=prompt_tokens)
         return knowledge_base
 
     def _discover_and_filter_variants(self, text: str, event_name: str, requested_type: str, knowledge_base: dict):
@@ -369,12 +541,12 @@ class MistralAnalystAgent:
                             break
                     if not is_semantic_duplicate:
                         print(f"      - [INFO] Found relevant variant: '{name}'")
-                        knowledge_base[name] = {field: Field() for field in self.schema}
+                        knowledge_base[name] = {}
         # CRITICAL FIX RESTORED: This is the original, robust fallback logic from your code.
         except (dirtyjson.error.Error, AttributeError, TypeError) as e:
             if DEBUG: print(f"      - WARNING: Could not parse variant discovery response: {e}.")
             if event_name not in knowledge_base:
-                knowledge_base[event_name] = {field: Field() for field in self.schema}
+                knowledge_base[event_name] = {}
 
     def _run_inferential_filling(self, knowledge_base: dict):
         print("\n[INFERENCE] Running final analysis to infer missing data...")
@@ -408,15 +580,38 @@ class MistralAnalystAgent:
 
     def run(self, race_info: dict) -> dict:
         event_name = race_info.get("Festival")
-        search_results = self._step_1a_initial_search(race_info)
-        if not search_results: return None
-        validated_urls = self._step_1b_validate_and_select_urls(event_name, search_results, TOP_N_URLS_TO_PROCESS)
-        if not validated_urls: return None
-        return self._crawl_and_extract(validated_urls, race_info)
+        with profiler.mission(event_name):
+            with reporter.stage("search", mission=event_name):
+                search_results = self._step_1a_initial_search(race_info)
+            if not search_results: return None
+            self.mission_search_results = search_results
+            with reporter.stage("url_selection", mission=event_name):
+                validated_urls = self._step_1b_validate_and_select_urls(event_name, search_results,
+                                                                        TOP_N_URLS_TO_PROCESS)
+            if not validated_urls: return None
+            return self._crawl_and_extract(validated_urls, race_info)
+
+    def _record_url_outcomes(self, event_name: str, crawled: dict, all_docs: dict, knowledge_base: dict):
+        """Feeds which crawled URLs yielded passages and high-confidence fields back into the URL ranker."""
+        if not self.url_ranker or not crawled: return
+        source_of = {doc_id: (meta or {}).get("source_url")
+                     for doc_id, meta in zip(all_docs['ids'], all_docs.get('metadatas') or [])}
+        passages, fields = {}, {}
+        for url in source_of.values():
+            if url: passages[url] = passages.get(url, 0) + 1
+        for variant_data in knowledge_base.values():
+            for field_obj in variant_data.values():
+                if field_obj.confidence < MIN_CONFIDENCE_THRESHOLD: continue
+                for url in {source_of.get(chunk_id) for chunk_id in field_obj.sources} - {None}:
+                    fields[url] = fields.get(url, 0) + 1
+        try:
+            self.url_ranker.record_mission(event_name, self.mission_search_results, crawled, passages, fields)
+        except sqlite3.Error as e:
+            print(f"  - WARNING: Could not update the URL reputation store: {e}")
 
     def _is_valid_url(self, url: str) -> bool:
-        if url.lower().endswith('.pdf'):
-            if DEBUG: print(f"  - Skipping PDF link: {url}")
+        if urlparse(url).path.lower().endswith(CRAWL_SKIPPED_EXTENSIONS):
+            if DEBUG: print(f"  - Skipping non-HTML link: {url}")
             return False
         if any(year in url for year in self.invalid_years):
             if DEBUG: print(f"  - Filtering out past year URL: {url}")
@@ -430,14 +625,22 @@ class MistralAnalystAgent:
         print(f"\n[STEP 2] Starting RAG processing for '{event_name}' (Collection: {event_id_str})")
 
         # CRITICAL FIX: The knowledge_base is initialized here, as per your original logic.
-        knowledge_base = {}
+        knowledge_base = KnowledgeBase()
 
         self.mission_corpus, self.corpus_map, self.bm25_index = [], {}, None
+        self.corpus_entity_labels, self.corpus_index, self.corpus_embeddings = [], {}, None
         self.type_validation_cache, self.variant_validation_cache, self.semantic_merge_cache = {}, {}, {}
-        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CRAWLERS) as executor:
+        self.retrieval_planner.reset_stats()
+        self.rule_extractor.reset_stats()
+        self.evidence_compressor.reset_stats()
+        crawled = {}
+        with reporter.stage("crawl_and_index", mission=event_name), \
+                ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CRAWLERS) as executor:
             futures = {executor.submit(self._get_content_from_url, url): url for url in urls}
             for future in as_completed(futures):
-                if content := future.result():
+                content = future.result()
+                crawled[futures[future]] = bool(content)
+                if content:
                     url = futures[future]
                     print(f"  - Processing content from: {url}")
                     self._chunk_and_index_text(content, url, event_id_str)
@@ -448,18 +651,34 @@ class MistralAnalystAgent:
         if not knowledge_base:
             print(
                 f"INFO: No variants were discovered from crawling. Creating a default entry for '{event_name}' to ensure robustness.")
-            knowledge_base[event_name] = {field: Field() for field in self.schema}
+            knowledge_base[event_name] = {}
 
-        all_docs = self.chroma_collection.get()
+        all_docs = self.chroma_collection.get(include=["documents", "metadatas", "embeddings"])
         self.mission_corpus = all_docs['documents']
         if self.mission_corpus:
+            self._backfill_entity_metadata(all_docs)
+            self.corpus_entity_labels = [
+                {label for label in INDEX_ENTITY_TYPES if (meta or {}).get(f"has_{label.lower()}")}
+                for meta in all_docs['metadatas']]
             print(f"  - Building BM25 index for {len(self.mission_corpus)} total passages...")
-            self.bm25_index = BM25Okapi([doc.lower().split() for doc in self.mission_corpus])
+            with metrics.span("bm25_build"):
+                self.bm25_index = BM25Okapi([doc.lower().split() for doc in self.mission_corpus])
             self.corpus_map = {i: {'id': all_docs['ids'][i], 'snippet': doc} for i, doc in
                                enumerate(self.mission_corpus)}
-
-        for variant in list(knowledge_base.keys()):
-            self._update_knowledge_base_with_rag(knowledge_base, event_name, variant)
-        knowledge_base = self._run_inferential_filling(knowledge_base)
+            self.corpus_index = {doc_id: i for i, doc_id in enumerate(all_docs['ids'])}
+            # Stored passage embeddings give the cascade prefilter a similarity for BM25-only candidates too.
+            if all_docs.get('embeddings') is not None and len(all_docs['embeddings']) == len(self.mission_corpus):
+                embeddings = np.asarray(all_docs['embeddings'], dtype=np.float32)
+                self.corpus_embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True),
+                                                              1e-12, None)
+
+        with reporter.stage("rag_extraction", mission=event_name, variants=len(knowledge_base)):
+            self._extract_fields(knowledge_base, event_name)
+        print(f"  - Retrieval planner: {self.retrieval_planner.summary()}")
+        if RULE_EXTRACTOR_ENABLED: print(f"  - Rule extractor hit rates: {self.rule_extractor.hit_rate_report()}")
+        print(f"  - Evidence compression: {self.evidence_compressor.summary()}")
+        with reporter.stage("inference", mission=event_name):
+            knowledge_base = self._run_inferential_filling(knowledge_base)
+        self._record_url_outcomes(event_name, crawled, all_docs, knowledge_base)
         print("\n[SUCCESS] All search and analysis phases complete.")
         return knowledge_base
\ No newline at end of file
@@ -0,0 +1,26 @@
+# atomic_io.py
+# Crash- and concurrency-safe file writes for the caches shared by several runner processes: content is
+# written to a uniquely named temp file next to the target and moved into place with os.replace, so readers
+# only ever see a missing file or a complete one.
+
+import os
+import json
+import socket
+import threading
+
+
+def _temp_path(path: str) -> str:
+    return f"{path}.{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}.tmp"
+
+
+def write_text_atomic(path: str, text: str):
+    tmp_path = _temp_path(path)
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f: f.write(text)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+
+
+def write_json_atomic(path: str, data, indent: int = 4):
+    write_text_atomic(path, json.dumps(data, indent=indent))
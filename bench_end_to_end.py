@@ -0,0 +1,329 @@
+# bench_end_to_end.py
+# Offline end-to-end benchmark for main.main / MistralAnalystAgent.run. A single local HTTP server
+# stands in for every remote dependency:
+#   /customsearch/v1        fixture-backed Google Custom Search results
+#   /jina/<url>             Jina reader returning the saved markdown for a fixture page
+#   /pages/<slug>           the fixture page itself (HTML, for the readability fallback)
+#   /v1/chat/completions    deterministic Mistral-compatible fake LLM with configurable latency
+# The local models (embeddings, cross-encoder, spaCy) and Chroma run for real, in an isolated data dir.
+#
+#   python bench_end_to_end.py --events 10 --llm-latency 0.3
+#   python bench_end_to_end.py --events 10 --save-baseline          # record bench_end_to_end_baseline.json
+#   python bench_end_to_end.py --events 10 --tolerance 0.15          # exit 1 on regression vs. the baseline
+
+import os
+import re
+import csv
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BASE_DIR, "bench_end_to_end_baseline.json")
+INVALID_URL_YEARS = [str(y) for y in range(2015, 2025)]  # The agent drops URLs containing these
+CITIES = [("Pune", "Maharashtra"), ("Bengaluru", "Karnataka"), ("Chennai", "Tamil Nadu"), ("Jaipur", "Rajasthan"),
+          ("Kochi", "Kerala"), ("Shillong", "Meghalaya")]
+VARIANTS = [("10K Run", "10 km", "1:30 hrs"), ("Half Marathon", "21.1 km", "3:30 hrs"),
+            ("Full Marathon", "42.2 km", "6:30 hrs"), ("5K Fun Run", "5 km", "1 hour")]
+FILLER_WORDS = ("runners route city morning volunteers hydration medal support crowd course weather training "
+                "community charity finish start timing chip bib expo parking shuttle music pacers recovery").split()
+
+# Metrics whose growth beyond the tolerance counts as a regression (higher is worse unless noted).
+REGRESSION_CHECKS = {"missions_per_hour": "lower", "llm_calls_per_mission": "higher",
+                     "embedding_seconds": "higher", "rerank_seconds": "higher", "peak_rss_mb": "higher"}
+
+
+def _slug(index: int) -> str:
+    """Letters-only slug so fixture URLs never contain a year the agent would filter out."""
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(ord('a') + rem) + letters
+    return letters
+
+
+# --- Fixtures ---
+
+def build_fixtures(directory: str, num_events: int, variants_per_event: int, page_words: int, seed: int = 11):
+    """Writes races.json, search.json and one markdown file per page under `directory`."""
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(directory, "pages"), exist_ok=True)
+    races, search = [], {}
+    for i in range(num_events):
+        festival = f"Synthetic {CITIES[i % len(CITIES)][0]} Marathon {_slug(i).upper()}"
+        city, state = CITIES[i % len(CITIES)]
+        variants = VARIANTS[:max(1, min(variants_per_event, len(VARIANTS)))]
+        day, cost = rng.randint(1, 28), rng.choice([799, 1199, 1500, 2499])
+        pages = {
+            "official": [f"# {festival}", "## Race categories"] +
+                        [f"Category: {festival} {name} (Run)" for name, _, _ in variants] +
+                        ["## Event details", f"date: {day} March 2026", f"city: {city}", f"state: {state}",
+                         f"organiser: {city} Runners Club", "startTime: 5:30 AM", "runningSurface: Road"] +
+                        [f"{festival} {name} runningDistance: {distance}" for name, distance, _ in variants],
+            "registration": [f"# Register for {festival}", f"registrationCost: Rs. {cost}",
+                             f"lastDate: {max(1, day - 10)} February 2026", "ageLimitation: 18+"] +
+                            [f"{festival} {name} runCutoff: {cutoff}" for name, _, cutoff in variants],
+            "news": [f"# {festival} returns", f"The race starts from the {city} city centre.",
+                     f"Category: {festival} {variants[0][0]} (Run)"],
+        }
+        items = []
+        for kind, lines in pages.items():
+            slug = f"{_slug(i)}-{kind}"
+            paragraphs = [" ".join(rng.choice(FILLER_WORDS) for _ in range(60)) for _ in range(page_words // 60)]
+            notes = [f"## Notes {n}\n{p}" for n, p in enumerate(paragraphs)]
+            body = "\n\n".join(lines[:2] + ["\n".join(lines[2:])] + notes)
+            with open(os.path.join(directory, "pages", f"{slug}.md"), 'w', encoding='utf-8') as f: f.write(body)
+            items.append({"title": f"{festival} - {kind}", "slug": slug, "snippet": lines[0].lstrip("# ")})
+        races.append({"Festival": festival, "Type": "Running", "Priority": 1})
+        search[festival] = items
+    with open(os.path.join(directory, "races.json"), 'w', encoding='utf-8') as f: json.dump(races, f, indent=2)
+    with open(os.path.join(directory, "search.json"), 'w', encoding='utf-8') as f: json.dump(search, f, indent=2)
+
+
+# --- Fake LLM ---
+
+def fake_completion(prompt: str) -> str:
+    """Deterministic answers shaped like the agent's real prompts expect."""
+    if "Identify the most relevant websites" in prompt:
+        match = re.search(r"```json\n(.*?)\n```", prompt, re.DOTALL)
+        links = [r.get("link") for r in json.loads(match.group(1))] if match else []
+        return json.dumps({"primary_url": links[0] if links else None, "secondary_urls": links[1:3]})
+    if "identify all distinct race variants" in prompt:
+        return json.dumps({name: race_type for name, race_type in re.findall(r"Category: (.+?) \((\w+)\)", prompt)})
+    if "considered a type of" in prompt or "referring to the same race concept" in prompt:
+        return "No"
+    if "Is the race named" in prompt:
+        return "Yes"
+    if "Based ONLY on the provided evidence" in prompt:
+        field = re.search(r"Extract the data for '([^']+)'", prompt)
+        evidence = prompt.split("## Task")[0]
+        value = re.search(rf"{re.escape(field.group(1))}: ([^\n]+)", evidence) if field else None
+        return json.dumps({"answer": value.group(1).strip(), "confidence": 0.9} if value else
+                          {"answer": "", "confidence": 0.0})
+    if "What country is the city" in prompt:
+        return "India"
+    if "water temperature" in prompt:
+        return "24"
+    if options := re.search(r"MUST be one of: ([^.,]+)", prompt):
+        return options.group(1).strip()
+    return "{}"
+
+
+# --- Stand-in server ---
+
+class StandInHandler(BaseHTTPRequestHandler):
+    fixtures_dir, search_index = None, {}
+    llm_latency, search_latency, crawl_latency = 0.3, 0.1, 0.1
+    counts, lock = {}, threading.Lock()
+
+    def _count(self, key: str):
+        with StandInHandler.lock: StandInHandler.counts[key] = StandInHandler.counts.get(key, 0) + 1
+
+    def _send(self, status: int, body: str, content_type: str):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _page_markdown(self, slug: str) -> str | None:
+        path = os.path.join(self.fixtures_dir, "pages", f"{os.path.basename(slug)}.md")
+        if not os.path.exists(path): return None
+        with open(path, 'r', encoding='utf-8') as f: return f.read()
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/customsearch/v1":
+            self._count("search")
+            time.sleep(self.search_latency)
+            query = parse_qs(parsed.query).get("q", [""])[0]
+            base = f"http://{self.headers.get('Host')}"
+            matches = [festival for festival in self.search_index if festival in query]
+            items = self.search_index[max(matches, key=len)] if matches else []
+            return self._send(200, json.dumps({"items": [{"title": it["title"], "link": f"{base}/pages/{it['slug']}",
+                                                          "snippet": it["snippet"]} for it in items]}),
+                              'application/json')
+        if parsed.path.startswith("/jina/"):
+            self._count("crawl")
+            time.sleep(self.crawl_latency)
+            markdown = self._page_markdown(urlparse(unquote(self.path[len("/jina/"):])).path.rsplit("/", 1)[-1])
+            return self._send(200, markdown, 'text/plain') if markdown else self._send(404, "", 'text/plain')
+        if parsed.path.startswith("/pages/"):
+            self._count("page")
+            time.sleep(self.crawl_latency)
+            markdown = self._page_markdown(parsed.path.rsplit("/", 1)[-1])
+            if not markdown: return self._send(404, "", 'text/html')
+            html = "".join(f"<p>{block}</p>" for block in markdown.split("\n\n"))
+            return self._send(200, f"<html><body><article>{html}</article></body></html>", 'text/html')
+        self._send(404, "", 'text/plain')
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"): return self._send(404, "", 'text/plain')
+        self._count("llm")
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+        prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+        time.sleep(self.llm_latency)
+        content = fake_completion(prompt)
+        self._send(200, json.dumps({
+            "id": "bench", "object": "chat.completion", "created": int(time.time()), "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(prompt) + len(content)) // 4}}), 'application/json')
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server() -> ThreadingHTTPServer:
+    """Binds a free port whose number cannot be mistaken for a past-edition year in URLs."""
+    while True:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        if not any(year in str(server.server_address[1]) for year in INVALID_URL_YEARS): break
+        server.server_close()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+        except ImportError:
+            return None
+
+
+# --- Run & report ---
+
+def run_benchmark(args, work_dir: str) -> dict:
+    fixtures_dir = args.fixtures or os.path.join(work_dir, "fixtures")
+    if not args.fixtures:
+        build_fixtures(fixtures_dir, args.events, args.variants, args.page_words)
+    StandInHandler.fixtures_dir = fixtures_dir
+    with open(os.path.join(fixtures_dir, "search.json"), 'r', encoding='utf-8') as f:
+        StandInHandler.search_index = json.load(f)
+    StandInHandler.llm_latency, StandInHandler.search_latency = args.llm_latency, args.search_latency
+    StandInHandler.crawl_latency = args.crawl_latency
+    server = start_server()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    # config.py reads these at import time, so they must be set before main/agent are imported.
+    os.environ.update({"GOOGLE_SEARCH_ENDPOINT": f"{base}/customsearch/v1", "JINA_READER_ENDPOINT": f"{base}/jina/",
+                       "MISTRAL_ENDPOINT": f"{base}/v1", "CRAWL4AI_DATA_DIR": os.path.join(work_dir, "data"),
+                       "MISTRAL_API_KEY": "bench", "MISTRAL_API_KEY_1": "bench", "SEARCH_API_KEY": "bench",
+                       "CSE_ID": "bench"})
+    os.environ.pop("RAG_PLANNER_LOG_FILE", None)
+    try:
+        startup = time.perf_counter()
+        import main
+        from agent import load_shared_models
+        from metrics import metrics
+        load_shared_models()
+        startup = time.perf_counter() - startup
+        start = time.perf_counter()
+        output_files = main.main(output_dir_override=os.path.join(work_dir, "outputs"),
+                                 input_file_override=os.path.join(fixtures_dir, "races.json"))
+        wall = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    summary = metrics.summary()
+    missions = [m for m in summary["missions"] if m["status"] != "skipped"]
+    stage_total = lambda *names: round(sum(summary["stages"].get(n, {}).get("total_s", 0.0) for n in names), 3)
+    rows = 0
+    for path in output_files:
+        with open(path, 'r', newline='', encoding='utf-8') as f: rows += sum(1 for row in csv.DictReader(f) if any(row.values()))
+    return {
+        "settings": {"events": args.events, "variants": args.variants, "page_words": args.page_words,
+                     "llm_latency": args.llm_latency, "search_latency": args.search_latency,
+                     "crawl_latency": args.crawl_latency, "fixtures": bool(args.fixtures)},
+        "missions": len(missions), "failed_missions": sum(m["status"] == "failed" for m in missions),
+        "rows": rows, "model_startup_seconds": round(startup, 3), "wall_seconds": round(wall, 3),
+        "missions_per_hour": round(3600.0 * len(missions) / wall, 2) if wall else 0.0,
+        "llm_calls_per_mission": round(StandInHandler.counts.get("llm", 0) / max(1, len(missions)), 2),
+        "llm_calls_skipped": summary["counters"].get("llm_calls_skipped", 0),
+        "embedding_seconds": stage_total("embed_passages", "embed_query"),
+        "rerank_seconds": stage_total("cross_encoder_predict"),
+        "peak_rss_mb": round(peak_rss_mb() or 0.0, 1),
+        "stand_in_requests": dict(StandInHandler.counts),
+        "stages": summary["stages"],
+    }
+
+
+def compare_to_baseline(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    if baseline.get("settings") != result["settings"]:
+        print("WARNING: Baseline was recorded with different settings; comparison may be meaningless.")
+    for key, worse in REGRESSION_CHECKS.items():
+        old, new = baseline.get(key), result.get(key)
+        if not old or new is None: continue
+        change = (new - old) / old
+        if (worse == "higher" and change > tolerance) or (worse == "lower" and -change > tolerance):
+            regressions.append(f"{key}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with local stand-in services.")
+    parser.add_argument("--events", type=int, default=10, help="Synthetic events in the race list.")
+    parser.add_argument("--variants", type=int, default=2, help="Race variants per synthetic event.")
+    parser.add_argument("--page-words", type=int, default=900, help="Filler words per fixture page.")
+    parser.add_argument("--fixtures", type=str, default=None,
+                        help="Existing fixture dir (races.json, search.json, pages/*.md) instead of synthetic ones.")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Fake LLM latency per call (s).")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="Search stand-in latency (s).")
+    parser.add_argument("--crawl-latency", type=float, default=0.1, help="Crawl stand-in latency per page (s).")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE, help="Baseline JSON to compare against.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative change before flagging.")
+    parser.add_argument("--json-out", type=str, default=None, help="Also write the full result JSON here.")
+    parser.add_argument("--keep", action="store_true", help="Keep the work directory (fixtures, outputs, logs).")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="e2e_bench_")
+    try:
+        result = run_benchmark(args, work_dir)
+    finally:
+        if args.keep: print(f"\nINFO: Work directory kept at {work_dir}")
+        else: shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("\n" + "=" * 60)
+    print("END-TO-END BENCHMARK")
+    print("=" * 60)
+    for key in ("missions", "failed_missions", "rows", "model_startup_seconds", "wall_seconds", "missions_per_hour",
+                "llm_calls_per_mission", "llm_calls_skipped", "embedding_seconds", "rerank_seconds", "peak_rss_mb"):
+        print(f"{key:<24} {result[key]}")
+    print(f"{'stand_in_requests':<24} {result['stand_in_requests']}")
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f: json.dump(result, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f: json.dump(result, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one.")
+        return
+    with open(args.baseline, 'r', encoding='utf-8') as f: baseline = json.load(f)
+    regressions = compare_to_baseline(result, baseline, args.tolerance)
+    if regressions:
+        print(f"\nREGRESSIONS (tolerance {args.tolerance:.0%}):")
+        for line in regressions: print(f"  - {line}")
+        sys.exit(1)
+    print(f"\nNo regressions against baseline (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == '__main__':
+    main()
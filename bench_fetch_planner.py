@@ -0,0 +1,170 @@
+# bench_fetch_planner.py
+# Offline benchmark for the hedged fetch planner (fetch_planner.py). A local HTTP server stands in for both
+# fetch paths, with injected latency and failures per simulated host:
+#   /jina/<url>             Jina reader stand-in (markdown)
+#   /direct/<host>/<page>   the page itself
+# Each profile makes a different path the better one (slow Jina, slow direct, flaky Jina, long-tail stragglers).
+# The planner (learning per-host history as it goes) is compared with the old sequential Jina-then-direct order.
+# Injected outcomes depend only on the page and path, so both runs see the same stragglers and failures.
+#
+#   python bench_fetch_planner.py --pages 100 --scale 0.2
+#
+# Expected trade-offs: on flaky-jina.test (half of Jina's answers fail) both orders cost about the same on average;
+# the p50 sits on the edge between "Jina answered" and "Jina failed, then direct", and moves with the handful of
+# early fetches the planner spends learning the host. On hosts where the first path is already the right one
+# (slow-direct, straggler p50), the planner only adds its bookkeeping (a few ms of SQLite reads per fetch).
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import requests
+
+from fetch_planner import FetchPlanner, FetchHistory
+from url_ranker import domain_of
+
+# host -> {path: (median seconds, straggler probability, straggler seconds, failure probability)}
+PROFILES = {
+    "slow-jina.test": {"jina": (2.0, 0.1, 6.0, 0.0), "direct": (0.3, 0.0, 0.0, 0.0)},
+    "slow-direct.test": {"jina": (0.3, 0.0, 0.0, 0.0), "direct": (2.0, 0.1, 6.0, 0.0)},
+    "flaky-jina.test": {"jina": (0.4, 0.0, 0.0, 0.5), "direct": (0.8, 0.0, 0.0, 0.0)},
+    "straggler.test": {"jina": (0.3, 0.08, 8.0, 0.0), "direct": (0.6, 0.0, 0.0, 0.0)},
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    scale, seed = 1.0, 7
+
+    def _delay_and_fail(self, host: str, page: str, path: str) -> bool:
+        """Outcomes are a function of (page, path), so both runs face exactly the same stragglers and failures."""
+        median, straggler_p, straggler_s, fail_p = PROFILES.get(host, PROFILES["straggler.test"])[path]
+        rng = random.Random(f"{self.seed}:{host}{page}:{path}")
+        jitter, straggles, fails = rng.uniform(0.8, 1.2), rng.random() < straggler_p, rng.random() < fail_p
+        time.sleep(self.scale * (straggler_s if straggles else median * jitter))
+        return fails
+
+    def _send(self, status: int, body: str):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        try:
+            if self.path.startswith("/jina/"):
+                page = urlparse(self.path[len("/jina/"):])
+                if self._delay_and_fail(page.netloc, page.path, "jina"): return self._send(503, "")
+                return self._send(200, f"# {page.netloc}{page.path}\n\nRace details for {page.path}.")
+            if self.path.startswith("/direct/"):
+                host, _, page = self.path[len("/direct/"):].partition("/")
+                if self._delay_and_fail(host, "/" + page, "direct"): return self._send(503, "")
+                return self._send(200, f"<html><body><h1>{host}/{page}</h1><p>Race details.</p></body></html>")
+            self._send(404, "")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The hedge loser's client may have gone away
+
+    def log_message(self, *args):
+        pass
+
+
+def make_fetchers(base: str) -> dict:
+    def jina(url, timeout):
+        response = requests.get(f"{base}/jina/{url}", timeout=timeout)
+        return response.text if response.status_code == 200 and response.text else None
+
+    def direct(url, timeout):
+        parsed = urlparse(url)
+        response = requests.get(f"{base}/direct/{parsed.netloc}{parsed.path}", timeout=timeout)
+        response.raise_for_status()
+        return response.text or None
+    return {"jina": jina, "direct": direct}
+
+
+def sequential(url: str, fetchers: dict, timeout: float):
+    """The previous behaviour: Jina first, direct fetch only after Jina failed."""
+    for name, fetcher in fetchers.items():
+        try:
+            content = fetcher(url, timeout)
+            if content: return content, name
+        except requests.RequestException:
+            pass
+    return None, None
+
+
+def run(label: str, fetch, urls: list[str], concurrency: int) -> dict:
+    def timed_fetch(url):
+        start = time.perf_counter()
+        content, strategy = fetch(url)
+        return domain_of(url), time.perf_counter() - start, strategy, bool(content)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_fetch, urls))
+    print(f"\n--- {label} ---")
+    summary = {}
+    for host in PROFILES:
+        times = sorted(seconds for h, seconds, _, _ in results if h == host)
+        wins = {}
+        for h, _, strategy, _ in results:
+            if h == host and strategy: wins[strategy] = wins.get(strategy, 0) + 1
+        failures = sum(1 for h, _, _, ok in results if h == host and not ok)
+        p50, p95 = times[len(times) // 2], times[min(len(times) - 1, int(0.95 * len(times)))]
+        summary[host] = (p50, p95, sum(times) / len(times))
+        print(f"  {host:<18} p50 {p50:6.2f}s  p95 {p95:6.2f}s  mean {summary[host][2]:6.2f}s  wins {wins}  "
+              f"failures {failures}")
+    total = [seconds for _, seconds, _, _ in results]
+    summary["all"] = (sorted(total)[len(total) // 2], sum(total))
+    print(f"  {'all':<18} p50 {summary['all'][0]:6.2f}s  total {summary['all'][1]:7.1f}s")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hedged fetch planning against sequential fallback")
+    parser.add_argument("--pages", type=int, default=100, help="Pages fetched per simulated host.")
+    parser.add_argument("--scale", type=float, default=0.2, help="Multiplier on every injected latency.")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    StandInHandler.scale, StandInHandler.seed = args.scale, args.seed
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    fetchers = make_fetchers(base)
+    urls = [f"http://{host}/race-{i}" for i in range(args.pages) for host in PROFILES]
+    random.Random(args.seed).shuffle(urls)
+
+    baseline = run("sequential (jina, then direct)", lambda url: sequential(url, fetchers, args.timeout), urls,
+                   args.concurrency)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        planner = FetchPlanner(FetchHistory(os.path.join(tmp_dir, "fetch_history.sqlite3")), timeout=args.timeout,
+                               default_delay=2.0 * args.scale, min_delay=0.1 * args.scale,
+                               max_delay=15.0 * args.scale, max_workers=4 * args.concurrency)
+        hedged = run("hedged planner", lambda url: planner.fetch(url, fetchers), urls, args.concurrency)
+        planner.executor.shutdown(wait=True)
+    server.shutdown()
+
+    print("\n" + "=" * 60)
+    print(f"{'host':<18} {'p50 speedup':>12} {'p95 speedup':>12} {'mean speedup':>13}")
+    for host in PROFILES:
+        print(f"{host:<18} {baseline[host][0] / hedged[host][0]:11.2f}x {baseline[host][1] / hedged[host][1]:11.2f}x "
+              f"{baseline[host][2] / hedged[host][2]:12.2f}x")
+    speedup = baseline["all"][1] / hedged["all"][1]
+    print(f"{'total fetch time':<18} {speedup:11.2f}x")
+    print("=" * 60)
+    if speedup < 1.0:
+        print("[ERROR] The hedged planner was slower than sequential fetching overall.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# bench_gemini_pipeline.py
+# Throughput benchmark for the Gemini image pipeline against a local stand-in endpoint.
+# The stand-in sleeps for a fixed model latency plus the time needed to "upload" the payload at a
+# configurable bandwidth, then returns a canned JSON extraction. No API quota is used.
+#
+#   python bench_gemini_pipeline.py --images 24 --latency 1.5 --bandwidth-mbps 20 --workers 4
+
+import os
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, ImageDraw
+
+from gemini import run_image_pipeline, parse_gemini_text
+
+CANNED_RESPONSE = "```json\n" + json.dumps({"event": "Synthetic Poster Run", "date": "15 March 2026",
+                                            "city": "Pune", "registrationCost": "1500"}) + "\n```"
+
+
+class StandInGeminiHandler(BaseHTTPRequestHandler):
+    latency, bandwidth_bytes_per_s = 1.0, 2.5e6
+    bytes_received, lock = 0, threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with StandInGeminiHandler.lock: StandInGeminiHandler.bytes_received += len(body)
+        time.sleep(self.latency + len(body) / self.bandwidth_bytes_per_s)
+        payload = json.dumps({"text": CANNED_RESPONSE}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_synthetic_posters(directory: str, count: int, size=(3000, 4000), seed: int = 3) -> list[str]:
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        img = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(400):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            draw.rectangle([x, y, x + rng.randrange(20, 300), y + rng.randrange(20, 120)],
+                           fill=tuple(rng.randrange(256) for _ in range(3)))
+        path = os.path.join(directory, f"poster_{i:04d}.png")
+        img.save(path)
+        paths.append(path)
+    return paths
+
+
+def make_request_fn(endpoint: str):
+    def request_fn(image_path: str, image_bytes: bytes) -> dict:
+        req = urllib.request.Request(endpoint, data=image_bytes, headers={'Content-Type': 'image/jpeg'})
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            return parse_gemini_text(json.loads(resp.read())["text"])
+    return request_fn
+
+
+def run_case(label: str, image_paths: list, work_dir: str, request_fn, **pipeline_kwargs) -> dict:
+    StandInGeminiHandler.bytes_received = 0
+    output_path = os.path.join(work_dir, f"{label}.csv")
+    cache_file = os.path.join(work_dir, f"{label}.log")
+    start = time.perf_counter()
+    rows = run_image_pipeline(image_paths, output_path, request_fn=request_fn, cache_file=cache_file,
+                              **pipeline_kwargs)
+    elapsed = time.perf_counter() - start
+    return {"label": label, "rows": rows, "seconds": elapsed, "images_per_min": 60.0 * rows / elapsed,
+            "upload_mb": StandInGeminiHandler.bytes_received / 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Gemini image pipeline against a local stand-in.")
+    parser.add_argument("--images", type=int, default=24, help="Number of synthetic posters.")
+    parser.add_argument("--latency", type=float, default=1.5, help="Stand-in model latency per request (s).")
+    parser.add_argument("--bandwidth-mbps", type=float, default=20.0, help="Simulated upload bandwidth (Mbit/s).")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent requests for the pipeline case.")
+    parser.add_argument("--rpm", type=int, default=600, help="Rate limit for the pipeline case (requests/min).")
+    args = parser.parse_args()
+
+    StandInGeminiHandler.latency = args.latency
+    StandInGeminiHandler.bandwidth_bytes_per_s = args.bandwidth_mbps * 1e6 / 8
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInGeminiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    request_fn = make_request_fn(f"http://127.0.0.1:{server.server_address[1]}/generate")
+
+    work_dir = tempfile.mkdtemp(prefix="gemini_bench_")
+    try:
+        print(f"Generating {args.images} synthetic posters...")
+        image_paths = make_synthetic_posters(work_dir, args.images)
+        results = [
+            # Baseline mirrors the previous behaviour: one image at a time, full-resolution default JPEG.
+            run_case("sequential_fullres", image_paths, work_dir, request_fn, max_workers=1,
+                     requests_per_minute=0, max_side=None, quality=75),
+            run_case("concurrent_downscaled", image_paths, work_dir, request_fn, max_workers=args.workers,
+                     requests_per_minute=args.rpm),
+        ]
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{'case':<24} {'rows':>5} {'seconds':>8} {'img/min':>8} {'upload MB':>10}")
+    for r in results:
+        print(f"{r['label']:<24} {r['rows']:>5} {r['seconds']:>8.2f} {r['images_per_min']:>8.1f} {r['upload_mb']:>10.2f}")
+    base, opt = results
+    print(f"\nSpeedup: {base['seconds'] / opt['seconds']:.2f}x, "
+          f"upload reduced {100.0 * (1 - opt['upload_mb'] / base['upload_mb']):.0f}%")
+
+
+if __name__ == '__main__':
+    main()
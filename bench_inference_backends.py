@@ -0,0 +1,167 @@
+# bench_inference_backends.py
+# Compares the local inference backends (torch, onnx, onnx-int8) for the embedding model and the
+# cross-encoder: throughput at each batch size, and ranking agreement with the PyTorch reference.
+# Exits non-zero when a backend's rankings drift beyond the tolerances, so it can gate a backend switch.
+#
+#   python bench_inference_backends.py --threads 4 --batch-sizes 16,32,64,128
+#
+# Passages come from the crawl cache when it has enough pages, otherwise from a synthetic race-page corpus.
+
+import os
+import re
+import sys
+import glob
+import time
+import random
+import argparse
+
+import numpy as np
+
+from config import (
+    EMBEDDING_MODEL, CROSS_ENCODER_MODEL, CRAWL_CACHE_DIR, INFERENCE_THREADS, EMBEDDING_BATCH_SIZE,
+    CROSS_ENCODER_BATCH_SIZE
+)
+from inference_backend import BACKENDS, load_embedding_model, load_cross_encoder
+
+QUERIES = [
+    "registration fee entry cost for the race", "race start time flag off", "event date of the marathon",
+    "last date to register registration closes", "minimum age limit for participants", "cutoff time for the run",
+    "swim distance in the triathlon", "elevation gain of the trail course", "race venue city and location",
+    "organiser of the event", "course type road or trail and number of loops", "weather and temperature on race day",
+]
+SYNTHETIC_TEMPLATES = [
+    "The {city} {kind} will be held on {day} {month} 2026 with flag off at {hour}:{minute} AM.",
+    "Registration costs Rs. {fee} for the {dist} km category and closes on {day} {month}.",
+    "Participants must be {age} years or older on race day. The cutoff for the {dist} km is {cutoff} hours.",
+    "The course is a {loops}-loop {surface} route with about {gain} m of elevation gain.",
+    "Organised by the {city} Runners Club, the event includes timing chips, medals and refreshments.",
+    "Expect temperatures around {temp} degrees; hydration points are placed every 2.5 km.",
+    "The swim leg is {swim} m in open water followed by a {bike} km bike and a {dist} km run.",
+]
+
+
+def build_corpus(limit: int, seed: int) -> list[str]:
+    passages = []
+    for path in sorted(glob.glob(os.path.join(CRAWL_CACHE_DIR, "*.md"))):
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            passages += [p.strip() for p in re.split(r'\n\s*\n', f.read()) if 200 <= len(p.strip()) <= 1500]
+        if len(passages) >= limit: break
+    rng = random.Random(seed)
+    if len(passages) >= limit: return rng.sample(passages, limit)
+    print(f"INFO: Crawl cache has {len(passages)} usable passages; topping up with synthetic race pages.")
+    while len(passages) < limit:
+        values = {"city": rng.choice(["Pune", "Mumbai", "Goa", "Bengaluru", "Chennai"]),
+                  "kind": rng.choice(["Marathon", "Triathlon", "Trail Run", "Aquathlon"]),
+                  "day": rng.randint(1, 28), "month": rng.choice(["January", "March", "November", "December"]),
+                  "hour": rng.randint(4, 7), "minute": rng.choice(["00", "15", "30"]), "fee": rng.randint(5, 40) * 100,
+                  "dist": rng.choice([5, 10, 21.1, 42.2]), "age": rng.choice([12, 16, 18]), "cutoff": rng.randint(1, 7),
+                  "loops": rng.randint(1, 4), "surface": rng.choice(["road", "trail", "mixed"]),
+                  "gain": rng.randint(20, 2000), "temp": rng.randint(14, 34), "swim": rng.choice([750, 1500, 1900]),
+                  "bike": rng.choice([20, 40, 90])}
+        passages.append(" ".join(t.format(**values) for t in rng.sample(SYNTHETIC_TEMPLATES, rng.randint(2, 5))))
+    return passages
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def top_k_overlap(reference: np.ndarray, candidate: np.ndarray, k: int) -> float:
+    return len(set(np.argsort(-reference)[:k]) & set(np.argsort(-candidate)[:k])) / float(k)
+
+
+def spearman(a: np.ndarray, b: np.ndarray) -> float:
+    ranks_a, ranks_b = np.argsort(np.argsort(a)), np.argsort(np.argsort(b))
+    return float(np.corrcoef(ranks_a, ranks_b)[0, 1]) if len(a) > 1 else 1.0
+
+
+def run_backend(backend: str, passages: list[str], queries: list[str], candidates: list[list[int]],
+                batch_sizes: list[int], threads: int) -> dict:
+    print(f"\n--- {backend} ---")
+    encoder, load_s = timed(load_embedding_model, EMBEDDING_MODEL, backend, threads)
+    cross_encoder, ce_load_s = timed(load_cross_encoder, CROSS_ENCODER_MODEL, backend, threads)
+    encoder.encode(passages[:8], batch_size=8)  # Warm-up (allocations, graph optimization)
+    throughput, embeddings = {}, None
+    for batch_size in batch_sizes:
+        embeddings, seconds = timed(encoder.encode, passages, batch_size=batch_size, normalize_embeddings=True)
+        throughput[batch_size] = len(passages) / seconds
+        print(f"  embed  batch {batch_size:4d}: {throughput[batch_size]:8.1f} passages/s")
+    query_embeddings = np.asarray(encoder.encode(queries, batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True))
+    pairs = [(queries[q], passages[i]) for q, ids in enumerate(candidates) for i in ids]
+    cross_encoder.predict(pairs[:8], batch_size=8)
+    ce_scores, ce_seconds = timed(cross_encoder.predict, pairs, batch_size=CROSS_ENCODER_BATCH_SIZE)
+    print(f"  rerank batch {CROSS_ENCODER_BATCH_SIZE:4d}: {len(pairs) / ce_seconds:8.1f} pairs/s")
+    print(f"  load: embedding {load_s:.1f}s, cross-encoder {ce_load_s:.1f}s")
+    return {"embeddings": np.asarray(embeddings), "query_embeddings": query_embeddings,
+            "ce_scores": np.asarray(ce_scores).reshape(len(candidates), -1), "embed_throughput": throughput,
+            "rerank_throughput": len(pairs) / ce_seconds, "load_s": load_s + ce_load_s}
+
+
+def compare(reference: dict, result: dict, top_k: int) -> dict:
+    cosines = np.sum(reference["embeddings"] * result["embeddings"], axis=1)
+    retrieval, rerank, rank_corr = [], [], []
+    for q in range(len(reference["query_embeddings"])):
+        retrieval.append(top_k_overlap(reference["embeddings"] @ reference["query_embeddings"][q],
+                                       result["embeddings"] @ result["query_embeddings"][q], top_k))
+        rerank.append(top_k_overlap(reference["ce_scores"][q], result["ce_scores"][q], top_k))
+        rank_corr.append(spearman(reference["ce_scores"][q], result["ce_scores"][q]))
+    return {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean()),
+            "retrieval_overlap": float(np.mean(retrieval)), "rerank_overlap": float(np.mean(rerank)),
+            "rerank_spearman": float(np.mean(rank_corr))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and validate local inference backends")
+    parser.add_argument("--backends", type=str, default=",".join(BACKENDS))
+    parser.add_argument("--passages", type=int, default=512)
+    parser.add_argument("--candidates", type=int, default=50, help="Passages reranked per query.")
+    parser.add_argument("--batch-sizes", type=str, default="16,32,64,128")
+    parser.add_argument("--threads", type=int, default=INFERENCE_THREADS, help="Intra-op threads (0 = default).")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--min-overlap", type=float, default=0.8, help="Minimum mean top-k overlap with torch.")
+    parser.add_argument("--min-spearman", type=float, default=0.95, help="Minimum mean rerank rank correlation.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "torch" not in backends: backends.insert(0, "torch")  # The accuracy reference
+    passages = build_corpus(args.passages, args.seed)
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    # Candidate pools come from a lexical pre-ranking so every backend reranks exactly the same pairs.
+    rng = random.Random(args.seed)
+    candidates = []
+    for query in QUERIES:
+        terms = set(query.lower().split())
+        ranked = sorted(range(len(passages)), key=lambda i: (-len(terms & set(passages[i].lower().split())),
+                                                             rng.random()))
+        candidates.append(ranked[:args.candidates])
+    print(f"INFO: {len(passages)} passages, {len(QUERIES)} queries x {args.candidates} rerank candidates, "
+          f"threads={args.threads or 'default'}")
+    results = {b: run_backend(b, passages, QUERIES, candidates, batch_sizes, args.threads) for b in backends}
+
+    reference, failed = results["torch"], []
+    print("\n" + "=" * 110)
+    print(f"{'backend':<10} {'best embed/s':>13} {'@batch':>7} {'rerank/s':>9} {'speedup':>8} {'min cos':>8} "
+          f"{'retr@k':>7} {'rerank@k':>9} {'spearman':>9}  verdict")
+    for backend, result in results.items():
+        best_batch = max(result["embed_throughput"], key=result["embed_throughput"].get)
+        best = result["embed_throughput"][best_batch]
+        speedup = best / max(reference["embed_throughput"].values())
+        agreement = compare(reference, result, args.top_k)
+        ok = (agreement["retrieval_overlap"] >= args.min_overlap and agreement["rerank_overlap"] >= args.min_overlap
+              and agreement["rerank_spearman"] >= args.min_spearman)
+        if not ok: failed.append(backend)
+        print(f"{backend:<10} {best:13.1f} {best_batch:7d} {result['rerank_throughput']:9.1f} {speedup:7.2f}x "
+              f"{agreement['min_cosine']:8.4f} {agreement['retrieval_overlap']:7.2f} "
+              f"{agreement['rerank_overlap']:9.2f} {agreement['rerank_spearman']:9.3f}  "
+              f"{'OK' if ok else 'OUT OF TOLERANCE'}")
+    print("=" * 110)
+    if failed:
+        print(f"[ERROR] Rankings drifted beyond tolerance for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
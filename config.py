@@ -19,12 +19,20 @@ EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
 CROSS_ENCODER_MODEL = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
 SPACY_MODEL = 'en_core_web_sm'
 
+# --- External Endpoints (overridable so benchmarks can point the agent at local stand-ins) ---
+GOOGLE_SEARCH_ENDPOINT = os.getenv("GOOGLE_SEARCH_ENDPOINT", "https://www.googleapis.com/customsearch/v1")
+JINA_READER_ENDPOINT = os.getenv("JINA_READER_ENDPOINT", "https://r.jina.ai/")
+MISTRAL_ENDPOINT = os.getenv("MISTRAL_ENDPOINT")  # None keeps the client's default API endpoint
+
 # --- File & Execution Configuration (CLOUD-READY PATHS) ---
+# CRAWL4AI_DATA_DIR relocates all caches and outputs (e.g. to an isolated directory for benchmarks).
+DATA_DIR = os.getenv("CRAWL4AI_DATA_DIR", BASE_DIR)
 RACE_INPUT_FILE = "races.json" # This remains a temporary name
-OUTPUT_DIR = os.path.join(BASE_DIR, "outputs")
-CRAWL_CACHE_DIR = os.path.join(BASE_DIR, "crawl_cache")
-KNOWLEDGE_CACHE_DIR = os.path.join(BASE_DIR, "knowledge_cache")
-VECTOR_DB_PATH = os.path.join(BASE_DIR, "vector_db")
+OUTPUT_DIR = os.path.join(DATA_DIR, "outputs")
+CRAWL_CACHE_DIR = os.path.join(DATA_DIR, "crawl_cache")
+KNOWLEDGE_CACHE_DIR = os.path.join(DATA_DIR, "knowledge_cache")  # Legacy per-event JSON caches, imported into the store
+KNOWLEDGE_STORE_DB = os.path.join(DATA_DIR, "knowledge_store.sqlite3")
+VECTOR_DB_PATH = os.path.join(DATA_DIR, "vector_db")
 
 # --- Performance & Tuning Configuration ---
 TOP_N_URLS_TO_PROCESS = 3
@@ -34,6 +42,145 @@ DEBUG = True # Set to False in production for cleaner logs
 MAX_CONCURRENT_CRAWLERS = 5
 MIN_CONFIDENCE_THRESHOLD = 0.65
 
+# --- Local Inference Backend ---
+# "torch" (stock sentence-transformers), "onnx" (ONNX Runtime fp32) or "onnx-int8" (dynamic int8 quantization).
+# ONNX models are exported once into ONNX_MODEL_DIR. Compare backends with: python bench_inference_backends.py
+INFERENCE_BACKEND = os.getenv("CRAWL4AI_INFERENCE_BACKEND", "torch")
+INFERENCE_THREADS = int(os.getenv("CRAWL4AI_INFERENCE_THREADS", "0"))  # Intra-op threads; 0 = library default
+EMBEDDING_BATCH_SIZE = int(os.getenv("CRAWL4AI_EMBEDDING_BATCH_SIZE", "64"))
+CROSS_ENCODER_BATCH_SIZE = int(os.getenv("CRAWL4AI_CROSS_ENCODER_BATCH_SIZE", "32"))
+ONNX_MODEL_DIR = os.path.join(DATA_DIR, "onnx_models")
+
 # --- RAG & Re-ranking Configuration ---
 RAG_CANDIDATE_POOL_SIZE = 50
-RAG_FINAL_EVIDENCE_COUNT = 5
\ No newline at end of file
+RAG_FINAL_EVIDENCE_COUNT = 5
+# Entity types flagged on each indexed chunk (as 'has_<type>' metadata) for field-typed pre-filtering.
+INDEX_ENTITY_TYPES = ['DATE', 'MONEY', 'GPE', 'QUANTITY', 'TIME']
+NLP_BATCH_SIZE = 32
+
+# --- Retrieval Planner Configuration ---
+# The candidate pool scales with sqrt(corpus size) and is clamped to [MIN, RAG_CANDIDATE_POOL_SIZE].
+RAG_MIN_CANDIDATE_POOL_SIZE = 15
+RAG_POOL_SCALE = 2.5
+# Cross-encoder (ms-marco) logits below this mean the evidence is irrelevant; the LLM call is skipped.
+# Re-calibrate with: python evaluate_retrieval_planner.py --log <RAG_PLANNER_LOG_FILE>
+# RAG_SKIP_LLM_SCORE_THRESHOLD=none (or empty) in the environment disables the skip, e.g. to collect that log.
+_skip_threshold = os.getenv("RAG_SKIP_LLM_SCORE_THRESHOLD", "-7.0").strip()
+RAG_SKIP_LLM_SCORE_THRESHOLD = None if _skip_threshold.lower() in ("", "none") else float(_skip_threshold)
+RAG_EARLY_STOP_SCORE = 3.0
+RAG_RERANK_BATCH_SIZE = 10
+RAG_PLANNER_LOG_FILE = os.getenv("RAG_PLANNER_LOG_FILE")
+# Cascade rerank: fused candidates are first ranked by a cheap prefilter score (bi-encoder similarity, BM25 and
+# RRF, each min-max normalized per query) and only an adaptive top slice is sent to the cross-encoder.
+# Check top-k agreement with the full rerank with: python evaluate_rerank_cascade.py --log <audit log>
+RAG_RERANK_CASCADE = True
+RAG_CASCADE_WEIGHTS = {"dense": 0.6, "bm25": 0.25, "fused": 0.15}
+RAG_CASCADE_MIN_SLICE = 10
+RAG_CASCADE_MAX_SLICE = 25
+RAG_CASCADE_PREFILTER_MARGIN = 0.2  # Candidates within this prefilter score of the k-th best join the slice
+RAG_CASCADE_DECISIVE_MARGIN = 4.0  # Stop when a whole batch scores this far (in logits) below the k-th best
+RAG_CASCADE_AUDIT_LOG = os.getenv("RAG_CASCADE_AUDIT_LOG")  # Also runs the full rerank and logs both
+# Evidence in each extraction prompt is cut to the sentences most similar to the field query, within this budget.
+RAG_EVIDENCE_TOKEN_BUDGET = 700  # Estimated tokens; 0 disables compression
+RAG_MIN_SENTENCES_PER_SNIPPET = 1  # Reserved per snippet (from an equal share of the budget) before the rest
+
+# --- Rule Extractor Configuration ---
+# Deterministic regex/spaCy answers for dates, times, costs, ages, cutoffs and distances skip the LLM call.
+RULE_EXTRACTOR_ENABLED = True
+RULE_EXTRACTOR_CONFIDENCE = 0.9
+
+# --- Job Queue Configuration ---
+# Runs submitted from the UI are queued here and picked up by long-lived workers (python worker.py --kind ...).
+# API keys submitted with a job are passed to its worker through a 0600 file under job_secrets/ next to the database.
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", os.path.join(DATA_DIR, "job_queue.sqlite3"))
+JOB_WORKERS = {"mistral": 1, "gemini": 2}  # Warm workers the UI keeps alive per job kind
+WORKER_HEARTBEAT_SECONDS = 5
+WORKER_POLL_SECONDS = 2
+
+# --- Gemini Pipeline Configuration ---
+# Poster extraction runs as a bounded concurrent pipeline under a per-minute request limit; images are
+# downscaled and re-encoded before upload.
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+GEMINI_MAX_IMAGE_SIDE = 1600  # Longest side after downscaling; text stays legible for the model
+GEMINI_JPEG_QUALITY = 85
+
+# --- Metrics Configuration ---
+# Each run writes <run>.json and <run>.prom (p50/p95 per stage, counters, per-mission breakdown) here.
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(DATA_DIR, "metrics"))
+
+# --- Profiling Configuration ---
+# Opt-in (CRAWL4AI_PROFILE=1 or main.py --profile): each mission is sampled and written as a
+# collapsed-stack (.folded) and speedscope (.speedscope.json) file, with a hotspot summary per run.
+PROFILE_ENABLED = os.getenv("CRAWL4AI_PROFILE", "0") == "1"
+PROFILE_DIR = os.getenv("CRAWL4AI_PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILE_INTERVAL_MS = float(os.getenv("CRAWL4AI_PROFILE_INTERVAL_MS", "5"))
+PROFILE_TOP_N = 20
+
+# --- Mission Scheduler Configuration ---
+# Missions run in global (Priority, Deadline) order. Priority <= HIGH_PRIORITY_CUTOFF (or a Deadline within
+# URGENT_DAYS) is protected: lower-priority missions are deferred rather than spend the budget it needs.
+SCHEDULER_HIGH_PRIORITY_CUTOFF = 2
+SCHEDULER_DEADLINE_URGENT_DAYS = 14
+SCHEDULER_MAX_PAUSE_SECONDS = 900
+# Per-run budget; 0 means unlimited.
+RUN_BUDGET = {"llm_calls": int(os.getenv("RUN_BUDGET_LLM_CALLS", "0")),
+              "search_calls": int(os.getenv("RUN_BUDGET_SEARCH_CALLS", "0")),
+              "crawl_fetches": int(os.getenv("RUN_BUDGET_CRAWL_FETCHES", "0"))}
+MISSION_COST_PRIOR = {"llm_calls": 80, "search_calls": 1, "crawl_fetches": 3}  # Until real missions are observed
+LLM_CALLS_PER_HOUR = int(os.getenv("LLM_CALLS_PER_HOUR", "0"))  # Rate capacity; 0 means unlimited
+
+# --- Sharded Execution Configuration ---
+# `python shard_runner.py run --processes N` (or `work` on several machines sharing CRAWL4AI_DATA_DIR) splits a
+# race list across processes that claim missions from a SQLite manifest and merge per-type CSVs at the end.
+SHARD_MANIFEST_DB = os.getenv("SHARD_MANIFEST_DB", os.path.join(DATA_DIR, "shard_manifest.sqlite3"))
+SHARD_PARTS_DIR = os.path.join(DATA_DIR, "shard_parts")
+SHARD_LEASE_SECONDS = 600  # A claimed mission whose worker stops renewing it is re-claimed after this long
+SHARD_HEARTBEAT_SECONDS = 30
+SHARD_MAX_ATTEMPTS = 3
+
+# --- URL Ranker Configuration ---
+# A local logistic ranker (search rank, event-name match, per-domain reputation learned from past missions) picks
+# the URLs to crawl without an LLM call when the choice is clear; ambiguous result lists still go to the LLM.
+URL_RANKER_ENABLED = True
+URL_REPUTATION_DB = os.getenv("URL_REPUTATION_DB", os.path.join(DATA_DIR, "url_reputation.sqlite3"))
+URL_RANKER_MIN_TRAINING = 30  # Labelled URLs the model must have learned from before it may decide alone
+URL_RANKER_PRIMARY_PROB = 0.8  # The top URL must be at least this likely to yield high-confidence fields
+URL_RANKER_SECONDARY_PROB = 0.5
+URL_RANKER_MARGIN = 0.15  # The best rejected URL must score this far below the last selected one
+URL_RANKER_LEARNING_RATE = 0.05
+
+# --- Fetch Planner Configuration ---
+# Pages are fetched through the Jina reader or directly (readability). Per-host latency/success history decides
+# which path goes first; the other path is started as a hedge once the first has run past its usual latency.
+FETCH_HISTORY_DB = os.getenv("FETCH_HISTORY_DB", os.path.join(DATA_DIR, "fetch_history.sqlite3"))
+FETCH_TIMEOUT_SECONDS = 30
+FETCH_HEDGE_PERCENTILE = 0.9  # Hedge once the first path runs past this latency percentile for the host
+FETCH_HEDGE_DEFAULT_DELAY = 5.0  # Used until a host (or the strategy overall) has enough history
+FETCH_HEDGE_MIN_DELAY, FETCH_HEDGE_MAX_DELAY = 0.5, 15.0
+FETCH_REORDER_MARGIN = 0.15  # Put another strategy first only if its expected cost is at least 15% lower
+FETCH_HISTORY_WINDOW = 50  # Latest latencies kept per host and strategy
+
+# --- Resilience Configuration ---
+# Each remote dependency has a circuit breaker and a retry policy (resilience.py). A circuit opens after
+# BREAKER_FAILURE_THRESHOLD consecutive dependency failures (429/5xx/timeouts, not other 4xx); calls then fail
+# fast until a probe is let through after the recovery time, which doubles after every failed probe.
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RECOVERY_SECONDS = 60
+BREAKER_MAX_RECOVERY_SECONDS = 900
+# "critical" dependencies are ones a mission cannot do without: the runners pause or defer missions while their
+# circuits are open. Jina is not critical, the fetch planner falls through to a direct fetch while it is down.
+RETRY_POLICIES = {"mistral": {"attempts": MAX_RETRIES, "base_delay": 2.0, "max_delay": 30.0, "critical": True},
+                  "google_search": {"attempts": MAX_RETRIES, "base_delay": 1.0, "max_delay": 15.0, "critical": True},
+                  "jina": {"attempts": 1, "critical": False}}  # The hedge to a direct fetch is Jina's retry
+RETRY_BUDGET_RATIO = 0.2  # Retries per dependency may add at most 20% on top of first attempts (per minute)
+RETRY_BUDGET_MIN = 3  # ...plus this many, so quiet dependencies can still retry
+
+# --- Download Limits ---
+# Page downloads are streamed: non-text content is abandoned after its headers or first bytes, and bodies are
+# cut off at CRAWL_MAX_BYTES, which bounds the memory (and chunk count) of every crawler slot.
+CRAWL_MAX_BYTES = int(os.getenv("CRAWL_MAX_BYTES", str(2 * 1024 * 1024)))
+CRAWL_CHUNK_BYTES = 64 * 1024
+CRAWL_TEXT_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "text/markdown", "text/x-markdown")
+CRAWL_SKIPPED_EXTENSIONS = (".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".zip", ".rar", ".gz",
+                            ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".mp3", ".mp4", ".mov", ".avi")
@@ -0,0 +1,98 @@
+# evaluate_rerank_cascade.py
+# Offline harness: replays a rerank audit log and measures how often the cascade rerank returns the same
+# top-k evidence as the full cross-encoder rerank, and how many cross-encoder pairs it saves.
+#
+# Produce a log by running the agent with auditing on (every field is also fully reranked and logged):
+#   RAG_CASCADE_AUDIT_LOG=rerank_audit.jsonl python main.py
+# then evaluate the configured cascade, or sweep the slice bound, with:
+#   python evaluate_rerank_cascade.py --log rerank_audit.jsonl --max-slices 10,15,20,25,35
+
+import json
+import argparse
+
+from config import (
+    RAG_CASCADE_MIN_SLICE, RAG_CASCADE_MAX_SLICE, RAG_CASCADE_PREFILTER_MARGIN, RAG_CASCADE_DECISIVE_MARGIN
+)
+from retrieval_planner import RetrievalPlanner
+
+
+def load_records(log_path: str) -> list[dict]:
+    records = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry.get("candidates"): records.append(entry)
+    return records
+
+
+def replay(record: dict, planner: RetrievalPlanner) -> tuple[float, int]:
+    """Returns (top-k overlap with the full rerank, cross-encoder pairs scored) for one logged field."""
+    evidence = [{**c, "snippet": str(i)} for i, c in enumerate(record["candidates"])]
+    full_scores = {str(i): c["rerank_score"] for i, c in enumerate(record["candidates"])}
+    calls = []
+
+    def score_fn(pairs):
+        calls.append(len(pairs))
+        return [full_scores[snippet] for _, snippet in pairs]
+
+    k = min(record.get("final_count", planner.final_count), len(evidence))
+    full_top = {e["snippet"] for e in sorted(evidence, key=lambda e: e["rerank_score"], reverse=True)[:k]}
+    cascade_top = {e["snippet"] for e in planner.cascade_rerank(score_fn, record.get("query", ""), evidence)[:k]}
+    return len(full_top & cascade_top) / float(k) if k else 1.0, sum(calls)
+
+
+def evaluate(records: list[dict], **planner_kwargs) -> dict:
+    planner = RetrievalPlanner(log_file=None, audit_log_file=None, **planner_kwargs)
+    overlaps, pairs, total = [], 0, 0
+    for record in records:
+        overlap, scored = replay(record, planner)
+        overlaps.append(overlap)
+        pairs += scored
+        total += len(record["candidates"])
+    return {"max_slice": planner.max_slice, "fields": len(records),
+            "mean_overlap": sum(overlaps) / len(overlaps) if overlaps else 1.0,
+            "exact_pct": 100.0 * sum(1 for o in overlaps if o == 1.0) / len(overlaps) if overlaps else 100.0,
+            "pairs_scored": pairs, "pairs_full": total,
+            "pairs_saved_pct": 100.0 * (1 - pairs / total) if total else 0.0, **planner.stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the cascade rerank against the full cross-encoder rerank.")
+    parser.add_argument("--log", type=str, required=True, help="Path to a RAG_CASCADE_AUDIT_LOG JSONL log.")
+    parser.add_argument("--max-slices", type=str, default=str(RAG_CASCADE_MAX_SLICE),
+                        help="Comma-separated max slice sizes to compare.")
+    parser.add_argument("--min-slice", type=int, default=RAG_CASCADE_MIN_SLICE)
+    parser.add_argument("--prefilter-margin", type=float, default=RAG_CASCADE_PREFILTER_MARGIN)
+    parser.add_argument("--decisive-margin", type=float, default=RAG_CASCADE_DECISIVE_MARGIN)
+    parser.add_argument("--min-overlap", type=float, default=0.95,
+                        help="Smallest acceptable mean top-k overlap for the recommendation.")
+    args = parser.parse_args()
+
+    records = load_records(args.log)
+    if not records:
+        print(f"[ERROR] No audited rerank records found in '{args.log}'.")
+        return
+    results = [evaluate(records, min_slice=args.min_slice, max_slice=int(m), prefilter_margin=args.prefilter_margin,
+                        decisive_margin=args.decisive_margin) for m in args.max_slices.split(",")]
+    print(f"Replayed {len(records)} reranked fields.\n")
+    print(f"{'max_slice':>10} {'overlap':>8} {'exact%':>8} {'pairs':>8} {'full':>8} {'saved%':>8} {'early':>6} "
+          f"{'decisive':>9}")
+    for r in results:
+        print(f"{r['max_slice']:>10} {r['mean_overlap']:>8.3f} {r['exact_pct']:>8.1f} {r['pairs_scored']:>8} "
+              f"{r['pairs_full']:>8} {r['pairs_saved_pct']:>8.1f} {r['early_stops']:>6} {r['decisive_stops']:>9}")
+    acceptable = [r for r in results if r["mean_overlap"] >= args.min_overlap]
+    if acceptable:
+        best = max(acceptable, key=lambda r: r["pairs_saved_pct"])
+        print(f"\nRecommended RAG_CASCADE_MAX_SLICE (>= {args.min_overlap:.2f} top-k overlap): {best['max_slice']} "
+              f"-> saves {best['pairs_saved_pct']:.1f}% of cross-encoder pairs.")
+    else:
+        print(f"\nNo slice size keeps the top-k overlap at or above {args.min_overlap:.2f}.")
+
+
+if __name__ == '__main__':
+    main()
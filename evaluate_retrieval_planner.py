@@ -0,0 +1,111 @@
+# evaluate_retrieval_planner.py
+# Offline harness: replays a retrieval planner log and measures LLM calls saved against field fill rate.
+#
+# Produce a log by running the agent with the skip disabled (so every field's LLM outcome is observed), e.g.
+#   RAG_SKIP_LLM_SCORE_THRESHOLD=none RAG_PLANNER_LOG_FILE=planner_log.jsonl python main.py
+# then sweep thresholds with the configured threshold (not "none") as the reference:
+#   python evaluate_retrieval_planner.py --log planner_log.jsonl
+
+import json
+import argparse
+
+from config import RAG_SKIP_LLM_SCORE_THRESHOLD
+
+
+def load_records(log_path: str) -> list[dict]:
+    records = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Only fields that reached the LLM carry a ground-truth outcome.
+            if entry.get("llm_called") and entry.get("top_score") is not None:
+                records.append(entry)
+    return records
+
+
+def evaluate_threshold(records: list[dict], threshold: float) -> dict:
+    total = len(records)
+    filled_total = sum(1 for r in records if r.get("filled"))
+    skipped = [r for r in records if r["top_score"] < threshold]
+    lost = sum(1 for r in skipped if r.get("filled"))
+    kept_fills = filled_total - lost
+    return {
+        "threshold": threshold,
+        "calls": total,
+        "calls_saved": len(skipped),
+        "calls_saved_pct": 100.0 * len(skipped) / total if total else 0.0,
+        "fill_rate_pct": 100.0 * kept_fills / total if total else 0.0,
+        "baseline_fill_rate_pct": 100.0 * filled_total / total if total else 0.0,
+        "fills_lost": lost,
+        "fills_lost_pct": 100.0 * lost / filled_total if filled_total else 0.0,
+    }
+
+
+def sweep(records: list[dict], start: float, stop: float, step: float) -> list[dict]:
+    results, t = [], start
+    while t <= stop + 1e-9:
+        results.append(evaluate_threshold(records, round(t, 4)))
+        t += step
+    return results
+
+
+def recommend_threshold(results: list[dict], max_fill_loss_pct: float) -> dict | None:
+    acceptable = [r for r in results if r["fills_lost_pct"] <= max_fill_loss_pct]
+    return max(acceptable, key=lambda r: r["threshold"]) if acceptable else None
+
+
+def print_table(results: list[dict]):
+    print(f"{'threshold':>10} {'saved':>8} {'saved%':>8} {'fill%':>8} {'lost':>6} {'lost%':>8}")
+    for r in results:
+        print(f"{r['threshold']:>10.2f} {r['calls_saved']:>8} {r['calls_saved_pct']:>8.1f} "
+              f"{r['fill_rate_pct']:>8.1f} {r['fills_lost']:>6} {r['fills_lost_pct']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate LLM-skip thresholds for the retrieval planner.")
+    parser.add_argument("--log", type=str, required=True, help="Path to a RAG_PLANNER_LOG_FILE JSONL log.")
+    parser.add_argument("--start", type=float, default=-11.0, help="Lowest threshold to test.")
+    parser.add_argument("--stop", type=float, default=4.0, help="Highest threshold to test.")
+    parser.add_argument("--step", type=float, default=0.5, help="Threshold increment.")
+    parser.add_argument("--max-fill-loss", type=float, default=1.0,
+                        help="Largest acceptable loss of filled fields (in percent) for the recommendation.")
+    parser.add_argument("--by-field", action="store_true", help="Also report the current threshold per field.")
+    args = parser.parse_args()
+
+    records = load_records(args.log)
+    if not records:
+        print(f"[ERROR] No LLM-called records found in '{args.log}'.")
+        return
+    results = sweep(records, args.start, args.stop, args.step)
+    print(f"Replayed {len(records)} LLM calls "
+          f"(baseline fill rate {results[0]['baseline_fill_rate_pct']:.1f}%).\n")
+    print_table(results)
+
+    if RAG_SKIP_LLM_SCORE_THRESHOLD is not None:
+        current = evaluate_threshold(records, RAG_SKIP_LLM_SCORE_THRESHOLD)
+        print(f"\nCurrent threshold {RAG_SKIP_LLM_SCORE_THRESHOLD:.2f}: saves {current['calls_saved_pct']:.1f}% "
+              f"of calls, loses {current['fills_lost_pct']:.1f}% of filled fields.")
+    best = recommend_threshold(results, args.max_fill_loss)
+    if best:
+        print(f"Recommended threshold (<= {args.max_fill_loss:.1f}% fill loss): {best['threshold']:.2f} "
+              f"-> saves {best['calls_saved_pct']:.1f}% of calls.")
+    else:
+        print(f"No threshold in range keeps fill loss under {args.max_fill_loss:.1f}%.")
+
+    if args.by_field and RAG_SKIP_LLM_SCORE_THRESHOLD is not None:
+        print("\nPer-field impact at the current threshold:")
+        by_field = {}
+        for r in records: by_field.setdefault(r["field"], []).append(r)
+        for field_name, field_records in sorted(by_field.items()):
+            res = evaluate_threshold(field_records, RAG_SKIP_LLM_SCORE_THRESHOLD)
+            print(f"  {field_name:<24} calls={res['calls']:<5} saved={res['calls_saved']:<5} "
+                  f"lost_fills={res['fills_lost']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# evidence_compressor.py
+# This file trims reranked evidence down to the sentences most similar to the field query, so each RAG
+# prompt fits a token budget. Sentence embeddings are cached per chunk for the whole mission, since the
+# same chunks come back for many fields.
+
+import re
+
+import numpy as np
+
+from config import RAG_EVIDENCE_TOKEN_BUDGET, RAG_MIN_SENTENCES_PER_SNIPPET, EMBEDDING_BATCH_SIZE
+
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])(?<![Rr]s\.)\s+|\n+')
+CHARS_PER_TOKEN = 4.0  # Conservative estimate for English/markdown text with Mistral's tokenizer
+MAX_SENTENCE_CHARS = 600  # Run-on "sentences" (unpunctuated lists, scraped tables) are cut into windows
+GAP_MARKER = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1 if text else 0
+
+
+def _truncate(sentence: str, max_tokens: float) -> str:
+    """Cuts a sentence at a word boundary so it (plus the gap marker) fits `max_tokens`."""
+    if estimate_tokens(sentence) <= max_tokens: return sentence
+    limit = max(1, int((max_tokens - 1) * CHARS_PER_TOKEN) - len(GAP_MARKER))
+    cut = sentence.rfind(" ", 0, limit)
+    return sentence[:cut if cut > 0 else limit].rstrip() + GAP_MARKER
+
+
+def split_sentences(text: str) -> list[str]:
+    sentences = []
+    for sentence in SENTENCE_SPLIT.split(text):
+        sentence = sentence.strip() if sentence else ""
+        while len(sentence) > MAX_SENTENCE_CHARS:
+            cut = sentence.rfind(" ", 0, MAX_SENTENCE_CHARS)
+            cut = cut if cut > 0 else MAX_SENTENCE_CHARS
+            sentences.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence: sentences.append(sentence)
+    return sentences
+
+
+class EvidenceCompressor:
+    def __init__(self, embedding_model, token_budget=RAG_EVIDENCE_TOKEN_BUDGET,
+                 min_sentences=RAG_MIN_SENTENCES_PER_SNIPPET):
+        self.embedding_model = embedding_model
+        self.token_budget, self.min_sentences = token_budget, min_sentences
+        self.sentence_cache = {}  # snippet id -> (sentences, normalized embeddings)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.sentence_cache.clear()
+        self.stats = {"prompts": 0, "compressed": 0, "tokens_in": 0, "tokens_out": 0}
+
+    def _sentences(self, evidence: list[dict]) -> list[tuple[list[str], np.ndarray]]:
+        """Splits and embeds (in one batch) every snippet not seen before in this mission."""
+        missing = [e for e in evidence if (e.get('id') or e['snippet']) not in self.sentence_cache]
+        pending = []
+        for e in missing:
+            pending.append((e.get('id') or e['snippet'], split_sentences(e['snippet']) or [e['snippet']]))
+        if pending:
+            flat = [s for _, sentences in pending for s in sentences]
+            embeddings = np.asarray(self.embedding_model.encode(flat, batch_size=EMBEDDING_BATCH_SIZE,
+                                                                normalize_embeddings=True))
+            offset = 0
+            for key, sentences in pending:
+                self.sentence_cache[key] = (sentences, embeddings[offset:offset + len(sentences)])
+                offset += len(sentences)
+        return [self.sentence_cache[e.get('id') or e['snippet']] for e in evidence]
+
+    def compress(self, query: str, evidence: list[dict]) -> list[str]:
+        """
+        Returns one (possibly shortened) snippet text per evidence item, in rerank order; only items whose every
+        sentence already appeared in an earlier item are dropped.
+        Each snippet first gets its best `min_sentences` (by similarity to the query) out of an equal share of
+        the token budget, cut short if a sentence alone is larger than that share. The rest of the budget then
+        goes greedily to the most similar remaining sentences. Kept sentences stay in their original order.
+        """
+        snippets = [e['snippet'] for e in evidence]
+        tokens_in = sum(estimate_tokens(s) for s in snippets)
+        self.stats["prompts"] += 1
+        self.stats["tokens_in"] += tokens_in
+        if not self.token_budget or tokens_in <= self.token_budget:
+            self.stats["tokens_out"] += tokens_in
+            return snippets
+        query_embedding = np.asarray(self.embedding_model.encode([query], normalize_embeddings=True))[0]
+        per_snippet = self._sentences(evidence)
+        selected = [{} for _ in evidence]  # snippet -> {sentence index: kept text}
+        used, seen, share = 0, set(), self.token_budget / len(evidence)
+        scored = []
+        for i, (sentences, embeddings) in enumerate(per_snippet):
+            scores = embeddings @ query_embedding
+            ranked = [int(j) for j in np.argsort(scores)[::-1]]
+            scored.append((scores, ranked))
+            # Guaranteed pass, reserved before anything competes, so no snippet the reranker chose is dropped.
+            room = share
+            for j in ranked:
+                if len(selected[i]) >= self.min_sentences or room < 2: break
+                if sentences[j].lower() in seen: continue  # Boilerplate repeats across pages
+                text = _truncate(sentences[j], room)
+                selected[i][j] = text
+                seen.add(sentences[j].lower())
+                room -= estimate_tokens(text)
+                used += estimate_tokens(text)
+        candidates = [(-float(scores[j]), i, j) for i, (scores, ranked) in enumerate(scored)
+                      for j in ranked if j not in selected[i]]
+        for _, i, j in sorted(candidates):
+            sentence = per_snippet[i][0][j]
+            cost, key = estimate_tokens(sentence), sentence.lower()
+            if key in seen or used + cost > self.token_budget: continue
+            selected[i][j] = sentence
+            seen.add(key)
+            used += cost
+        compressed = []
+        for (sentences, _), keep in zip(per_snippet, selected):
+            if not keep: continue
+            parts, previous = [], None
+            for j in sorted(keep):
+                if previous is not None and j != previous + 1: parts.append(GAP_MARKER)
+                parts.append(keep[j])
+                previous = j
+            compressed.append(" ".join(parts))
+        self.stats["compressed"] += 1
+        self.stats["tokens_out"] += sum(estimate_tokens(s) for s in compressed)
+        return compressed
+
+    def summary(self) -> str:
+        s = self.stats
+        saved = 100.0 * (1 - s["tokens_out"] / s["tokens_in"]) if s["tokens_in"] else 0.0
+        return (f"{s['compressed']}/{s['prompts']} prompts compressed, ~{s['tokens_out']}/{s['tokens_in']} evidence "
+                f"tokens sent ({saved:.0f}% saved)")
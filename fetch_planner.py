@@ -0,0 +1,174 @@
+# fetch_planner.py
+# This file chooses how each page is fetched. Latency and success are recorded per host and strategy (e.g. the
+# Jina reader vs. a direct fetch) in SQLite; the strategy with the lower expected cost goes first, and the other
+# is started as a hedge once the first has run past its usual latency (a percentile of its history) or failed.
+# Whichever returns content first wins; the loser finishes in the background and still feeds the history.
+
+import json
+import math
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
+from config import (
+    FETCH_TIMEOUT_SECONDS, FETCH_HEDGE_PERCENTILE, FETCH_HEDGE_DEFAULT_DELAY, FETCH_HEDGE_MIN_DELAY,
+    FETCH_HEDGE_MAX_DELAY, FETCH_HISTORY_WINDOW, FETCH_REORDER_MARGIN, MAX_CONCURRENT_CRAWLERS
+)
+from metrics import metrics
+from resilience import CircuitOpenError
+from url_ranker import domain_of
+
+MIN_SAMPLES = 3  # Latencies needed before a host's (or a strategy's) history is trusted
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered), math.ceil(q * len(ordered))) - 1)]
+
+
+class FetchHistory:
+    def __init__(self, db_path: str, window: int = FETCH_HISTORY_WINDOW):
+        self.db_path, self.window = db_path, window
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS fetch_stats (host TEXT NOT NULL, strategy TEXT NOT NULL, "
+                         "attempts INTEGER NOT NULL DEFAULT 0, successes INTEGER NOT NULL DEFAULT 0, "
+                         "latencies TEXT NOT NULL DEFAULT '[]', updated_at REAL, PRIMARY KEY (host, strategy))")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self, host: str, strategy: str) -> dict:
+        """Read from the database every time: other runner processes may share it (one indexed row)."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT attempts, successes, latencies FROM fetch_stats WHERE host = ? AND strategy = ?",
+                               (host, strategy)).fetchone()
+        if row is None: return {"attempts": 0, "successes": 0, "latencies": []}
+        return {"attempts": row["attempts"], "successes": row["successes"], "latencies": json.loads(row["latencies"])}
+
+    def strategy_latencies(self, strategy: str, limit: int = 200) -> list[float]:
+        """Recent successful latencies of a strategy across all hosts, for hosts without their own history."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT latencies FROM fetch_stats WHERE strategy = ? ORDER BY updated_at DESC "
+                                "LIMIT 20", (strategy,)).fetchall()
+        return [latency for row in rows for latency in json.loads(row["latencies"])][:limit]
+
+    def record(self, host: str, strategy: str, ok: bool, seconds: float):
+        """Increments in place inside one write transaction, so concurrent runner processes never lose updates."""
+        try:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("INSERT INTO fetch_stats (host, strategy, attempts, successes, updated_at) VALUES "
+                             "(?, ?, 1, ?, ?) ON CONFLICT(host, strategy) DO UPDATE SET attempts = attempts + 1, "
+                             "successes = successes + excluded.successes, updated_at = excluded.updated_at",
+                             (host, strategy, int(ok), time.time()))
+                if ok:
+                    row = conn.execute("SELECT latencies FROM fetch_stats WHERE host = ? AND strategy = ?",
+                                       (host, strategy)).fetchone()
+                    latencies = (json.loads(row["latencies"]) + [round(seconds, 3)])[-self.window:]
+                    conn.execute("UPDATE fetch_stats SET latencies = ? WHERE host = ? AND strategy = ?",
+                                 (json.dumps(latencies), host, strategy))
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"  - WARNING: Could not persist fetch history for {host}: {e}")
+
+
+class FetchPlanner:
+    def __init__(self, history: FetchHistory, timeout=FETCH_TIMEOUT_SECONDS, percentile=FETCH_HEDGE_PERCENTILE,
+                 default_delay=FETCH_HEDGE_DEFAULT_DELAY, min_delay=FETCH_HEDGE_MIN_DELAY,
+                 max_delay=FETCH_HEDGE_MAX_DELAY, reorder_margin=FETCH_REORDER_MARGIN,
+                 max_workers=4 * MAX_CONCURRENT_CRAWLERS):
+        self.history, self.timeout, self.percentile, self.reorder_margin = history, timeout, percentile, reorder_margin
+        self.default_delay, self.min_delay, self.max_delay = default_delay, min_delay, max_delay
+        # Room for hedge losers that are still finishing in the background, so new fetches never queue behind them.
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+
+    def estimate(self, host: str, strategy: str) -> tuple[float, float] | None:
+        """(median latency, smoothed success rate) of a strategy on a host, or None with too little history."""
+        stats = self.history.stats(host, strategy)
+        if stats["attempts"] < MIN_SAMPLES: return None
+        # A host that has only failed so far borrows the strategy's latency elsewhere rather than the full timeout,
+        # which would shut it out of first place for good after one early failure.
+        latencies = stats["latencies"] or self.history.strategy_latencies(strategy)
+        median = _percentile(latencies, 0.5) if latencies else self.timeout
+        return median, (stats["successes"] + 1.0) / (stats["attempts"] + 2.0)
+
+    @staticmethod
+    def expected_cost(estimates: list[tuple[float, float]]) -> float:
+        """Expected seconds to content when strategies run in this order, each only after the previous failed."""
+        cost, reach = 0.0, 1.0
+        for median, success in estimates:
+            cost += reach * median
+            reach *= 1.0 - success
+        return cost
+
+    def order(self, host: str, strategies: list[str]) -> list[str]:
+        """
+        Strategies by median latency over success rate (the cheapest order for sequential fallback), but only when
+        that is clearly cheaper than the given (prior) order. A flaky-but-fast first path that costs about as much
+        as the alternative keeps its place: it wins the median case, and its failures fall through at once.
+        """
+        estimates = {s: self.estimate(host, s) for s in strategies}
+        if any(e is None for e in estimates.values()): return list(strategies)
+        reordered = sorted(strategies, key=lambda s: estimates[s][0] / estimates[s][1])
+        prior_cost = self.expected_cost([estimates[s] for s in strategies])
+        if self.expected_cost([estimates[s] for s in reordered]) < (1.0 - self.reorder_margin) * prior_cost:
+            return reordered
+        return list(strategies)
+
+    def hedge_delay(self, host: str, strategy: str) -> float:
+        latencies = self.history.stats(host, strategy)["latencies"]
+        if len(latencies) < MIN_SAMPLES: latencies = self.history.strategy_latencies(strategy)
+        delay = _percentile(latencies, self.percentile) if len(latencies) >= MIN_SAMPLES else self.default_delay
+        return max(self.min_delay, min(self.max_delay, delay))
+
+    def _attempt(self, fetcher, url: str, host: str, strategy: str) -> str | None:
+        start = time.perf_counter()
+        content = None
+        try:
+            with metrics.span(f"{strategy}_fetch"):
+                content = fetcher(url, self.timeout)
+        except CircuitOpenError:
+            # Skipped, not slow: leave the history alone and let the other strategy take over at once.
+            metrics.incr(f"{strategy}_fetch_circuit_open")
+            return None
+        except Exception as e:
+            metrics.incr(f"{strategy}_fetch_errors")
+            print(f"  - WARNING: {strategy} fetch failed for {url}: {e}")
+        self.history.record(host, strategy, bool(content), time.perf_counter() - start)
+        return content or None
+
+    def fetch(self, url: str, fetchers: dict) -> tuple[str | None, str | None]:
+        """
+        `fetchers` maps strategy names to fn(url, timeout) -> text or None, in prior order.
+        Returns (content, winning strategy), or (None, None) if every strategy failed.
+        """
+        host = domain_of(url)
+        queue = self.order(host, list(fetchers))
+        first = queue.pop(0)
+        futures = {self.executor.submit(self._attempt, fetchers[first], url, host, first): first}
+        deadline = time.perf_counter() + self.hedge_delay(host, first)
+        pending = set(futures)
+        while pending:
+            timeout = max(0.0, deadline - time.perf_counter()) if queue else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if content := future.result():
+                    if futures[future] != first: metrics.incr("crawl_hedge_wins")
+                    return content, futures[future]
+            if queue and (not pending or time.perf_counter() >= deadline):
+                # The first path failed (fallback) or is running slow for this host (hedge).
+                metrics.incr("crawl_hedges" if pending else "crawl_fallbacks")
+                strategy = queue.pop(0)
+                future = self.executor.submit(self._attempt, fetchers[strategy], url, host, strategy)
+                futures[future] = strategy
+                pending.add(future)
+                deadline = time.perf_counter() + self.hedge_delay(host, strategy)
+        return None, None
@@ -2,20 +2,33 @@
 import os
 import re
 import io
+import csv
 import json
+import time
 import datetime
-import pandas as pd
-import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PIL import Image
 from dotenv import load_dotenv
 import google.generativeai as genai
 from dateutil.parser import parse
+from config import (
+    OUTPUT_DIR, GEMINI_MAX_CONCURRENCY, GEMINI_REQUESTS_PER_MINUTE, GEMINI_MAX_IMAGE_SIDE, GEMINI_JPEG_QUALITY
+)
+from image_cache import ImageResultCache, content_hash, perceptual_hash
+from progress import reporter
 
 load_dotenv()
 DEFAULT_INPUT_FOLDER = 'input_folder'
 OUTPUT_CSV_FILENAME = 'event_data.csv'
 CACHE_FILE = 'processed_images.log'
+IMAGE_CACHE_DB = 'image_cache.sqlite3'  # Extracted rows keyed by content hash, with a perceptual-hash index
+PHASH_MAX_DISTANCE = 5  # Max dHash Hamming distance (of 64 bits) for two posters to count as the same
 ALLOWED_EXTENSIONS = ('.png', '.jpeg', '.jpg')
+GEMINI_MODEL_NAME = 'gemini-1.5-flash-latest'
+GEMINI_PROMPT = """
+        You are a highly intelligent data extraction assistant... [Your detailed Gemini prompt goes here]
+        """
 CSV_HEADERS = ['event', 'festivalName', 'imageURL', 'raceVideo', 'type', 'date', 'city', 'organiser','participationType', 'firstEdition', 'lastEdition', 'countEditions', 'mode', 'raceAccredition','theme', 'numberOfparticipants', 'startTime', 'scenic', 'registrationCost', 'ageLimitation','eventWebsite', 'organiserWebsite', 'bookingLink', 'newsCoverage', 'lastDate','participationCriteria', 'refundPolicy', 'swimDistance', 'swimType', 'swimmingLocation','waterTemperature', 'swimCoursetype', 'swimCutoff', 'swimRoutemap', 'cyclingDistance','cyclingElevation', 'cyclingSurface', 'cyclingElevationgain', 'cycleCoursetype', 'cycleCutoff','cyclingRoutemap', 'runningDistance', 'runningElevation', 'runningSurface', 'runningElevationgain','runningElevationloss', 'runningCoursetype', 'runCutoff', 'runRoutemap', 'organiserRating','triathlonType', 'standardTag', 'region', 'approvalStatus', 'difficultyLevel', 'month','primaryKey', 'latitude', 'longitude', 'country', 'editionYear', 'aidStations','restrictedTraffic', 'user_id', 'femaleParticpation', 'jellyFishRelated','registrationOpentag', 'eventConcludedtag', 'state', 'nextEdition']
 CHOICE_FIELDS = {"participationType": ["Individual", "Relay", "Group"], "mode": ["Virtual", "On-Ground"], "runningSurface": ["Road", "Trail", "Track", "Road + Trail"], "runningCourseType": ["Single Loop", "Multiple Loop", "Out and Back", "Point to Point"], "region": ["West India", "Central and East India", "North India", "South India", "Nepal", "Bhutan", "Sri Lanka"], "runningElevation": ["Flat", "Rolling", "Hilly", "Skyrunning"], "type": ["Triathlon", "Aquabike", "Aquathlon", "Duathlon", "Run", "Cycling", "Swimathon"], "swimType": ["Lake", "Beach", "River", "Pool"], "swimCoursetype": ["Single Loop", "Multiple Loops", "Out and Back", "Point to Point"], "cyclingElevation": ["Flat", "Rolling", "Hilly"], "cycleCoursetype": ["Single Loop", "Multiple Loops", "Out and Back", "Point to Point"], "triathlonType": ["Super Sprint", "Sprint Distance", "Olympic Distance", "Half Iron(70.3)", "Iron Distance (140.6)","Ultra Distance"], "standardTag": ["Standard", "Non Standard"], "restrictedTraffic": ["Yes", "No"], "jellyFishRelated": ["Yes", "No"], "approvalStatus": ["Approved", "Pending Approval"]}
 
@@ -70,80 +83,172 @@ def extract_age_limit(value_str):
     match = re.search(r'(\d+\+?)', cleaned_str)
     return match.group(1) if match else ""
 
-def get_gemini_response(image_path: str) -> dict:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key: raise ValueError("GEMINI_API_KEY not found in environment.")
+_model, _model_lock = None, threading.Lock()
+
+def get_gemini_model():
+    """Configures the Gemini client once per process and reuses the same GenerativeModel for every image."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key: raise ValueError("GEMINI_API_KEY not found in environment.")
+            genai.configure(api_key=api_key)
+            _model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return _model
+
+def reset_gemini_model():
+    """Drops the cached client so the next call re-reads GEMINI_API_KEY (used by long-lived workers)."""
+    global _model
+    with _model_lock: _model = None
+
+def encode_image(image_path: str, max_side=GEMINI_MAX_IMAGE_SIDE, quality=GEMINI_JPEG_QUALITY) -> bytes:
+    with Image.open(image_path) as img:
+        if max_side and img.format == 'JPEG': img.draft('RGB', (max_side, max_side))  # Decode JPEGs at reduced scale
+        if img.mode != 'RGB': img = img.convert('RGB')
+        if max_side: img.thumbnail((max_side, max_side), Image.LANCZOS)
+        img_byte_arr = io.BytesIO()
+        img.save(img_byte_arr, format='JPEG', quality=quality, optimize=True)
+        return img_byte_arr.getvalue()
+
+def parse_gemini_text(response_text: str) -> dict:
+    clean_response_text = re.sub(r'^```json\s*|\s*```$', '', response_text.strip(), flags=re.MULTILINE)
+    return json.loads(clean_response_text)
+
+def get_gemini_response(image_path: str, image_bytes: bytes = None) -> dict:
+    model = get_gemini_model()
     try:
-        genai.configure(api_key=api_key)
-        with Image.open(image_path) as img:
-            img_byte_arr = io.BytesIO()
-            if img.mode == 'RGBA': img = img.convert('RGB')
-            img.save(img_byte_arr, format='JPEG')
-            image_bytes = img_byte_arr.getvalue()
+        if image_bytes is None: image_bytes = encode_image(image_path)
         image_part = {"mime_type": "image/jpeg", "data": image_bytes}
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        prompt = """
-        You are a highly intelligent data extraction assistant... [Your detailed Gemini prompt goes here]
-        """
-        response = model.generate_content([prompt, image_part], request_options={"timeout": 120})
-        clean_response_text = re.sub(r'^```json\s*|\s*```$', '', response.text.strip(), flags=re.MULTILINE)
-        return json.loads(clean_response_text)
+        response = model.generate_content([GEMINI_PROMPT, image_part], request_options={"timeout": 120})
+        return parse_gemini_text(response.text)
     except Exception as e:
         print(f"  -> Error calling Gemini API for {os.path.basename(image_path)}: {e}")
         return {}
 
+class RateLimiter:
+    """Spaces request starts evenly so concurrent workers stay under a requests-per-minute cap."""
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.lock, self.next_slot = threading.Lock(), 0.0
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now: time.sleep(slot - now)
+
 def process_image_data(raw_data: dict) -> dict:
     processed_row = {header: "" for header in CSV_HEADERS}
     # ... [Data processing logic is unchanged and omitted for brevity] ...
     return processed_row
 
-def main(output_dir_override=None, input_dir_override=None):
+def run_image_pipeline(image_paths: list, output_path: str, request_fn=get_gemini_response, cache_file=CACHE_FILE,
+                       result_cache: ImageResultCache = None, max_workers=GEMINI_MAX_CONCURRENCY,
+                       requests_per_minute=GEMINI_REQUESTS_PER_MINUTE, max_side=GEMINI_MAX_IMAGE_SIDE,
+                       quality=GEMINI_JPEG_QUALITY, should_cancel=None) -> int:
+    """
+    Encodes and sends images concurrently under a rate limit, appending each row to the CSV (and the image
+    name to the processed log) as soon as it completes. With a result_cache, exact and near-duplicate
+    posters are answered locally without an API call. When `should_cancel()` turns true, images not yet
+    started are dropped and in-flight ones are left to finish. Returns the number of rows written.
+    """
+    limiter = RateLimiter(requests_per_minute)
+    sources = {}
+    def process(image_path):
+        reporter.emit("mission_started", name=os.path.basename(image_path))
+        image_name, sha256, phash = os.path.basename(image_path), content_hash(image_path), None
+        if result_cache:
+            if (cached := result_cache.get_exact(sha256)) is not None: return cached, sha256, "exact"
+            phash = perceptual_hash(image_path)
+            if near := result_cache.find_near_duplicate(phash):
+                result_cache.store(sha256, phash, near[0], image_name)
+                return near[0], sha256, "near"
+        with reporter.stage("encode_image", mission=image_name):
+            image_bytes = encode_image(image_path, max_side=max_side, quality=quality)
+        limiter.acquire()
+        with reporter.stage("gemini_request", mission=image_name):
+            raw_data = request_fn(image_path, image_bytes)
+        if raw_data and result_cache: result_cache.store(sha256, phash, raw_data, image_name)
+        return raw_data, sha256, "api"
+    write_header = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+    rows_written, cancelled = 0, False
+    with open(output_path, 'a', newline='', encoding='utf-8') as out_f, open(cache_file, 'a') as log_f, \
+            ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        writer = csv.DictWriter(out_f, fieldnames=CSV_HEADERS, extrasaction='ignore')
+        futures = {executor.submit(process, path): path for path in image_paths}
+        for future in as_completed(futures):
+            if should_cancel and not cancelled and should_cancel():
+                cancelled = True
+                print(f"INFO: Cancellation requested. Dropped {sum(f.cancel() for f in futures)} pending image(s).")
+            if future.cancelled(): continue
+            image_path = futures[future]
+            image_name = os.path.basename(image_path)
+            try:
+                raw_data, sha256, source = future.result()
+            except Exception as e:
+                print(f"  -> Error processing {image_name}: {e}")
+                raw_data, sha256, source = {}, None, "error"
+            sources[source] = sources.get(source, 0) + 1
+            if not raw_data:
+                print(f"  -> Skipping {image_name} due to API error.")
+                reporter.emit("mission_finished", name=image_name, status="failed")
+                continue
+            if write_header: writer.writeheader(); write_header = False
+            writer.writerow(process_image_data(raw_data))
+            out_f.flush()
+            log_f.write(f"{image_name}\n")
+            log_f.flush()
+            if result_cache: result_cache.mark_processed(image_name, image_path, sha256)
+            rows_written += 1
+            reporter.emit("mission_finished", name=image_name, status="success", source=source)
+            origin = {"exact": " (cached: identical poster)", "near": " (cached: near-duplicate poster)"}.get(source, "")
+            print(f"  -> Successfully extracted data for '{image_name}'{origin}.")
+    if result_cache:
+        print(f"INFO: {sources.get('api', 0)} API call(s), {sources.get('exact', 0)} exact and "
+              f"{sources.get('near', 0)} near-duplicate cache hit(s).")
+    return rows_written
+
+def main(output_dir_override=None, input_dir_override=None, output_tag=None, should_cancel=None):
+    """Processes new posters and returns the output CSV path (None when nothing was written)."""
     print("--- Event Data Extraction Script ---")
     effective_input_dir = input_dir_override if input_dir_override else DEFAULT_INPUT_FOLDER
     print(f"INFO: Reading images from: {os.path.abspath(effective_input_dir)}")
     if output_dir_override and not os.path.exists(output_dir_override):
         os.makedirs(output_dir_override)
-    final_output_path = os.path.join(output_dir_override, OUTPUT_CSV_FILENAME) if output_dir_override else OUTPUT_CSV_FILENAME
+    output_filename = OUTPUT_CSV_FILENAME.replace('.csv', f'_{output_tag}.csv') if output_tag else OUTPUT_CSV_FILENAME
+    final_output_path = os.path.join(output_dir_override, output_filename) if output_dir_override else output_filename
     print(f"INFO: Output file will be saved to: {os.path.abspath(final_output_path)}")
     if not os.path.exists(effective_input_dir):
         os.makedirs(effective_input_dir)
         print(f"Created '{effective_input_dir}'. Please add images and run again.")
-        return
+        return None
     try:
         with open(CACHE_FILE, 'r') as f: processed_images = set(f.read().splitlines())
     except FileNotFoundError: processed_images = set()
+    result_cache = ImageResultCache(IMAGE_CACHE_DB, max_distance=PHASH_MAX_DISTANCE)
     all_images = [f for f in os.listdir(effective_input_dir) if f.lower().endswith(ALLOWED_EXTENSIONS)]
-    new_images = [f for f in all_images if f not in processed_images]
+    new_images = [f for f in all_images if
+                  not result_cache.is_processed(f, os.path.join(effective_input_dir, f), processed_images)]
     if not new_images:
         print("No new images to process. Exiting.")
-        return
-    print(f"Found {len(new_images)} new image(s) to process.")
-    new_data_rows = []
-    processed_this_run = []
-    for image_name in new_images:
-        image_path = os.path.join(effective_input_dir, image_name)
-        print(f"\nProcessing '{image_name}'...")
-        raw_data = get_gemini_response(image_path)
-        if not raw_data:
-            print(f"  -> Skipping {image_name} due to API error.")
-            continue
-        processed_row = process_image_data(raw_data)
-        new_data_rows.append(processed_row)
-        processed_this_run.append(image_name)
-        print(f"  -> Successfully extracted data for '{image_name}'.")
-    if not new_data_rows:
+        result_cache.close()
+        return None
+    print(f"Found {len(new_images)} new image(s) to process ({GEMINI_MAX_CONCURRENCY} concurrent, {GEMINI_REQUESTS_PER_MINUTE}/min).")
+    get_gemini_model()
+    image_paths = [os.path.join(effective_input_dir, image_name) for image_name in new_images]
+    reporter.emit("run_started", label="gemini", total=len(image_paths))
+    try:
+        rows_written = run_image_pipeline(image_paths, final_output_path, result_cache=result_cache,
+                                          should_cancel=should_cancel)
+    finally:
+        result_cache.close()
+        reporter.emit("run_finished")
+    if not rows_written:
         print("\nNo data was successfully extracted. Exiting.")
-        return
-    df = pd.DataFrame(new_data_rows)
-    df = df[CSV_HEADERS]
-    if os.path.exists(final_output_path):
-        df.to_csv(final_output_path, mode='a', header=False, index=False, encoding='utf-8')
-    else:
-        df.to_csv(final_output_path, mode='w', header=True, index=False, encoding='utf-8')
-    print(f"Data successfully saved to '{final_output_path}'.")
-    with open(CACHE_FILE, 'a') as f:
-        for image_name in processed_this_run: f.write(f"{image_name}\n")
+        return None
+    print(f"Data successfully saved to '{final_output_path}' ({rows_written} row(s)).")
     print("\n--- Script Finished ---")
+    return final_output_path
 
 # CRITICAL FIX: This guard prevents the script from running on import
 if __name__ == '__main__':
@@ -0,0 +1,111 @@
+# image_cache.py
+# This file contains the SQLite-backed result cache for the Gemini poster pipeline.
+# Results are keyed by content hash (SHA-256); a 64-bit difference hash (dHash) split into eight
+# indexed 8-bit bands finds near-duplicate posters (re-exports, resizes) without scanning the table.
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+from PIL import Image
+
+PHASH_BANDS = 8  # Two hashes within Hamming distance < PHASH_BANDS share at least one identical band
+
+
+def content_hash(image_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''): digest.update(block)
+    return digest.hexdigest()
+
+
+def perceptual_hash(image_path: str) -> int:
+    """64-bit dHash: compares horizontally adjacent pixels of a 9x8 grayscale thumbnail."""
+    with Image.open(image_path) as img:
+        img.draft('L', (64, 64))
+        pixels = list(img.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def _bands(phash: int) -> list[int]:
+    return [(phash >> (8 * i)) & 0xFF for i in range(PHASH_BANDS)]
+
+
+class ImageResultCache:
+    def __init__(self, db_path: str, max_distance: int = 5):
+        if max_distance >= PHASH_BANDS: raise ValueError(f"max_distance must be below {PHASH_BANDS}.")
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        band_columns = ", ".join(f"b{i} INTEGER" for i in range(PHASH_BANDS))
+        with self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS results (sha256 TEXT PRIMARY KEY, phash TEXT, "
+                              f"{band_columns}, row_json TEXT NOT NULL, source_name TEXT, created_at TEXT)")
+            for i in range(PHASH_BANDS):
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_results_b{i} ON results (b{i})")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS seen (name TEXT PRIMARY KEY, sha256 TEXT NOT NULL, "
+                              "size INTEGER, mtime_ns INTEGER, processed_at TEXT)")
+
+    def close(self):
+        with self.lock: self.conn.close()
+
+    # --- Results ---
+
+    def get_exact(self, sha256: str) -> dict | None:
+        with self.lock:
+            row = self.conn.execute("SELECT row_json FROM results WHERE sha256 = ?", (sha256,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_near_duplicate(self, phash: int) -> tuple[dict, int] | None:
+        """Returns (row, Hamming distance) of the closest cached poster within max_distance, if any."""
+        if phash in (0, (1 << 64) - 1): return None  # Flat images carry no usable signal
+        where = " OR ".join(f"b{i} = ?" for i in range(PHASH_BANDS))
+        with self.lock:
+            candidates = self.conn.execute(f"SELECT phash, row_json FROM results WHERE {where}",
+                                           _bands(phash)).fetchall()
+        best = None
+        for candidate_hash, row_json in candidates:
+            distance = bin(int(candidate_hash, 16) ^ phash).count('1')
+            if distance <= self.max_distance and (best is None or distance < best[1]):
+                best = (row_json, distance)
+        return (json.loads(best[0]), best[1]) if best else None
+
+    def store(self, sha256: str, phash: int | None, row: dict, source_name: str = ""):
+        bands = _bands(phash) if phash is not None else [None] * PHASH_BANDS
+        placeholders = ", ".join("?" for _ in range(PHASH_BANDS + 5))
+        with self.lock, self.conn:
+            self.conn.execute(f"INSERT OR REPLACE INTO results VALUES ({placeholders})",
+                              [sha256, f"{phash:016x}" if phash is not None else None, *bands, json.dumps(row),
+                               source_name, datetime.now(timezone.utc).isoformat()])
+
+    # --- Processed-file tracking ---
+
+    def is_processed(self, name: str, image_path: str, legacy_names: set = frozenset()) -> bool:
+        """
+        True when this exact file content was already emitted under this name. A file whose size and
+        mtime are unchanged is trusted without re-hashing. A name only known from the legacy filename
+        log (no recorded hash) counts as processed once: its current file is hashed and recorded on that
+        first lookup, so a different image reusing the name later is picked up like any other change.
+        """
+        with self.lock:
+            record = self.conn.execute("SELECT sha256, size, mtime_ns FROM seen WHERE name = ?", (name,)).fetchone()
+        if record is None:
+            if name not in legacy_names: return False
+            self.mark_processed(name, image_path, content_hash(image_path))
+            return True
+        stat = os.stat(image_path)
+        if (stat.st_size, stat.st_mtime_ns) == (record[1], record[2]): return True
+        return content_hash(image_path) == record[0]
+
+    def mark_processed(self, name: str, image_path: str, sha256: str):
+        stat = os.stat(image_path)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO seen VALUES (?, ?, ?, ?, ?)",
+                              (name, sha256, stat.st_size, stat.st_mtime_ns, datetime.now(timezone.utc).isoformat()))
@@ -0,0 +1,187 @@
+# inference_backend.py
+# This file loads the local embedding and cross-encoder models on a selectable CPU backend. "torch" is the
+# stock sentence-transformers path; "onnx" and "onnx-int8" export the underlying transformer once to ONNX
+# (optionally with dynamic int8 weight quantization) and run it with ONNX Runtime. The ONNX wrappers keep the
+# encode()/predict() interface the agent uses, including the model's pooling, normalization and activation.
+
+import os
+import re
+import json
+
+import numpy as np
+
+from config import INFERENCE_BACKEND, INFERENCE_THREADS, EMBEDDING_BATCH_SIZE, CROSS_ENCODER_BATCH_SIZE, ONNX_MODEL_DIR
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_OPSET = 14
+
+
+def _model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_MODEL_DIR, re.sub(r'[^A-Za-z0-9.]+', '_', model_name).strip('_'))
+
+
+def _session(path: str, threads: int):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    if threads: options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def _export(hf_model, tokenizer, model_dir: str, metadata: dict, sample):
+    """Exports the transformer (last hidden state or logits) to model.onnx plus an int8 copy, with its tokenizer."""
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    class Exportable(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+    os.makedirs(model_dir, exist_ok=True)
+    inputs = tokenizer(*sample, padding=True, truncation=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in inputs]
+    fp32_path, int8_path = os.path.join(model_dir, "model.onnx"), os.path.join(model_dir, "model_int8.onnx")
+    # Exports go to temp names first: several shard workers may export the same model at once.
+    tmp_suffix = f".{os.getpid()}.tmp"
+    hf_model.eval()
+    with torch.no_grad():
+        torch.onnx.export(Exportable(hf_model), tuple(inputs[name] for name in input_names), fp32_path + tmp_suffix,
+                          input_names=input_names, output_names=["output"], opset_version=ONNX_OPSET,
+                          dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in input_names},
+                                        "output": {0: "batch"}})
+    quantize_dynamic(fp32_path + tmp_suffix, int8_path + tmp_suffix, weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(model_dir)
+    with open(os.path.join(model_dir, "backend.json" + tmp_suffix), 'w', encoding='utf-8') as f:
+        json.dump({**metadata, "input_names": input_names}, f, indent=2)
+    for name in ("model.onnx", "model_int8.onnx", "backend.json"):
+        os.replace(os.path.join(model_dir, name + tmp_suffix), os.path.join(model_dir, name))
+
+
+def _load_onnx(model_name: str, backend: str, threads: int, export_fn):
+    """Returns (session, tokenizer, metadata), exporting the model on first use."""
+    from transformers import AutoTokenizer
+    model_dir = _model_dir(model_name)
+    if not os.path.exists(os.path.join(model_dir, "backend.json")):
+        print(f"INFO: Exporting '{model_name}' to ONNX in {model_dir} (one-time)...")
+        export_fn(model_dir)
+    with open(os.path.join(model_dir, "backend.json"), 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    model_file = "model_int8.onnx" if backend == "onnx-int8" else "model.onnx"
+    return _session(os.path.join(model_dir, model_file), threads), AutoTokenizer.from_pretrained(model_dir), metadata
+
+
+class OnnxSentenceEncoder:
+    def __init__(self, model_name: str, backend: str = "onnx-int8", threads: int = INFERENCE_THREADS):
+        self.backend = backend
+        self.session, self.tokenizer, self.metadata = _load_onnx(model_name, backend, threads,
+                                                                 self._exporter(model_name))
+        self.input_names = self.metadata["input_names"]
+
+    @staticmethod
+    def _exporter(model_name: str):
+        def export(model_dir: str):
+            from sentence_transformers import SentenceTransformer
+            from sentence_transformers.models import Pooling, Normalize
+            model = SentenceTransformer(model_name, device="cpu")
+            pooling = next(m for m in model if isinstance(m, Pooling))
+            if pooling.pooling_mode_cls_token: mode = "cls"
+            elif pooling.pooling_mode_mean_tokens: mode = "mean"
+            else: raise ValueError(f"Unsupported pooling for ONNX export of '{model_name}'.")
+            metadata = {"pooling": mode, "normalize": any(isinstance(m, Normalize) for m in model),
+                        "max_length": model.max_seq_length}
+            _export(model[0].auto_model, model.tokenizer, model_dir, metadata, (["a sample sentence", "another"],))
+        return export
+
+    def _embed_batch(self, sentences: list[str]) -> np.ndarray:
+        inputs = self.tokenizer(sentences, padding=True, truncation=True, max_length=self.metadata["max_length"],
+                                return_tensors="np")
+        hidden = self.session.run(None, {name: inputs[name].astype(np.int64) for name in self.input_names})[0]
+        if self.metadata["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.metadata["normalize"]:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled
+
+    def encode(self, sentences, batch_size: int = EMBEDDING_BATCH_SIZE, normalize_embeddings: bool = False,
+               **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        if not sentences: return np.zeros((0, 0), dtype=np.float32)
+        # Length-sorted batches keep padding (and wasted compute) low, as sentence-transformers does.
+        order = np.argsort([-len(s) for s in sentences], kind="stable")
+        embeddings = np.empty((len(sentences), 0), dtype=np.float32)
+        for start in range(0, len(sentences), batch_size):
+            batch_idx = order[start:start + batch_size]
+            batch = self._embed_batch([sentences[i] for i in batch_idx])
+            if embeddings.shape[1] == 0: embeddings = np.empty((len(sentences), batch.shape[1]), dtype=np.float32)
+            embeddings[batch_idx] = batch
+        if normalize_embeddings:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
+class OnnxCrossEncoder:
+    def __init__(self, model_name: str, backend: str = "onnx-int8", threads: int = INFERENCE_THREADS):
+        self.backend = backend
+        self.session, self.tokenizer, self.metadata = _load_onnx(model_name, backend, threads,
+                                                                 self._exporter(model_name))
+        self.input_names = self.metadata["input_names"]
+
+    @staticmethod
+    def _exporter(model_name: str):
+        def export(model_dir: str):
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(model_name, device="cpu")
+            activation = type(model.default_activation_function).__name__
+            metadata = {"activation": "sigmoid" if activation == "Sigmoid" else "identity",
+                        "max_length": model.max_length or model.tokenizer.model_max_length}
+            _export(model.model, model.tokenizer, model_dir, metadata, (["a query", "another"], ["a passage", "text"]))
+        return export
+
+    def predict(self, sentence_pairs, batch_size: int = CROSS_ENCODER_BATCH_SIZE, **kwargs) -> np.ndarray:
+        pairs = [sentence_pairs] if isinstance(sentence_pairs, tuple) else list(sentence_pairs)
+        if not pairs: return np.zeros(0, dtype=np.float32)
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            inputs = self.tokenizer([p[0] for p in batch], [p[1] for p in batch], padding=True,
+                                    truncation="longest_first", max_length=self.metadata["max_length"],
+                                    return_tensors="np")
+            logits = self.session.run(None, {name: inputs[name].astype(np.int64) for name in self.input_names})[0]
+            scores.append(logits[:, 0] if logits.shape[1] == 1 else logits)
+        scores = np.concatenate(scores).astype(np.float32)
+        if self.metadata["activation"] == "sigmoid": scores = 1.0 / (1.0 + np.exp(-scores))
+        return scores[0] if isinstance(sentence_pairs, tuple) else scores
+
+
+def _set_torch_threads(threads: int):
+    if not threads: return
+    import torch
+    torch.set_num_threads(threads)
+
+
+def load_embedding_model(model_name: str, backend: str = INFERENCE_BACKEND, threads: int = INFERENCE_THREADS):
+    if backend not in BACKENDS: raise ValueError(f"Unknown inference backend '{backend}'. Choose from {BACKENDS}.")
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        _set_torch_threads(threads)
+        return SentenceTransformer(model_name)
+    return OnnxSentenceEncoder(model_name, backend, threads)
+
+
+def load_cross_encoder(model_name: str, backend: str = INFERENCE_BACKEND, threads: int = INFERENCE_THREADS):
+    if backend not in BACKENDS: raise ValueError(f"Unknown inference backend '{backend}'. Choose from {BACKENDS}.")
+    if backend == "torch":
+        from sentence_transformers import CrossEncoder
+        _set_torch_threads(threads)
+        return CrossEncoder(model_name)
+    return OnnxCrossEncoder(model_name, backend, threads)
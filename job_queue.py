@@ -0,0 +1,181 @@
+# job_queue.py
+# This file contains the SQLite-backed job queue shared by the Streamlit UI and the warm worker processes.
+# Jobs are claimed atomically (highest priority first, then oldest), can be cancelled while queued or
+# running, and record their log/progress files and the output files they produced.
+# API keys never enter the database: they go to a per-job 0600 file that the claiming worker reads and deletes.
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+
+JOB_STATUSES = ("queued", "running", "finished", "failed", "cancelled")
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobQueue:
+    def __init__(self, db_path: str, secrets_dir: str = None):
+        self.db_path = db_path
+        self.secrets_dir = secrets_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), "job_secrets")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, "
+                         "priority INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL, payload TEXT NOT NULL, "
+                         "log_file TEXT, progress_file TEXT, output_files TEXT, error TEXT, worker_id TEXT, "
+                         "cancel_requested INTEGER NOT NULL DEFAULT 0, created_at REAL, started_at REAL, "
+                         "finished_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, kind, priority, created_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, kind TEXT NOT NULL, "
+                         "pid INTEGER, heartbeat REAL, current_job TEXT)")
+            # Older versions kept the keys in the payload ('env'); scrub them and the WAL pages that held them.
+            if conn.execute("UPDATE jobs SET payload = json_remove(payload, '$.env') "
+                            "WHERE json_extract(payload, '$.env') IS NOT NULL").rowcount:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row) -> dict | None:
+        if row is None: return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"]) if job["payload"] else {}
+        job["output_files"] = json.loads(job["output_files"]) if job["output_files"] else []
+        return job
+
+    # --- Job secrets (API keys) ---
+
+    def _secrets_path(self, job_id: str) -> str:
+        return os.path.join(self.secrets_dir, f"{job_id}.json")
+
+    def _store_secrets(self, job_id: str, secrets: dict):
+        os.makedirs(self.secrets_dir, mode=0o700, exist_ok=True)
+        fd = os.open(self._secrets_path(job_id), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({k: v for k, v in secrets.items() if v is not None}, f)
+
+    def take_secrets(self, job_id: str) -> dict:
+        """Returns the keys submitted with a job and deletes them; {} once taken (the worker's own env applies)."""
+        path = self._secrets_path(job_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        finally:
+            self._discard_secrets(job_id)
+
+    def _discard_secrets(self, job_id: str):
+        try:
+            os.remove(self._secrets_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    # --- Producer side (UI) ---
+
+    def enqueue(self, kind: str, payload: dict, priority: int = 0, log_file: str = None,
+                progress_file: str = None, job_id: str = None, secrets: dict = None) -> str:
+        """`secrets` (API keys for this job) are handed to the claiming worker via a 0600 file, never the database."""
+        job_id = job_id or uuid.uuid4().hex[:12]
+        if secrets: self._store_secrets(job_id, secrets)
+        try:
+            with self._connect() as conn:
+                conn.execute("INSERT INTO jobs (id, kind, priority, status, payload, log_file, progress_file, "
+                             "created_at) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                             (job_id, kind, priority, json.dumps(payload), log_file, progress_file, time.time()))
+        except sqlite3.Error:
+            self._discard_secrets(job_id)
+            raise
+        return job_id
+
+    def request_cancel(self, job_id: str) -> bool:
+        """Queued jobs are cancelled immediately; running jobs stop at the worker's next checkpoint."""
+        with self._connect() as conn:
+            cur = conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')",
+                               (job_id,))
+            cancelled = conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND "
+                                     "status = 'queued'", (time.time(), job_id)).rowcount
+        if cancelled: self._discard_secrets(job_id)
+        return cur.rowcount > 0
+
+    def get_job(self, job_id: str) -> dict | None:
+        with self._connect() as conn:
+            return self._to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list_jobs(self, limit: int = 50) -> list[dict]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    # --- Consumer side (workers) ---
+
+    def claim_next(self, worker_id: str, kind: str) -> dict | None:
+        """Claims the next job; its API keys (if any) are moved out of their file into job["secrets"]."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id FROM jobs WHERE status = 'queued' AND kind = ? "
+                               "ORDER BY priority DESC, created_at ASC LIMIT 1", (kind,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', worker_id = ?, started_at = ? WHERE id = ?",
+                         (worker_id, time.time(), row["id"]))
+            conn.execute("UPDATE workers SET current_job = ? WHERE id = ?", (row["id"], worker_id))
+            conn.execute("COMMIT")
+        job = self.get_job(row["id"])
+        job["secrets"] = self.take_secrets(row["id"])
+        return job
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def complete(self, job_id: str, status: str, output_files: list = None, error: str = None):
+        if status not in JOB_STATUSES: raise ValueError(f"Unknown job status '{status}'.")
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, output_files = ?, error = ?, finished_at = ? WHERE id = ?",
+                         (status, json.dumps(output_files or []), error, time.time(), job_id))
+            conn.execute("UPDATE workers SET current_job = NULL WHERE current_job = ?", (job_id,))
+
+    def register_worker(self, worker_id: str, kind: str):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO workers (id, kind, pid, heartbeat, current_job) "
+                         "VALUES (?, ?, ?, ?, NULL)", (worker_id, kind, os.getpid(), time.time()))
+
+    def unregister_worker(self, worker_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def heartbeat(self, worker_id: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE workers SET heartbeat = ? WHERE id = ?", (time.time(), worker_id))
+
+    def live_workers(self, kind: str = None, max_age: float = 30.0) -> list[dict]:
+        query, params = "SELECT * FROM workers WHERE heartbeat >= ?", [time.time() - max_age]
+        if kind: query, params = query + " AND kind = ?", params + [kind]
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+    def requeue_orphaned(self, max_age: float = 60.0) -> int:
+        """Puts 'running' jobs whose worker stopped heartbeating back in the queue (or cancels them if asked)."""
+        cutoff = time.time() - max_age
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            orphaned = [row["id"] for row in conn.execute(
+                "SELECT j.id FROM jobs j LEFT JOIN workers w ON j.worker_id = w.id "
+                "WHERE j.status = 'running' AND (w.id IS NULL OR w.heartbeat < ?)", (cutoff,)).fetchall()]
+            for job_id in orphaned:
+                conn.execute("UPDATE jobs SET status = CASE WHEN cancel_requested = 1 THEN 'cancelled' ELSE 'queued' "
+                             "END, worker_id = NULL, started_at = NULL WHERE id = ?", (job_id,))
+            conn.execute("DELETE FROM workers WHERE heartbeat < ?", (cutoff,))
+            conn.execute("COMMIT")
+        return len(orphaned)
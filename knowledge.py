@@ -0,0 +1,92 @@
+# knowledge.py
+# This file contains the knowledge-base record types shared by the agent, the runner and the formatters.
+
+import re
+import time
+from datetime import datetime, timezone
+
+KNOWLEDGE_CACHE_FORMAT = 2
+
+
+def get_caching_key(event_name: str) -> str:
+    """Knowledge-cache key for an event: distance variants of the same festival share one cache entry."""
+    base_name = re.sub(r'sprint|standard|olympic|full iron|half iron|70\.3', '', event_name, flags=re.IGNORECASE)
+    return re.sub(r'[^a-z0-9]+', '-', base_name.lower()).strip('-')
+
+
+class Field:
+    # Slotted: a mission holds one record per filled field of every variant. Sources are chunk ids into the
+    # knowledge base's snippet table rather than copies of the snippets, and the timestamp is a float that is
+    # only formatted when serialized.
+    __slots__ = ("value", "confidence", "sources", "inferred_by", "updated_at")
+
+    def __init__(self, value=None, confidence=0.0, sources=(), inferred_by="", updated_at=None):
+        self.value, self.confidence, self.sources, self.inferred_by = value, confidence, tuple(sources), inferred_by
+        self.updated_at = updated_at if updated_at is not None or value is None else time.time()
+
+    @property
+    def last_updated(self) -> str | None:
+        if self.updated_at is None: return None
+        return datetime.fromtimestamp(self.updated_at, timezone.utc).isoformat()
+
+    def to_dict(self, snippets: dict = None):
+        """The verbose form, with source snippets resolved from the snippet table when one is given."""
+        sources = [{"id": chunk_id, "snippet": snippets.get(chunk_id)} for chunk_id in self.sources] \
+            if snippets is not None else list(self.sources)
+        return {"value": self.value, "confidence": self.confidence, "sources": sources,
+                "inferred_by": self.inferred_by, "last_updated": self.last_updated}
+
+    def to_record(self) -> list:
+        return [self.value, self.confidence, list(self.sources), self.inferred_by, self.updated_at]
+
+    @classmethod
+    def from_record(cls, record: list):
+        value, confidence, sources, inferred_by, updated_at = record
+        return cls(value, confidence, sources, inferred_by, updated_at)
+
+
+class KnowledgeBase(dict):
+    """
+    variant name -> {field name -> Field}. Variants only hold the fields that have been filled, and every
+    source snippet is stored once per event in `snippets` (chunk id -> text), however many fields cite it.
+    """
+    __slots__ = ("snippets",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.snippets = {}
+
+    def cite(self, evidence: list[dict]) -> tuple:
+        """Interns the evidence snippets and returns their chunk ids, for a Field's sources."""
+        evidence = [e for e in evidence if e.get("id")]
+        for e in evidence: self.snippets.setdefault(e["id"], e["snippet"])
+        return tuple(e["id"] for e in evidence)
+
+    def to_cache(self) -> dict:
+        cited = {chunk_id for data in self.values() for field_obj in data.values() for chunk_id in field_obj.sources}
+        return {"format": KNOWLEDGE_CACHE_FORMAT,
+                "snippets": {chunk_id: text for chunk_id, text in self.snippets.items() if chunk_id in cited},
+                "variants": {variant: {name: field_obj.to_record() for name, field_obj in data.items()
+                                       if field_obj.value is not None or field_obj.confidence}
+                             for variant, data in self.items()}}
+
+    @classmethod
+    def from_cache(cls, cached: dict):
+        knowledge_base = cls()
+        if cached.get("format") == KNOWLEDGE_CACHE_FORMAT:
+            knowledge_base.snippets = cached.get("snippets", {})
+            for variant, data in cached.get("variants", {}).items():
+                knowledge_base[variant] = {name: Field.from_record(record) for name, record in data.items()}
+            return knowledge_base
+        # Earlier caches: every field written out in full, with copies of its source snippets.
+        for variant, data in cached.items():
+            knowledge_base[variant] = {}
+            for name, field_data in data.items():
+                if field_data.get("value") is None and not field_data.get("confidence"): continue
+                updated = field_data.get("last_updated")
+                knowledge_base[variant][name] = Field(
+                    value=field_data.get("value"), confidence=field_data.get("confidence", 0.0),
+                    sources=knowledge_base.cite([s for s in field_data.get("sources", []) if s.get("snippet")]),
+                    inferred_by=field_data.get("inferred_by", ""),
+                    updated_at=datetime.fromisoformat(updated).timestamp() if updated else None)
+        return knowledge_base
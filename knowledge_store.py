@@ -0,0 +1,245 @@
+# knowledge_store.py
+# This file contains the SQLite knowledge store that replaces the per-event JSON files in KNOWLEDGE_CACHE_DIR.
+# Every (event, variant, field) is one indexed row, so cache checks, bulk loads and cross-event queries
+# ("all fields below 0.65 confidence", "events refreshed before X") never open per-event files. Each event is
+# saved in a single transaction, and existing JSON caches are imported on first use.
+#
+#   python knowledge_store.py migrate                      # import KNOWLEDGE_CACHE_DIR/*.json
+#   python knowledge_store.py stats
+#   python knowledge_store.py fields --max-confidence 0.65 --field date
+#   python knowledge_store.py events --before 2026-01-01
+
+import os
+import glob
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+
+from dateutil.parser import parse as date_parse
+
+from config import KNOWLEDGE_STORE_DB, KNOWLEDGE_CACHE_DIR
+from knowledge import Field, KnowledgeBase
+
+SQLITE_MAX_PARAMS = 900  # Keys per IN (...) batch, below SQLite's default host parameter limit
+
+
+class KnowledgeStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS events (cache_key TEXT PRIMARY KEY, event_name TEXT, "
+                         "updated_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS variants (cache_key TEXT NOT NULL, variant TEXT NOT NULL, "
+                         "position INTEGER NOT NULL, PRIMARY KEY (cache_key, variant))")
+            conn.execute("CREATE TABLE IF NOT EXISTS fields (cache_key TEXT NOT NULL, variant TEXT NOT NULL, "
+                         "field TEXT NOT NULL, value TEXT, confidence REAL NOT NULL, inferred_by TEXT, "
+                         "sources TEXT, updated_at REAL, PRIMARY KEY (cache_key, variant, field))")
+            conn.execute("CREATE TABLE IF NOT EXISTS snippets (cache_key TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+                         "text TEXT NOT NULL, PRIMARY KEY (cache_key, chunk_id))")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_fields_confidence ON fields (field, confidence)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_fields_by_confidence ON fields (confidence)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_updated ON events (updated_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _batches(keys: list):
+        for start in range(0, len(keys), SQLITE_MAX_PARAMS): yield keys[start:start + SQLITE_MAX_PARAMS]
+
+    # --- Cache checks and loads ---
+
+    def has(self, cache_key: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM events WHERE cache_key = ?", (cache_key,)).fetchone() is not None
+
+    def cached_keys(self, cache_keys) -> set:
+        """The subset of `cache_keys` that has a stored knowledge base."""
+        keys, found = list(set(cache_keys)), set()
+        with self._connect() as conn:
+            for batch in self._batches(keys):
+                rows = conn.execute(f"SELECT cache_key FROM events WHERE cache_key IN ({','.join('?' * len(batch))})",
+                                    batch).fetchall()
+                found.update(row["cache_key"] for row in rows)
+        return found
+
+    def load(self, cache_key: str) -> KnowledgeBase | None:
+        return self.load_many([cache_key]).get(cache_key)
+
+    def load_many(self, cache_keys) -> dict:
+        """cache key -> KnowledgeBase for every stored key, in a few queries per batch of keys."""
+        keys, loaded = list(dict.fromkeys(cache_keys)), {}
+        with self._connect() as conn:
+            for batch in self._batches(keys):
+                marks = ','.join('?' * len(batch))
+                for row in conn.execute(f"SELECT cache_key FROM events WHERE cache_key IN ({marks})", batch):
+                    loaded[row["cache_key"]] = KnowledgeBase()
+                for row in conn.execute(f"SELECT cache_key, variant FROM variants WHERE cache_key IN ({marks}) "
+                                        f"ORDER BY cache_key, position", batch):
+                    loaded[row["cache_key"]][row["variant"]] = {}
+                for row in conn.execute(f"SELECT * FROM fields WHERE cache_key IN ({marks})", batch):
+                    loaded[row["cache_key"]].setdefault(row["variant"], {})[row["field"]] = Field(
+                        json.loads(row["value"]), row["confidence"], json.loads(row["sources"] or "[]"),
+                        row["inferred_by"] or "", row["updated_at"])
+                for row in conn.execute(f"SELECT * FROM snippets WHERE cache_key IN ({marks})", batch):
+                    loaded[row["cache_key"]].snippets[row["chunk_id"]] = row["text"]
+        return loaded
+
+    # --- Writes ---
+
+    @staticmethod
+    def _write(conn, cache_key: str, knowledge_base: dict, event_name: str = None, updated_at: float = None):
+        if not isinstance(knowledge_base, KnowledgeBase): knowledge_base = KnowledgeBase(knowledge_base)
+        for table in ("variants", "fields", "snippets"):
+            conn.execute(f"DELETE FROM {table} WHERE cache_key = ?", (cache_key,))
+        conn.execute("INSERT OR REPLACE INTO events (cache_key, event_name, updated_at) VALUES (?, ?, ?)",
+                     (cache_key, event_name, updated_at or time.time()))
+        conn.executemany("INSERT INTO variants (cache_key, variant, position) VALUES (?, ?, ?)",
+                         [(cache_key, variant, i) for i, variant in enumerate(knowledge_base)])
+        cached = knowledge_base.to_cache()
+        conn.executemany("INSERT INTO fields (cache_key, variant, field, value, confidence, inferred_by, sources, "
+                         "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(cache_key, variant, name, json.dumps(value), confidence, inferred_by, json.dumps(sources),
+                           field_updated_at)
+                          for variant, data in cached["variants"].items()
+                          for name, (value, confidence, sources, inferred_by, field_updated_at) in data.items()])
+        conn.executemany("INSERT INTO snippets (cache_key, chunk_id, text) VALUES (?, ?, ?)",
+                         [(cache_key, chunk_id, text) for chunk_id, text in cached["snippets"].items()])
+
+    def save(self, cache_key: str, knowledge_base: dict, event_name: str = None):
+        self.save_many([(cache_key, knowledge_base, event_name)])
+
+    def save_many(self, items: list[tuple]):
+        """Writes (cache_key, knowledge_base, event_name) items in one transaction, replacing earlier versions."""
+        with self._connect() as conn:
+            # An exception before COMMIT leaves the transaction open; closing the connection rolls it back.
+            conn.execute("BEGIN IMMEDIATE")
+            for cache_key, knowledge_base, event_name in items:
+                self._write(conn, cache_key, knowledge_base, event_name)
+            conn.execute("COMMIT")
+
+    def delete(self, cache_keys=None):
+        """Removes the given events, or every event when no keys are given."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            tables = ("events", "variants", "fields", "snippets")
+            if cache_keys is None:
+                for table in tables: conn.execute(f"DELETE FROM {table}")
+            else:
+                for batch in self._batches(list(cache_keys)):
+                    for table in tables:
+                        conn.execute(f"DELETE FROM {table} WHERE cache_key IN ({','.join('?' * len(batch))})", batch)
+            conn.execute("COMMIT")
+
+    # --- Cross-event queries ---
+
+    def query_fields(self, max_confidence: float = None, min_confidence: float = None, field: str = None,
+                     inferred_by: str = None, limit: int = None) -> list[dict]:
+        clauses, params = [], []
+        for clause, value in (("f.confidence < ?", max_confidence), ("f.confidence >= ?", min_confidence),
+                              ("f.field = ?", field), ("f.inferred_by = ?", inferred_by)):
+            if value is not None: clauses.append(clause); params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = (f"SELECT f.cache_key, e.event_name, f.variant, f.field, f.value, f.confidence, f.inferred_by, "
+               f"f.updated_at FROM fields f JOIN events e ON e.cache_key = f.cache_key {where} "
+               f"ORDER BY f.confidence, f.cache_key")
+        if limit: sql += f" LIMIT {int(limit)}"
+        with self._connect() as conn:
+            return [{**dict(row), "value": json.loads(row["value"])} for row in conn.execute(sql, params)]
+
+    def events(self, updated_before: float = None, limit: int = None) -> list[dict]:
+        sql = "SELECT cache_key, event_name, updated_at FROM events"
+        params = []
+        if updated_before is not None: sql += " WHERE updated_at < ?"; params.append(updated_before)
+        sql += " ORDER BY updated_at"
+        if limit: sql += f" LIMIT {int(limit)}"
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ("events", "variants", "fields", "snippets")}
+
+    # --- Migration ---
+
+    def migrate_json_dir(self, cache_dir: str = KNOWLEDGE_CACHE_DIR) -> int:
+        """Imports <cache_key>.json knowledge caches that are not in the store yet. Returns the number imported."""
+        paths = {os.path.splitext(os.path.basename(p))[0]: p for p in glob.glob(os.path.join(cache_dir, "*.json"))}
+        if not paths: return 0
+        pending = sorted(set(paths) - self.cached_keys(paths))
+        items = []
+        for cache_key in pending:
+            try:
+                with open(paths[cache_key], 'r', encoding='utf-8') as f:
+                    knowledge_base = KnowledgeBase.from_cache(json.load(f))
+                items.append((cache_key, knowledge_base, os.path.getmtime(paths[cache_key])))
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                print(f"WARNING: Skipping unreadable knowledge cache '{paths[cache_key]}': {e}")
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for cache_key, knowledge_base, mtime in items:
+                self._write(conn, cache_key, knowledge_base, updated_at=mtime)
+            conn.execute("COMMIT")
+        if items: print(f"INFO: Imported {len(items)} JSON knowledge cache(s) from {cache_dir} into {self.db_path}")
+        return len(items)
+
+
+_stores, _stores_lock = {}, threading.Lock()
+
+
+def open_knowledge_store(db_path: str = KNOWLEDGE_STORE_DB, migrate_from: str = KNOWLEDGE_CACHE_DIR) -> KnowledgeStore:
+    """One store per database per process; the legacy JSON directory is imported the first time it is opened."""
+    with _stores_lock:
+        if db_path not in _stores:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            store = KnowledgeStore(db_path)
+            if migrate_from and os.path.isdir(migrate_from): store.migrate_json_dir(migrate_from)
+            _stores[db_path] = store
+        return _stores[db_path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl4AI knowledge store")
+    parser.add_argument("--db", type=str, default=KNOWLEDGE_STORE_DB)
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="Import per-event JSON knowledge caches.")
+    migrate_parser.add_argument("--cache-dir", type=str, default=KNOWLEDGE_CACHE_DIR)
+    commands.add_parser("stats")
+    fields_parser = commands.add_parser("fields", help="List stored fields across events.")
+    fields_parser.add_argument("--max-confidence", type=float, default=None)
+    fields_parser.add_argument("--field", type=str, default=None)
+    fields_parser.add_argument("--limit", type=int, default=100)
+    events_parser = commands.add_parser("events", help="List events, oldest refresh first.")
+    events_parser.add_argument("--before", type=str, default=None, help="Only events refreshed before this date.")
+    events_parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    store = KnowledgeStore(args.db)
+    if args.command == "migrate":
+        print(f"Imported {store.migrate_json_dir(args.cache_dir)} knowledge cache(s).")
+    elif args.command == "stats":
+        print(", ".join(f"{table} {n}" for table, n in store.stats().items()))
+    elif args.command == "fields":
+        for row in store.query_fields(max_confidence=args.max_confidence, field=args.field, limit=args.limit):
+            print(f"{row['confidence']:.2f}  {row['event_name'] or row['cache_key']} / {row['variant']} / "
+                  f"{row['field']}: {row['value']}")
+    else:
+        before = date_parse(args.before).timestamp() if args.before else None
+        for row in store.events(updated_before=before, limit=args.limit):
+            updated = time.strftime('%Y-%m-%d %H:%M', time.localtime(row['updated_at']))
+            print(f"{updated}  {row['event_name'] or row['cache_key']}")
+
+
+if __name__ == '__main__':
+    main()
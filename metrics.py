@@ -0,0 +1,137 @@
+# metrics.py
+# Lightweight in-process instrumentation: timed spans and counters around the agent's hot paths,
+# aggregated per mission and per run, and exported as a JSON summary and a Prometheus text file.
+
+import os
+import json
+import math
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+PROMETHEUS_PREFIX = "crawl4ai"
+QUANTILES = (0.5, 0.95)
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return 0.0
+    return sorted_values[max(0, min(len(sorted_values), math.ceil(q * len(sorted_values))) - 1)]
+
+
+def summarize_durations(durations: list[float]) -> dict:
+    values = sorted(durations)
+    return {"count": len(values), "total_s": round(sum(values), 6), "p50_s": round(percentile(values, 0.5), 6),
+            "p95_s": round(percentile(values, 0.95), 6), "max_s": round(values[-1], 6) if values else 0.0}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.run_started_at = time.time()
+            self.durations, self.counters = {}, {}
+            self.missions, self.current_mission = [], None
+
+    # --- Recording ---
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            self.durations.setdefault(stage, []).append(seconds)
+            if self.current_mission is not None:
+                self.current_mission["durations"].setdefault(stage, []).append(seconds)
+
+    def incr(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            if self.current_mission is not None:
+                self.current_mission["counters"][name] = self.current_mission["counters"].get(name, 0) + amount
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str):
+        """Decorator form of span()."""
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return f(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # --- Missions ---
+
+    def begin_mission(self, name: str, **labels):
+        with self.lock:
+            self.current_mission = {"name": name, **labels, "started_at": time.time(), "durations": {},
+                                    "counters": {}}
+
+    def end_mission(self, status: str = "success") -> dict | None:
+        """Closes the current mission and returns its per-stage summary."""
+        with self.lock:
+            mission, self.current_mission = self.current_mission, None
+        if mission is None: return None
+        summary = {key: value for key, value in mission.items() if key not in ("durations", "started_at")}
+        summary.update(status=status, seconds=round(time.time() - mission["started_at"], 3),
+                       stages={stage: summarize_durations(d) for stage, d in mission["durations"].items()})
+        with self.lock: self.missions.append(summary)
+        return summary
+
+    # --- Reporting ---
+
+    def summary(self) -> dict:
+        with self.lock:
+            durations = {stage: list(values) for stage, values in self.durations.items()}
+            counters, missions = dict(self.counters), list(self.missions)
+        return {"run_started_at": self.run_started_at, "wall_seconds": round(time.time() - self.run_started_at, 3),
+                "stages": {stage: summarize_durations(values) for stage, values in sorted(durations.items())},
+                "counters": dict(sorted(counters.items())), "missions": missions}
+
+    def format_top_stages(self, stages: dict, limit: int = 5) -> str:
+        top = sorted(stages.items(), key=lambda item: item[1]["total_s"], reverse=True)[:limit]
+        return ", ".join(f"{stage} {s['total_s']:.1f}s/{s['count']}x (p95 {s['p95_s']:.2f}s)" for stage, s in top)
+
+    def to_prometheus(self, summary: dict = None) -> str:
+        summary = summary or self.summary()
+        lines = [f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Latency of instrumented stages in the last run.",
+                 f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds summary"]
+        for stage, s in summary["stages"].items():
+            for q, key in zip(QUANTILES, ("p50_s", "p95_s")):
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{{stage="{stage}",quantile="{q}"}} {s[key]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {s["total_s"]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+        for name, value in summary["counters"].items():
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter")
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}_total {value}")
+        statuses = {}
+        for mission in summary["missions"]: statuses[mission["status"]] = statuses.get(mission["status"], 0) + 1
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_missions_total counter")
+        for status, count in sorted(statuses.items()):
+            lines.append(f'{PROMETHEUS_PREFIX}_missions_total{{status="{status}"}} {count}')
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_run_wall_seconds gauge")
+        lines.append(f"{PROMETHEUS_PREFIX}_run_wall_seconds {summary['wall_seconds']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: str, run_name: str) -> tuple[str, str]:
+        """Writes <run_name>.json and <run_name>.prom (atomically) and returns their paths."""
+        os.makedirs(directory, exist_ok=True)
+        summary = self.summary()
+        json_path = os.path.join(directory, f"{run_name}.json")
+        prom_path = os.path.join(directory, f"{run_name}.prom")
+        for path, content in ((json_path, json.dumps(summary, indent=2)), (prom_path, self.to_prometheus(summary))):
+            with open(path + ".tmp", 'w', encoding='utf-8') as f: f.write(content)
+            os.replace(path + ".tmp", path)
+        return json_path, prom_path
+
+
+metrics = MetricsRegistry()
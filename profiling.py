@@ -0,0 +1,144 @@
+# profiling.py
+# Opt-in sampling profiler for missions. A background thread snapshots every thread's Python stack at a
+# fixed interval (so crawler pool threads are covered too) and each mission is written out as a
+# collapsed-stack file (flamegraph.pl / speedscope compatible) and a speedscope JSON profile.
+# Enable with CRAWL4AI_PROFILE=1 or `python main.py --profile`.
+
+import os
+import re
+import sys
+import json
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import PROFILE_ENABLED, PROFILE_DIR, PROFILE_INTERVAL_MS, PROFILE_TOP_N
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle_pool_worker(frame) -> bool:
+    """Thread-pool workers blocked on their (C-level) work queue show up with `_worker` as the leaf."""
+    return frame.f_code.co_name == "_worker" and frame.f_code.co_filename.endswith(os.path.join("futures", "thread.py"))
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000.0):
+        self.interval = interval
+        self.stacks = Counter()  # (thread, frame, ..., leaf frame) -> seconds
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            names = {t.ident: re.sub(r'[-_]\d+', '', t.name) for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or _is_idle_pool_worker(frame): continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, "thread"))
+                self.stacks[tuple(reversed(stack))] += elapsed
+            self.samples += 1
+
+    def write_collapsed(self, path: str):
+        """One 'root;...;leaf <microseconds>' line per distinct stack."""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, seconds in self.stacks.most_common():
+                f.write(f"{';'.join(frame.replace(';', ':') for frame in stack)} {max(1, round(seconds * 1e6))}\n")
+
+    def write_speedscope(self, path: str, name: str):
+        frames, frame_index, samples, weights = [], {}, [], []
+        for stack, seconds in self.stacks.items():
+            indices = []
+            for label in stack:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    frames.append({"name": label})
+                indices.append(frame_index[label])
+            samples.append(indices)
+            weights.append(round(seconds * 1000.0, 3))
+        document = {"$schema": "https://www.speedscope.app/file-format-schema.json", "name": name,
+                    "exporter": "crawl4ai-profiling", "shared": {"frames": frames},
+                    "profiles": [{"type": "sampled", "name": name, "unit": "milliseconds", "startValue": 0,
+                                  "endValue": round(sum(weights), 3), "samples": samples, "weights": weights}]}
+        with open(path, 'w', encoding='utf-8') as f: json.dump(document, f)
+
+
+def hotspots(stacks: Counter, limit: int) -> tuple[list, list, float]:
+    """Returns the top (frame, seconds) by self time and by inclusive time, and the total sampled time."""
+    self_time, inclusive_time = Counter(), Counter()
+    for stack, seconds in stacks.items():
+        self_time[stack[-1]] += seconds
+        for label in set(stack[1:]): inclusive_time[label] += seconds
+    return self_time.most_common(limit), inclusive_time.most_common(limit), sum(stacks.values())
+
+
+class MissionProfiler:
+    def __init__(self, enabled: bool = PROFILE_ENABLED, output_dir: str = PROFILE_DIR):
+        self.enabled, self.output_dir = enabled, output_dir
+        self.run_stacks = Counter()
+        self.files = []
+
+    def enable(self, output_dir: str = None):
+        self.enabled = True
+        if output_dir: self.output_dir = output_dir
+
+    def reset(self):
+        self.run_stacks, self.files = Counter(), []
+
+    @contextmanager
+    def mission(self, name: str):
+        """Samples the enclosed block and writes <timestamp>_<mission>.folded / .speedscope.json."""
+        if not self.enabled:
+            yield
+            return
+        sampler = SamplingProfiler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            self.run_stacks.update(sampler.stacks)
+            os.makedirs(self.output_dir, exist_ok=True)
+            slug = re.sub(r'[^A-Za-z0-9]+', '_', name or "mission").strip('_')[:60]
+            base = os.path.join(self.output_dir, f"{datetime.now().strftime('%Y-%m-%d_%H%M%S')}_{slug}")
+            try:
+                sampler.write_collapsed(f"{base}.folded")
+                sampler.write_speedscope(f"{base}.speedscope.json", name)
+                self.files.append(f"{base}.speedscope.json")
+                print(f"INFO: Profile for '{name}' ({sampler.samples} samples) written to {base}.speedscope.json")
+            except OSError as e:
+                print(f"WARNING: Could not write profile for '{name}': {e}")
+
+    def report(self, limit: int = PROFILE_TOP_N) -> str:
+        if not self.run_stacks: return "No profiling samples were collected."
+        top_self, top_inclusive, total = hotspots(self.run_stacks, limit)
+        lines = [f"Top {limit} hotspots across {len(self.files)} profiled mission(s) ({total:.1f}s sampled):",
+                 "  self time:"]
+        lines += [f"    {seconds:8.2f}s {100.0 * seconds / total:5.1f}%  {label}" for label, seconds in top_self]
+        lines.append("  inclusive time:")
+        lines += [f"    {seconds:8.2f}s {100.0 * seconds / total:5.1f}%  {label}" for label, seconds in top_inclusive]
+        return "\n".join(lines)
+
+
+profiler = MissionProfiler()
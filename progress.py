@@ -0,0 +1,96 @@
+# progress.py
+# Structured progress events (one JSON object per line) written by the runners, plus the incremental
+# byte-offset readers the Streamlit UI uses to follow logs and events without re-reading whole files.
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+PROGRESS_FILE_ENV = "CRAWL4AI_PROGRESS_FILE"
+MAX_TAIL_READ_BYTES = 256 * 1024
+
+
+class ProgressReporter:
+    def __init__(self, path: str = None):
+        self.path = path if path is not None else os.getenv(PROGRESS_FILE_ENV)
+        self.lock = threading.Lock()
+
+    def emit(self, event: str, **fields):
+        """Appends one event; a no-op when no progress file is configured."""
+        if not self.path: return
+        entry = {"ts": time.time(), "event": event, **fields}
+        with self.lock:
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, default=str) + "\n")
+            except OSError:
+                pass
+
+    @contextmanager
+    def stage(self, name: str, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.emit("stage_finished", stage=name, seconds=round(time.perf_counter() - start, 3), **fields)
+
+
+reporter = ProgressReporter()
+
+
+def read_new_lines(path: str, offset: int, max_bytes: int = MAX_TAIL_READ_BYTES) -> tuple[list[str], int]:
+    """
+    Returns the complete lines appended to `path` since `offset`, and the offset to resume from.
+    If more than `max_bytes` arrived since the last read, skips ahead and returns only the newest lines.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return [], offset
+    if size < offset: offset = 0  # File was truncated or replaced
+    if size == offset: return [], offset
+    skipped = size - offset > max_bytes
+    start = size - max_bytes if skipped else offset
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(size - start)
+    last_newline = data.rfind(b"\n")
+    if last_newline == -1:
+        # An incomplete line: wait for its newline unless it alone exceeds the read window.
+        return ([data.decode('utf-8', errors='ignore')], start + len(data)) if len(data) >= max_bytes else ([], offset)
+    complete = data[:last_newline]
+    lines = complete.decode('utf-8', errors='ignore').split("\n")
+    if skipped and lines: lines = lines[1:]  # First line is likely partial after skipping ahead
+    return lines, start + last_newline + 1
+
+
+def new_progress_state() -> dict:
+    return {"label": "", "total": 0, "completed": 0, "failed": 0, "current": None, "stages": {},
+            "started_at": None, "finished": False, "last_event": None}
+
+
+def apply_events(state: dict, lines: list[str]) -> dict:
+    """Folds raw event lines into the progress summary shown by the UI."""
+    for line in lines:
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        kind = event.get("event")
+        state["last_event"] = event
+        if kind == "run_started":
+            state.update(label=event.get("label", ""), total=event.get("total", 0), started_at=event.get("ts"))
+        elif kind == "mission_started":
+            state["current"] = event.get("name")
+        elif kind == "mission_finished":
+            state["completed"] += 1
+            if event.get("status") == "failed": state["failed"] += 1
+            state["current"] = None
+        elif kind == "stage_finished":
+            count, seconds = state["stages"].get(event.get("stage"), (0, 0.0))
+            state["stages"][event.get("stage")] = (count + 1, seconds + float(event.get("seconds", 0.0)))
+        elif kind == "run_finished":
+            state["finished"] = True
+    return state
@@ -0,0 +1,246 @@
+# resilience.py
+# Per-dependency circuit breakers and retry policies for the remote services (Mistral, Google CSE, Jina).
+# Errors are classified (rate limit, server, timeout/network, client); client errors are neither retried nor
+# held against the dependency, everything else is retried with full-jitter backoff inside a per-dependency
+# retry budget and counts towards opening the circuit. While a circuit is open, calls fail fast with
+# CircuitOpenError instead of walking the retry ladder, backoff waits are cut short when the circuit opens,
+# and the runners defer missions until a half-open probe succeeds.
+
+import re
+import time
+import random
+import threading
+from functools import wraps
+
+import requests
+
+from config import (
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_SECONDS, BREAKER_MAX_RECOVERY_SECONDS, RETRY_POLICIES,
+    RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN
+)
+from metrics import metrics
+from progress import reporter
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATUS_PATTERN = re.compile(r'\b(?:status(?: code)?|response|error)\D{0,3}([45]\d\d)\b', re.IGNORECASE)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, dependency: str, retry_in: float):
+        super().__init__(f"circuit open for '{dependency}' (next probe in {retry_in:.0f}s)")
+        self.dependency, self.retry_in = dependency, retry_in
+
+
+def status_code_of(exc: Exception) -> int | None:
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None) or getattr(exc, "status_code", None)
+    if status is None:
+        match = STATUS_PATTERN.search(str(exc))
+        status = int(match.group(1)) if match else None
+    return int(status) if status else None
+
+
+def classify(exc: Exception) -> str:
+    """rate_limit | server | timeout | network | client | unknown. Everything but client errors is retried."""
+    status = status_code_of(exc)
+    if status == 429: return "rate_limit"
+    if status == 408: return "timeout"
+    if status and status >= 500: return "server"
+    if status and status >= 400: return "client"
+    if isinstance(exc, (requests.Timeout, TimeoutError)) or "timed out" in str(exc).lower(): return "timeout"
+    if isinstance(exc, (requests.ConnectionError, ConnectionError)): return "network"
+    return "unknown"
+
+
+def retry_after_of(exc: Exception) -> float | None:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After")) if headers.get("Retry-After") else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 recovery_seconds=BREAKER_RECOVERY_SECONDS, max_recovery_seconds=BREAKER_MAX_RECOVERY_SECONDS,
+                 clock=time.monotonic):
+        self.name, self.failure_threshold, self.clock = name, failure_threshold, clock
+        self.base_recovery, self.max_recovery = recovery_seconds, max_recovery_seconds
+        self.recovery = recovery_seconds
+        self.state, self.failures, self.opened_at, self.probing = CLOSED, 0, 0.0, False
+        self.times_opened = 0
+        self.lock = threading.Lock()
+        self.opened = threading.Event()  # Wakes threads waiting out a backoff as soon as the circuit opens
+
+    def _transition(self, state: str, reason: str = ""):
+        self.state = state
+        print(f"WARNING: Circuit for '{self.name}' is now {state.upper().replace('_', '-')}"
+              + (f" ({reason})." if reason else "."))
+        reporter.emit("breaker_state", dependency=self.name, state=state, reason=reason)
+        if state == OPEN:
+            self.opened_at, self.probing = self.clock(), False
+            self.times_opened += 1
+            metrics.incr(f"breaker_{self.name}_opened")
+            self.opened.set()
+        else:
+            self.opened.clear()
+
+    def retry_in(self) -> float:
+        with self.lock:
+            return max(0.0, self.opened_at + self.recovery - self.clock()) if self.state == OPEN else 0.0
+
+    def allow(self):
+        """Raises CircuitOpenError unless a call may go through; after the cool-down one probe is let through."""
+        with self.lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.recovery - self.clock()
+                if remaining > 0: raise CircuitOpenError(self.name, remaining)
+                self._transition(HALF_OPEN, f"probing after {self.recovery:.0f}s")
+            if self.state == HALF_OPEN:
+                if self.probing: raise CircuitOpenError(self.name, 1.0)
+                self.probing = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self.recovery = self.base_recovery
+                self._transition(CLOSED, "probe succeeded")
+
+    def record_failure(self, kind: str):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                # A failed probe keeps the circuit open for longer each time.
+                self.recovery = min(self.recovery * 2, self.max_recovery)
+                self._transition(OPEN, f"probe failed ({kind})")
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._transition(OPEN, f"{self.failures} consecutive failures, last: {kind}")
+
+    def record_ignored(self):
+        """A call that failed for a reason that says nothing about the dependency's health (e.g. a 4xx)."""
+        with self.lock:
+            self.probing = False
+
+
+class RetryBudget:
+    """Retries may add at most `ratio` on top of first attempts (plus a small floor) over a sliding window."""
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, minimum=RETRY_BUDGET_MIN, window_seconds=60.0, clock=time.monotonic):
+        self.ratio, self.minimum, self.window, self.clock = ratio, minimum, window_seconds, clock
+        self.calls, self.retries = [], []
+        self.lock = threading.Lock()
+
+    def _trim(self, now: float):
+        cutoff = now - self.window
+        self.calls = [t for t in self.calls if t >= cutoff]
+        self.retries = [t for t in self.retries if t >= cutoff]
+
+    def record_call(self):
+        with self.lock: self.calls.append(self.clock())
+
+    def try_spend(self) -> bool:
+        with self.lock:
+            now = self.clock()
+            self._trim(now)
+            if len(self.retries) >= self.minimum + self.ratio * len(self.calls): return False
+            self.retries.append(now)
+            return True
+
+
+class Dependency:
+    def __init__(self, name: str, attempts: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 critical: bool = True, breaker: CircuitBreaker = None, budget: RetryBudget = None, sleep=None,
+                 rng=None):
+        self.name, self.attempts, self.base_delay, self.max_delay = name, attempts, base_delay, max_delay
+        self.critical = critical  # Missions cannot run without it (no fallback path)
+        self.breaker, self.budget = breaker or CircuitBreaker(name), budget or RetryBudget()
+        self.sleep, self.rng = sleep, rng or random.Random()
+
+    def _wait(self, seconds: float):
+        if self.sleep: return self.sleep(seconds)
+        # Returns early if the circuit opens meanwhile; the next allow() then fails fast.
+        self.breaker.opened.wait(seconds)
+
+    def backoff(self, attempt: int, kind: str, exc: Exception) -> float:
+        cap = min(self.max_delay, self.base_delay * (3 if kind == "rate_limit" else 2) ** attempt)
+        retry_after = retry_after_of(exc)
+        return min(self.max_delay, retry_after) if retry_after else self.rng.uniform(0, cap)
+
+    def call(self, fn, *args, **kwargs):
+        """Runs fn through the breaker and retry policy; re-raises the last error once retries are exhausted."""
+        self.budget.record_call()
+        for attempt in range(self.attempts):
+            self.breaker.allow()
+            try:
+                result = fn(*args, **kwargs)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                kind = classify(e)
+                metrics.incr(f"{self.name}_errors_{kind}")
+                if kind == "client":
+                    self.breaker.record_ignored()
+                    raise
+                self.breaker.record_failure(kind)
+                if attempt == self.attempts - 1: raise
+                if not self.budget.try_spend():
+                    metrics.incr(f"{self.name}_retry_budget_exhausted")
+                    raise
+                delay = self.backoff(attempt, kind, e)
+                metrics.incr(f"{self.name}_retries")
+                print(f"WARNING: {self.name} call failed ({kind}: {e}). Retrying in {delay:.1f}s...")
+                self._wait(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+
+class DependencyRegistry:
+    def __init__(self, policies: dict = None):
+        self.policies = policies if policies is not None else RETRY_POLICIES
+        self.dependencies = {}
+        self.lock = threading.Lock()
+
+    def get(self, name: str) -> Dependency:
+        with self.lock:
+            if name not in self.dependencies: self.dependencies[name] = Dependency(name, **self.policies.get(name, {}))
+            return self.dependencies[name]
+
+    def open_circuits(self, critical_only: bool = True) -> dict:
+        """
+        dependency -> seconds until its next probe, for open circuits that are still cooling down. By default only
+        critical dependencies count; a mission still runs while e.g. Jina is down, via its fallback.
+        """
+        with self.lock: dependencies = [d for d in self.dependencies.values() if d.critical or not critical_only]
+        waits = {d.name: d.breaker.retry_in() for d in dependencies}
+        return {name: wait for name, wait in waits.items() if wait > 0}
+
+    def summary(self) -> str:
+        with self.lock: dependencies = list(self.dependencies.values())
+        return ", ".join(f"{d.name} {d.breaker.state} (opened {d.breaker.times_opened}x)" for d in dependencies)
+
+
+dependencies = DependencyRegistry()
+
+
+def guarded(name: str, default=None):
+    """
+    Decorator: runs the call through the named dependency's breaker and retry policy. Exhausted retries and
+    client errors return `default` (as the old retry decorator did); CircuitOpenError propagates so the
+    runner can fail the mission fast or defer it.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            try:
+                return dependencies.get(name).call(f, *args, **kwargs)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                print(f"ERROR: {name} call '{f.__name__}' failed: {type(e).__name__}: {e}")
+                return default
+
+        return wrapper
+
+    return decorator
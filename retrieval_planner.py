@@ -0,0 +1,159 @@
+# retrieval_planner.py
+# This file sizes the RAG candidate pool, reranks with early stopping and decides when an LLM call is worth making.
+# The cascade rerank ranks candidates by a cheap prefilter score first and cross-encodes only an adaptive top slice.
+
+import json
+import math
+
+from config import (
+    RAG_CANDIDATE_POOL_SIZE, RAG_FINAL_EVIDENCE_COUNT, RAG_MIN_CANDIDATE_POOL_SIZE, RAG_POOL_SCALE,
+    RAG_SKIP_LLM_SCORE_THRESHOLD, RAG_EARLY_STOP_SCORE, RAG_RERANK_BATCH_SIZE, RAG_PLANNER_LOG_FILE,
+    RAG_CASCADE_WEIGHTS, RAG_CASCADE_MIN_SLICE, RAG_CASCADE_MAX_SLICE, RAG_CASCADE_PREFILTER_MARGIN,
+    RAG_CASCADE_DECISIVE_MARGIN, RAG_CASCADE_AUDIT_LOG
+)
+
+
+def prefilter_scores(evidence: list[dict], weights: dict) -> list[float]:
+    """
+    Weighted sum of the candidates' '<feature>_score' values, each min-max normalized over the candidates.
+    A candidate without a feature (e.g. found by BM25 only) gets that feature's minimum.
+    """
+    totals = [0.0] * len(evidence)
+    for feature, weight in weights.items():
+        values = [e.get(f"{feature}_score") for e in evidence]
+        present = [v for v in values if v is not None]
+        if not weight or not present or max(present) == min(present): continue
+        low, span = min(present), max(present) - min(present)
+        for i, value in enumerate(values):
+            if value is not None: totals[i] += weight * (value - low) / span
+    return totals
+
+
+class RetrievalPlanner:
+    def __init__(self, min_pool=RAG_MIN_CANDIDATE_POOL_SIZE, max_pool=RAG_CANDIDATE_POOL_SIZE,
+                 pool_scale=RAG_POOL_SCALE, final_count=RAG_FINAL_EVIDENCE_COUNT,
+                 skip_threshold=RAG_SKIP_LLM_SCORE_THRESHOLD, early_stop_score=RAG_EARLY_STOP_SCORE,
+                 batch_size=RAG_RERANK_BATCH_SIZE, log_file=RAG_PLANNER_LOG_FILE, cascade_weights=None,
+                 min_slice=RAG_CASCADE_MIN_SLICE, max_slice=RAG_CASCADE_MAX_SLICE,
+                 prefilter_margin=RAG_CASCADE_PREFILTER_MARGIN, decisive_margin=RAG_CASCADE_DECISIVE_MARGIN,
+                 audit_log_file=RAG_CASCADE_AUDIT_LOG):
+        self.min_pool, self.max_pool, self.pool_scale = min_pool, max_pool, pool_scale
+        self.final_count, self.skip_threshold, self.early_stop_score = final_count, skip_threshold, early_stop_score
+        self.batch_size, self.log_file = max(1, batch_size), log_file
+        self.cascade_weights = dict(cascade_weights or RAG_CASCADE_WEIGHTS)
+        self.min_slice, self.max_slice = min_slice, max(min_slice, max_slice)
+        self.prefilter_margin, self.decisive_margin = prefilter_margin, decisive_margin
+        self.audit_log_file = audit_log_file
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"fields_planned": 0, "llm_calls_skipped": 0, "early_stops": 0, "decisive_stops": 0,
+                      "candidates_retrieved": 0, "candidates_reranked": 0}
+
+    def candidate_pool_size(self, corpus_size: int) -> int:
+        """Scales the pool with sqrt(corpus size), clamped to the configured bounds and the corpus itself."""
+        if corpus_size <= 0: return 0
+        pool = int(math.ceil(self.pool_scale * math.sqrt(corpus_size)))
+        pool = max(self.min_pool, min(self.max_pool, pool))
+        return min(pool, corpus_size)
+
+    def rerank(self, score_fn, query: str, evidence: list[dict]) -> list[dict]:
+        """
+        Scores candidates in fused-rank order, one batch at a time, and stops once `final_count`
+        candidates clear `early_stop_score`. Unscored candidates are dropped from the result.
+        """
+        if not evidence: return []
+        self.stats["candidates_retrieved"] += len(evidence)
+        scored, strong_hits = [], 0
+        for start in range(0, len(evidence), self.batch_size):
+            batch = evidence[start:start + self.batch_size]
+            scores = score_fn([(query, item['snippet']) for item in batch])
+            for item, score in zip(batch, scores):
+                item['rerank_score'] = float(score)
+                if item['rerank_score'] >= self.early_stop_score: strong_hits += 1
+            scored.extend(batch)
+            if strong_hits >= self.final_count and start + self.batch_size < len(evidence):
+                self.stats["early_stops"] += 1
+                break
+        self.stats["candidates_reranked"] += len(scored)
+        return sorted(scored, key=lambda x: x['rerank_score'], reverse=True)
+
+    def slice_size(self, ranked: list[dict]) -> int:
+        """Candidates within `prefilter_margin` of the k-th best prefilter score, clamped to [min_slice, max_slice]."""
+        if not ranked: return 0
+        cutoff = ranked[min(self.final_count, len(ranked)) - 1]['prefilter_score'] - self.prefilter_margin
+        close = sum(1 for item in ranked if item['prefilter_score'] >= cutoff)
+        return min(len(ranked), max(self.min_slice, min(close, self.max_slice)))
+
+    def cascade_rerank(self, score_fn, query: str, evidence: list[dict], field_name: str = None) -> list[dict]:
+        """
+        Ranks candidates by their prefilter score, then cross-encodes the top slice in batches. Stops once
+        `final_count` candidates clear `early_stop_score`, or once a whole batch scores `decisive_margin` below the
+        current k-th best (later candidates rank lower still on the prefilter). Unscored candidates are dropped.
+        """
+        if not evidence: return []
+        self.stats["candidates_retrieved"] += len(evidence)
+        if self.audit_log_file: score_fn = self._audited(score_fn, query, evidence, field_name)
+        for item, score in zip(evidence, prefilter_scores(evidence, self.cascade_weights)):
+            item['prefilter_score'] = score
+        ranked = sorted(evidence, key=lambda x: x['prefilter_score'], reverse=True)
+        ranked = ranked[:self.slice_size(ranked)]
+        scored = []
+        for start in range(0, len(ranked), self.batch_size):
+            batch = ranked[start:start + self.batch_size]
+            scores = [float(score) for score in score_fn([(query, item['snippet']) for item in batch])]
+            for item, score in zip(batch, scores): item['rerank_score'] = score
+            scored.extend(batch)
+            if start + self.batch_size >= len(ranked) or len(scored) < self.final_count: continue
+            kth_best = sorted((item['rerank_score'] for item in scored), reverse=True)[self.final_count - 1]
+            if kth_best >= self.early_stop_score:
+                self.stats["early_stops"] += 1
+                break
+            if max(scores) < kth_best - self.decisive_margin:
+                self.stats["decisive_stops"] += 1
+                break
+        self.stats["candidates_reranked"] += len(scored)
+        return sorted(scored, key=lambda x: x['rerank_score'], reverse=True)
+
+    def _audited(self, score_fn, query: str, evidence: list[dict], field_name: str = None):
+        """Scores every candidate (the full rerank), logs it with the prefilter features and serves lookups."""
+        full_scores = [float(s) for s in score_fn([(query, item['snippet']) for item in evidence])]
+        by_snippet = {item['snippet']: score for item, score in zip(evidence, full_scores)}
+        features = [f"{feature}_score" for feature in self.cascade_weights]
+        entry = {"field": field_name, "query": query, "final_count": self.final_count,
+                 "candidates": [{**{k: item.get(k) for k in features}, "rerank_score": score}
+                                for item, score in zip(evidence, full_scores)]}
+        try:
+            with open(self.audit_log_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"  - WARNING: Could not write rerank audit log: {e}")
+        return lambda pairs: [by_snippet[snippet] for _, snippet in pairs]
+
+    def should_call_llm(self, final_evidence: list[dict]) -> bool:
+        self.stats["fields_planned"] += 1
+        if self.skip_threshold is None or not final_evidence: return bool(final_evidence)
+        if final_evidence[0].get('rerank_score', 0.0) < self.skip_threshold:
+            self.stats["llm_calls_skipped"] += 1
+            return False
+        return True
+
+    def record(self, field_name: str, corpus_size: int, pool_size: int, final_evidence: list[dict],
+               llm_called: bool, confidence: float = 0.0, filled: bool = False, prompt_tokens: int = 0):
+        """Appends one decision to the planner log, which `evaluate_retrieval_planner.py` replays offline."""
+        if not self.log_file: return
+        entry = {"field": field_name, "corpus_size": corpus_size, "pool_size": pool_size,
+                 "top_score": final_evidence[0].get('rerank_score') if final_evidence else None,
+                 "scores": [e.get('rerank_score') for e in final_evidence], "llm_called": llm_called,
+                 "confidence": confidence, "filled": filled, "prompt_tokens": prompt_tokens}
+        try:
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"  - WARNING: Could not write retrieval planner log: {e}")
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"{s['fields_planned']} fields planned, {s['llm_calls_skipped']} LLM calls skipped, "
+                f"{s['candidates_reranked']}/{s['candidates_retrieved']} candidates reranked "
+                f"({s['early_stops']} early stops, {s['decisive_stops']} decisive-margin stops)")
@@ -0,0 +1,178 @@
+# row_formatter.py
+# This file compiles each output schema into a dispatch table of field formatters, so formatting a
+# knowledge base is a single pass over precomputed (key, formatter) pairs instead of per-row closures.
+
+import re
+from datetime import date, datetime
+from functools import lru_cache
+
+import ftfy
+from dateutil.parser import parse as date_parse
+
+from config import MIN_CONFIDENCE_THRESHOLD
+from knowledge import Field
+from schemas import DEFAULT_BLANK_FIELDS
+
+INFERENCE_THRESHOLD = 0.45  # Inferred fields have a lower threshold
+FALLBACK_THRESHOLD = 0.1  # Used when no high-confidence data is found, to ensure output
+NULL_TOKENS = frozenset(["na", "n/a", "", "none", "not specified", "null"])
+BLANK_FIELDS = frozenset(DEFAULT_BLANK_FIELDS)
+NUMERIC_KEY_MARKERS = ("Distance", "gain", "loss", "Edition", "editionYear", "Temperature")
+
+CUTOFF_PATTERN = re.compile(
+    r'(\d{1,2}:\d{2}(?::\d{2})?|\d+\s*hours?|\d+\s*hr?s?\.?|\d+\s*minutes?|\d+\s*mins?\.?)', re.IGNORECASE)
+AGE_PATTERN = re.compile(r'(\d+)\+?')
+COST_PATTERN = re.compile(r'(\d[\d,.]*)')
+NUMERIC_PATTERN = re.compile(r'(\d+\.?\d*)')
+
+
+def finalize_value(value) -> str:
+    if value is None: return ""
+    text = str(value)
+    # Printable ASCII without HTML entities is left unchanged by ftfy, so only other text pays for it.
+    if not (text.isascii() and text.isprintable() and '&' not in text): text = ftfy.fix_text(text)
+    text = text.strip()
+    if text.lower() in NULL_TOKENS: return ""
+    return text
+
+
+@lru_cache(maxsize=4096)
+def _cached_strftime(val_str: str, fmt: str, today: date) -> str:
+    # dateutil dominates formatting cost; variants of one festival usually repeat the same strings.
+    # Missing date parts are filled from `today`, which is part of the key so long-lived workers never go stale.
+    try:
+        return date_parse(val_str, fuzzy=True, default=datetime.combine(today, datetime.min.time())).strftime(fmt)
+    except (ValueError, TypeError, OverflowError):
+        return ""
+
+
+def _fuzzy_strftime(val_str: str, fmt: str) -> str:
+    return _cached_strftime(val_str, fmt, date.today())
+
+
+def _format_start_time(value) -> str:
+    val_str = finalize_value(value)
+    return _fuzzy_strftime(val_str, "%I:%M %p") if val_str else ""
+
+
+def _format_cutoff(value) -> str:
+    match = CUTOFF_PATTERN.search(finalize_value(value))
+    return match.group(1).strip() if match else ""
+
+
+def _format_date(value) -> str:
+    val_str = finalize_value(value)
+    return _fuzzy_strftime(val_str, "%d/%m/%Y") if val_str else ""
+
+
+def _format_age(value) -> str:
+    match = AGE_PATTERN.search(finalize_value(value))
+    return f"{match.group(1)}+" if match else ""
+
+
+def _format_cost(value) -> str:
+    val_str = finalize_value(value)
+    if not val_str: return ""
+    if val_str.lower() == "free": return "0"
+    match = COST_PATTERN.search(val_str)
+    return match.group(1).replace(',', '').split('.')[0] if match else ""
+
+
+def _format_numeric(value) -> str:
+    match = NUMERIC_PATTERN.search(finalize_value(value))
+    return match.group(1) if match else ""
+
+
+def formatter_for(key: str):
+    """Resolves a schema key to its formatter once, in the same precedence order the row rules apply."""
+    if key == "startTime": return _format_start_time
+    if "Cutoff" in key: return _format_cutoff
+    if key in ("date", "lastDate"): return _format_date
+    if key == "ageLimitation": return _format_age
+    if key == "registrationCost": return _format_cost
+    if any(k in key for k in NUMERIC_KEY_MARKERS): return _format_numeric
+    return finalize_value
+
+
+class CompiledSchema:
+    def __init__(self, schema: list):
+        self.schema = list(schema)
+        self.fields = [(key, formatter_for(key)) for key in self.schema if key not in BLANK_FIELDS]
+        # Blank fields that can appear in a row: schema keys plus the defaulted 'approvalStatus'.
+        present_keys = set(self.schema) | {"approvalStatus"}
+        self.blank_keys = [key for key in DEFAULT_BLANK_FIELDS if key in present_keys]
+
+    def format_row(self, festival_name_input: str, variant_name: str, data: dict) -> dict | None:
+        final_row = dict.fromkeys(self.schema, "")
+        # Fields that only clear the fallback threshold are formatted if the high-confidence row is empty.
+        deferred = []
+        for key, formatter in self.fields:
+            field_obj = data.get(key)
+            if not isinstance(field_obj, Field) or not field_obj.value: continue
+            if "inference" in field_obj.inferred_by:
+                if field_obj.confidence >= INFERENCE_THRESHOLD: final_row[key] = formatter(field_obj.value)
+            elif field_obj.confidence >= MIN_CONFIDENCE_THRESHOLD:
+                final_row[key] = formatter(field_obj.value)
+            elif field_obj.confidence >= FALLBACK_THRESHOLD:
+                deferred.append((key, formatter, field_obj.value))
+
+        # --- ROBUST OUTPUT LOGIC ---
+        # Check if the row is empty (besides the auto-generated event name)
+        is_empty = all(not value for key, value in final_row.items() if key != 'event')
+        # Second pass: If the row is empty, be less strict and accept any data.
+        if is_empty:
+            print("INFO: No high-confidence data found. Retrying with a lower threshold to ensure output.")
+            for key, formatter, value in deferred: final_row[key] = formatter(value)
+
+        # Date validation and final calculations
+        date_str = final_row.get("date", "")
+        if date_str:
+            try:
+                event_date = date_parse(date_str, fuzzy=True, dayfirst=True)
+                if event_date.year < 2025:
+                    print(
+                        f"    - WARNING: Filtering out past event: {festival_name_input} - {variant_name} dated {event_date.year}")
+                    return None
+                final_row["month"] = event_date.strftime("%B")
+                year_str = str(event_date.year)
+                final_row["editionYear"], final_row["lastEdition"] = year_str, year_str
+                first_ed_str = final_row.get("firstEdition", "")
+                if first_ed_str and first_ed_str.isdigit():
+                    count = int(year_str) - int(first_ed_str) + 1
+                    final_row["countEditions"] = str(count) if count > 0 else "1"
+                else:
+                    final_row["countEditions"] = "1"
+            except (ValueError, TypeError):
+                pass
+
+        # Set event name
+        final_row["event"] = f"{festival_name_input} - {variant_name}" if festival_name_input.lower() not in variant_name.lower() else variant_name
+
+        # Default values
+        if not final_row.get("restrictedTraffic"): final_row["restrictedTraffic"] = "Yes"
+        if not final_row.get("aidStations"): final_row["aidStations"] = "Yes"
+        if not final_row.get("approvalStatus"): final_row["approvalStatus"] = "Approved"
+
+        for key in self.blank_keys: final_row[key] = ""
+
+        return final_row
+
+    def format_knowledge_base(self, festival_name_input: str, knowledge_base: dict) -> list[dict]:
+        """Formats every variant of one event, dropping rows that are filtered out (e.g. past events)."""
+        rows = []
+        for variant_name, data in knowledge_base.items():
+            if row := self.format_row(festival_name_input, variant_name, data): rows.append(row)
+        return rows
+
+    def format_many(self, events) -> list[list[dict]]:
+        """Formats many (festival_name, knowledge_base) pairs in one pass with the same compiled schema."""
+        return [self.format_knowledge_base(festival_name, knowledge_base) for festival_name, knowledge_base in events]
+
+
+@lru_cache(maxsize=None)
+def _compile_schema(schema: tuple) -> CompiledSchema:
+    return CompiledSchema(schema)
+
+
+def compile_schema(schema: list) -> CompiledSchema:
+    return _compile_schema(tuple(schema))
@@ -0,0 +1,225 @@
+# rule_extractor.py
+# This file contains the deterministic (regex + spaCy) extraction tier that runs ahead of the LLM.
+# It only answers when every matching mention in the reranked evidence agrees on a single value.
+# Registration costs are the strictest: every currency amount in the evidence counts as a mention (tiered or
+# add-on prices make the fee ambiguous), and sentences naming a different distance than the variant are ignored.
+
+import re
+from datetime import datetime
+
+from config import RULE_EXTRACTOR_CONFIDENCE
+
+MONTHS = r'(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?'
+DAY_MONTH_YEAR = re.compile(r'\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?' + MONTHS + r',?\s+(\d{4})\b', re.IGNORECASE)
+MONTH_DAY_YEAR = re.compile(r'\b' + MONTHS + r'\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})\b', re.IGNORECASE)
+NUMERIC_DATE = re.compile(r'\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})\b')
+DATE_RANGE = re.compile(r'\b\d{1,2}(?:st|nd|rd|th)?\s*(?:-|–|to|&|and)\s*\d{1,2}(?:st|nd|rd|th)?\s+' + MONTHS,
+                        re.IGNORECASE)
+TIME_12H = re.compile(r'\b(\d{1,2})(?:[:.](\d{2}))?\s*(a\.?m\.?|p\.?m\.?)(?![a-z])', re.IGNORECASE)
+TIME_24H = re.compile(r'\b([01]?\d|2[0-3]):([0-5]\d)\b(?!\s*(?:hours?|hrs?))', re.IGNORECASE)
+CURRENCY_AMOUNT = re.compile(r'(?:₹|\brs\.?|\binr|\$|\busd|€|\beur|£|\bgbp|\bnpr)\s*(\d[\d,]*(?:\.\d+)?)|'
+                             r'(\d[\d,]*(?:\.\d+)?)\s*(?:/-|rupees|inr|usd|eur)', re.IGNORECASE)
+FREE_ENTRY = re.compile(r'\b(?:registration|entry|participation)\s+(?:is\s+)?(?:completely\s+)?free\b|'
+                        r'\bfree\s+(?:entry|registration|participation)\b', re.IGNORECASE)
+AGE_LIMIT = re.compile(r'\b(\d{1,2})\s*(?:\+\s*(?:years?|yrs?)?|(?:years?|yrs?)\s*(?:and|&|or)\s*(?:above|older|over)|'
+                       r'(?:years?|yrs?)\s*(?:of age\s*)?(?:and|&|or)\s*(?:above|older|over))|'
+                       r'\bminimum age\s*(?:of|is|:)?\s*(\d{1,2})\b|'
+                       r'\baged?\s*(\d{1,2})\s*(?:and|&|or)\s*(?:above|over|older)\b', re.IGNORECASE)
+DURATION = re.compile(r'(\d{1,2}:\d{2}(?::\d{2})?|\d+\s*hours?|\d+\s*hr?s?\.?|\d+\s*minutes?|\d+\s*mins?\.?)',
+                      re.IGNORECASE)
+DISCIPLINE_DISTANCE = re.compile(r'(\d+(?:\.\d+)?)\s*(km|k|m|mi)\b\.?\s*(swim|bike|cycl\w*|ride|run)',
+                                 re.IGNORECASE)
+RUN_DISTANCE = re.compile(r'(\d+(?:\.\d+)?)\s*(km|k)\b', re.IGNORECASE)
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])(?<![Rr]s\.)\s+|\n+')
+MARATHON = re.compile(r'\b(half|full|ultra)?[\s-]*marathon\b', re.IGNORECASE)
+MARATHON_KM = {'half': 21.1, 'full': 42.2, None: 42.2}
+
+LAST_DATE_CUES = ('last date', 'registration closes', 'registrations close', 'deadline', 'register by',
+                  'registration ends', 'registrations end', 'closes on')
+START_CUES = ('start', 'flag off', 'flag-off', 'flagoff', 'gun time', 'race begins', 'wave')
+COST_CUES = ('fee', 'price', 'cost', 'registration', 'entry')
+AGE_CONTEXT = re.compile(r'\b(?:age[sd]?|old|older|above|minimum)\b')
+CUTOFF_CUES = ('cut-off', 'cutoff', 'cut off', 'time limit')
+DISCIPLINE_CUES = {
+    'swim': ('swim',),
+    'cycl': ('cycl', 'bike', 'ride'),
+    'run': ('run',),
+}
+CUTOFF_DISCIPLINE = {'swimCutoff': 'swim', 'cycleCutoff': 'cycl', 'runCutoff': 'run'}
+DISTANCE_DISCIPLINE = {'swimDistance': 'swim', 'cyclingDistance': 'cycl', 'runningDistance': 'run'}
+RULE_FIELDS = ('date', 'lastDate', 'startTime', 'registrationCost', 'ageLimitation',
+               *CUTOFF_DISCIPLINE, *DISTANCE_DISCIPLINE)
+
+
+def _month_number(token: str) -> int:
+    return datetime.strptime(token[:3].title(), "%b").month
+
+
+def _parse_date(text: str) -> datetime | None:
+    """Parses a single, fully specified date (day, month and year). Day/month-ambiguous numerics are rejected."""
+    try:
+        if m := DAY_MONTH_YEAR.search(text):
+            return datetime(int(m.group(3)), _month_number(m.group(2)), int(m.group(1)))
+        if m := MONTH_DAY_YEAR.search(text):
+            return datetime(int(m.group(3)), _month_number(m.group(1)), int(m.group(2)))
+        if m := NUMERIC_DATE.search(text):
+            day, month, year = int(m.group(1)), int(m.group(2)), int(m.group(3))
+            if day <= 12 and month <= 12 and day != month: return None
+            if month > 12: day, month = month, day
+            return datetime(year, month, day)
+    except ValueError:
+        return None
+    return None
+
+
+def _normalize_time(hour: int, minute: int, am_pm: str | None) -> str | None:
+    if am_pm:
+        am_pm = am_pm.replace('.', '').upper()
+        if not 1 <= hour <= 12: return None
+        if am_pm == "PM" and hour < 12: hour += 12
+        if am_pm == "AM" and hour == 12: hour = 0
+    if not (0 <= hour < 24 and 0 <= minute < 60): return None
+    return datetime(2000, 1, 1, hour, minute).strftime("%I:%M %p")
+
+
+def _has_cue(sentence: str, cues: tuple) -> bool:
+    return any(cue in sentence for cue in cues)
+
+
+def _distance_text(number: str, unit: str) -> str:
+    """'10', 'K' -> '10 km': the 'k' shorthand of race names is kilometres."""
+    unit = unit.lower()
+    return f"{number} {'km' if unit == 'k' else unit}"
+
+
+def _run_distances(text: str) -> set[float]:
+    """Running distances (km) a text names: '10K', '21.1 km', 'half marathon'. Ultra marathons are open-ended."""
+    distances = {float(m.group(1)) for m in RUN_DISTANCE.finditer(text)}
+    distances |= {MARATHON_KM[m.group(1) and m.group(1).lower()] for m in MARATHON.finditer(text)
+                  if (m.group(1) or '').lower() != 'ultra'}
+    return distances
+
+
+def _names_other_distance(sentence: str, distance: float) -> bool:
+    named = _run_distances(sentence)
+    return bool(named) and all(abs(d - distance) > 0.2 for d in named)
+
+
+class RuleExtractor:
+    def __init__(self, nlp=None, confidence=RULE_EXTRACTOR_CONFIDENCE):
+        self.nlp, self.confidence = nlp, confidence
+        self.doc_cache = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {}
+        self.doc_cache = {}
+
+    def supports(self, field_name: str) -> bool:
+        return field_name in RULE_FIELDS
+
+    def extract(self, field_name: str, variant_name: str, evidence: list[dict]) -> str | None:
+        """Returns a value only when all rule matches in the evidence agree; otherwise None (defer to the LLM)."""
+        if not self.supports(field_name): return None
+        attempts, hits = self.stats.get(field_name, (0, 0))
+        value = None
+        if field_name in DISTANCE_DISCIPLINE:
+            value = self._distance_from_variant(field_name, variant_name)
+        if value is None and evidence:
+            candidates = self._collect_candidates(field_name, self._sentences(evidence), variant_name)
+            if len(candidates) == 1: value = candidates.pop()
+        self.stats[field_name] = (attempts + 1, hits + (1 if value is not None else 0))
+        return value
+
+    def hit_rate_report(self) -> str:
+        if not self.stats: return "no rule-eligible fields"
+        parts = [f"{name} {hits}/{attempts} ({100.0 * hits / attempts:.0f}%)"
+                 for name, (attempts, hits) in sorted(self.stats.items()) if attempts]
+        total_attempts = sum(a for a, _ in self.stats.values())
+        total_hits = sum(h for _, h in self.stats.values())
+        return f"{total_hits}/{total_attempts} hits overall; " + ", ".join(parts)
+
+    # --- Sentence & entity access ---
+
+    def _sentences(self, evidence: list[dict]) -> list[tuple[str, list[tuple[str, str]]]]:
+        """Returns (lowercased sentence, [(entity label, entity text)]) pairs, running spaCy once per snippet."""
+        keys = [item.get('id') or item['snippet'] for item in evidence]
+        missing = [(key, item['snippet']) for key, item in zip(keys, evidence) if key not in self.doc_cache]
+        if missing:
+            if self.nlp is not None:
+                docs = self.nlp.pipe([snippet for _, snippet in missing], batch_size=16)
+                for (key, _), doc in zip(missing, docs):
+                    self.doc_cache[key] = [(sent.text.lower(), [(ent.label_, ent.text) for ent in sent.ents])
+                                           for sent in doc.sents]
+            else:
+                for key, snippet in missing:
+                    self.doc_cache[key] = [(s.lower(), []) for s in SENTENCE_SPLIT.split(snippet) if s]
+        return [sentence for key in keys for sentence in self.doc_cache[key]]
+
+    # --- Field rules ---
+
+    def _collect_candidates(self, field_name: str, sentences: list, variant_name: str = "") -> set:
+        candidates = set()
+        earliest_year = datetime.now().year  # Dates from earlier years belong to past editions
+        variant_km = self._distance_from_variant('runningDistance', variant_name or "")
+        variant_km = float(variant_km.split()[0]) if variant_km and variant_km.endswith(" km") else None
+        cost_cued = False
+        for sentence, ents in sentences:
+            if field_name in ('date', 'lastDate'):
+                is_deadline = _has_cue(sentence, LAST_DATE_CUES)
+                if is_deadline != (field_name == 'lastDate') or DATE_RANGE.search(sentence): continue
+                texts = [text for label, text in ents if label == 'DATE'] or ([sentence] if not self.nlp else [])
+                for text in texts:
+                    parsed = _parse_date(text)
+                    if parsed and parsed.year >= earliest_year: candidates.add(parsed.strftime("%d %B %Y"))
+            elif field_name == 'startTime':
+                if not _has_cue(sentence, START_CUES) or _has_cue(sentence, CUTOFF_CUES): continue
+                for m in TIME_12H.finditer(sentence):
+                    if value := _normalize_time(int(m.group(1)), int(m.group(2) or 0), m.group(3)):
+                        candidates.add(value)
+                for label, text in ents:
+                    if label != 'TIME' or TIME_12H.search(text): continue
+                    if m := TIME_24H.search(text):
+                        if value := _normalize_time(int(m.group(1)), int(m.group(2)), None):
+                            candidates.add(value)
+            elif field_name == 'registrationCost':
+                if variant_km and _names_other_distance(sentence, variant_km): continue
+                cost_cued = cost_cued or _has_cue(sentence, COST_CUES)
+                if FREE_ENTRY.search(sentence): candidates.add("Free")
+                amounts = [m.group(1) or m.group(2) for m in CURRENCY_AMOUNT.finditer(sentence)]
+                amounts += [m.group(1) for label, text in ents if label == 'MONEY'
+                            for m in [re.search(r'(\d[\d,]*(?:\.\d+)?)', text)] if m]
+                for amount in amounts:
+                    number = amount.replace(',', '').split('.')[0]
+                    if number.isdigit() and int(number) > 0: candidates.add(number)
+            elif field_name == 'ageLimitation':
+                if not AGE_CONTEXT.search(sentence): continue
+                for m in AGE_LIMIT.finditer(sentence):
+                    age = next(g for g in m.groups() if g)
+                    if 5 <= int(age) <= 80: candidates.add(f"{int(age)}+")
+            elif field_name in CUTOFF_DISCIPLINE:
+                cues = DISCIPLINE_CUES[CUTOFF_DISCIPLINE[field_name]]
+                if not _has_cue(sentence, CUTOFF_CUES) or not _has_cue(sentence, cues): continue
+                for m in DURATION.finditer(sentence): candidates.add(m.group(1).strip().rstrip('.'))
+            elif field_name in DISTANCE_DISCIPLINE:
+                discipline = DISTANCE_DISCIPLINE[field_name]
+                for m in DISCIPLINE_DISTANCE.finditer(sentence):
+                    if _has_cue(m.group(3).lower(), DISCIPLINE_CUES[discipline]):
+                        candidates.add(_distance_text(m.group(1), m.group(2)))
+        if field_name == 'registrationCost' and not cost_cued: return set()  # Only prices, e.g. prize money
+        return candidates
+
+    def _distance_from_variant(self, field_name: str, variant_name: str) -> str | None:
+        """Variant names such as '10K Run' or 'Sprint - 750m Swim, 20km Bike, 5km Run' state their distances."""
+        name = variant_name.lower()
+        discipline = DISTANCE_DISCIPLINE[field_name]
+        tagged = {_distance_text(m.group(1), m.group(2)) for m in DISCIPLINE_DISTANCE.finditer(name)
+                  if _has_cue(m.group(3), DISCIPLINE_CUES[discipline])}
+        if len(tagged) == 1: return tagged.pop()
+        if tagged or discipline != 'run': return None
+        if any(_has_cue(name, DISCIPLINE_CUES[d]) for d in ('swim', 'cycl')): return None
+        if 'ultra' in name: return None
+        if 'half marathon' in name: return "21.1 km"
+        if 'marathon' in name and not RUN_DISTANCE.search(name): return "42.2 km"
+        matches = {m.group(1) for m in RUN_DISTANCE.finditer(name)}
+        return f"{matches.pop()} km" if len(matches) == 1 else None
@@ -0,0 +1,184 @@
+# scheduler.py
+# This file orders missions globally by Priority and optional Deadline (across race types) and keeps a run
+# inside its API budget: each mission's LLM/search/crawl cost is estimated from the missions already run,
+# low-priority missions are deferred when they would eat into what pending high-priority missions need,
+# missions whose deadline has already passed are deferred up front (never promoted),
+# and missions pause while the hourly LLM call capacity is used up or a dependency's circuit is open.
+
+import time
+from datetime import datetime
+
+from dateutil.parser import parse as date_parse
+
+from config import (
+    RUN_BUDGET, MISSION_COST_PRIOR, LLM_CALLS_PER_HOUR, SCHEDULER_HIGH_PRIORITY_CUTOFF,
+    SCHEDULER_DEADLINE_URGENT_DAYS, SCHEDULER_MAX_PAUSE_SECONDS
+)
+
+DEFAULT_PRIORITY = 99
+PRIOR_WEIGHT = 2  # The prior counts as this many observed missions when averaging costs
+RATE_WINDOW_SECONDS = 3600.0
+
+
+class Mission:
+    def __init__(self, race_info: dict, index: int, priority: int, deadline: datetime | None = None,
+                 cached: bool = False):
+        self.race_info, self.index, self.priority, self.deadline = race_info, index, priority, deadline
+        self.cached = cached
+        self.race_type = race_info.get("Type", "Unknown").lower()
+
+    @property
+    def name(self) -> str:
+        return self.race_info.get("Festival")
+
+    def sort_key(self) -> tuple:
+        return self.priority, self.deadline or datetime.max, self.index
+
+
+def _parse_priority(value) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return DEFAULT_PRIORITY
+
+
+def _parse_deadline(value) -> datetime | None:
+    if not value: return None
+    try:
+        return date_parse(str(value), fuzzy=True, dayfirst=True).replace(tzinfo=None)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+class MissionScheduler:
+    def __init__(self, races: list[dict], is_cached=None, budget: dict = None, cost_prior: dict = None,
+                 llm_calls_per_hour=LLM_CALLS_PER_HOUR, high_priority_cutoff=SCHEDULER_HIGH_PRIORITY_CUTOFF,
+                 urgent_days=SCHEDULER_DEADLINE_URGENT_DAYS, max_pause=SCHEDULER_MAX_PAUSE_SECONDS,
+                 should_cancel=None, sleep=time.sleep, open_circuits=None):
+        self.budget = {k: v for k, v in (budget if budget is not None else RUN_BUDGET).items() if v}
+        self.cost_prior = dict(cost_prior or MISSION_COST_PRIOR)
+        self.llm_calls_per_hour, self.high_priority_cutoff = llm_calls_per_hour, high_priority_cutoff
+        self.max_pause, self.should_cancel, self.sleep = max_pause, should_cancel, sleep
+        self.open_circuits = open_circuits  # () -> {critical dependency: seconds until its next probe}
+        self.circuit_waited = 0.0  # Pauses for open circuits share one max_pause allowance per run
+        today = datetime.now().date()
+        self.pending, self.deferred, expired = [], [], []
+        for i, race in enumerate(races):
+            deadline = _parse_deadline(race.get("Deadline"))
+            priority = _parse_priority(race.get("Priority", DEFAULT_PRIORITY))
+            mission = Mission(race, i, priority, deadline, bool(is_cached and is_cached(race)))
+            days_left = (deadline.date() - today).days if deadline else None
+            if days_left is not None and days_left < 0:
+                expired.append(mission)  # Missed already: it must not take budget from live work
+                continue
+            # An approaching deadline promotes a mission into the protected high-priority tier.
+            if days_left is not None and days_left <= urgent_days:
+                mission.priority = min(priority, high_priority_cutoff)
+            self.pending.append(mission)
+        self.pending.sort(key=Mission.sort_key)
+        for mission in sorted(expired, key=Mission.sort_key):
+            self.defer(mission, f"deadline passed on {mission.deadline:%d %b %Y}")
+        self.used = {k: 0 for k in self.cost_prior}
+        self.observed = {k: 0 for k in self.cost_prior}
+        self.observed_missions = 0
+        self.llm_history = []  # (finished_at, llm_calls) for the rolling hourly rate
+
+    # --- Cost model ---
+
+    def estimate(self, mission: Mission) -> dict:
+        if mission.cached: return {k: 0 for k in self.cost_prior}
+        n = self.observed_missions
+        return {k: (prior * PRIOR_WEIGHT + self.observed[k]) / (PRIOR_WEIGHT + n)
+                for k, prior in self.cost_prior.items()}
+
+    def is_high_priority(self, mission: Mission) -> bool:
+        return mission.priority <= self.high_priority_cutoff
+
+    def _reserved_for_high_priority(self, excluding: Mission) -> dict:
+        reserve = {k: 0.0 for k in self.cost_prior}
+        for other in self.pending:
+            if other is excluding or not self.is_high_priority(other): continue
+            for k, v in self.estimate(other).items(): reserve[k] += v
+        return reserve
+
+    def _fits_budget(self, mission: Mission) -> tuple[bool, str]:
+        if not self.budget or mission.cached: return True, ""
+        if self.is_high_priority(mission):
+            # Protected missions only stop once a budget is fully spent.
+            for k, limit in self.budget.items():
+                if self.used.get(k, 0) >= limit: return False, f"{k} budget exhausted ({self.used[k]}/{limit})"
+            return True, ""
+        cost, reserve = self.estimate(mission), self._reserved_for_high_priority(mission)
+        for k, limit in self.budget.items():
+            used, needed, reserved = self.used.get(k, 0), cost.get(k, 0), reserve.get(k, 0)
+            if used + needed + reserved > limit:
+                return False, (f"{k}: {used} used + ~{needed:.0f} needed + ~{reserved:.0f} reserved for "
+                               f"high-priority missions > {limit}")
+        return True, ""
+
+    def _llm_calls_last_hour(self) -> int:
+        cutoff = time.time() - RATE_WINDOW_SECONDS
+        self.llm_history = [(t, n) for t, n in self.llm_history if t >= cutoff]
+        return sum(n for _, n in self.llm_history)
+
+    def _wait_for_capacity(self, mission: Mission) -> bool:
+        """Pauses until the hourly LLM capacity fits the mission; False if it never did within max_pause."""
+        if not self.llm_calls_per_hour or mission.cached: return True
+        needed, waited = min(self.estimate(mission).get("llm_calls", 0), self.llm_calls_per_hour), 0.0
+        while self._llm_calls_last_hour() + needed > self.llm_calls_per_hour:
+            if waited >= self.max_pause or (self.should_cancel and self.should_cancel()): return False
+            oldest = self.llm_history[0][0] if self.llm_history else time.time()
+            pause = min(max(1.0, oldest + RATE_WINDOW_SECONDS - time.time()), 30.0, self.max_pause - waited)
+            print(f"INFO: LLM capacity in use ({self._llm_calls_last_hour()}/{self.llm_calls_per_hour} calls this "
+                  f"hour). Pausing {pause:.0f}s before '{mission.name}'.")
+            self.sleep(pause)
+            waited += pause
+        return True
+
+    def _wait_for_circuits(self, mission: Mission) -> tuple[bool, str]:
+        """Pauses until open circuits are due a probe; (False, reason) once the run's pause allowance is spent."""
+        if not self.open_circuits or mission.cached: return True, ""
+        while True:
+            circuits = self.open_circuits()
+            if not circuits: return True, ""
+            names, pause = ", ".join(sorted(circuits)), max(1.0, max(circuits.values()))
+            if self.circuit_waited + pause > self.max_pause or (self.should_cancel and self.should_cancel()):
+                return False, f"circuit open for {names}"
+            print(f"INFO: Circuit open for {names}. Pausing {pause:.0f}s before '{mission.name}'.")
+            self.sleep(pause)
+            self.circuit_waited += pause
+
+    # --- Iteration ---
+
+    def __iter__(self):
+        """Yields missions in schedule order, deferring those the budget or rate capacity cannot cover."""
+        while self.pending:
+            mission = self.pending.pop(0)
+            fits, reason = self._fits_budget(mission)
+            if fits and not self._wait_for_capacity(mission):
+                if self.is_high_priority(mission):
+                    print(f"WARNING: LLM capacity still exhausted; running high-priority '{mission.name}' anyway.")
+                else:
+                    fits, reason = False, "hourly LLM capacity exhausted"
+            if fits: fits, reason = self._wait_for_circuits(mission)
+            if not fits:
+                self.defer(mission, reason)
+                continue
+            yield mission
+
+    def defer(self, mission: Mission, reason: str):
+        print(f"INFO: Deferring '{mission.name}' (priority {mission.priority}): {reason}.")
+        self.deferred.append(mission)
+
+    def record(self, mission: Mission, counters: dict, fresh: bool = True):
+        """Feeds a finished mission's actual counters (from the metrics registry) back into the cost model."""
+        counters = counters or {}
+        for k in self.used: self.used[k] += counters.get(k, 0)
+        self.llm_history.append((time.time(), counters.get("llm_calls", 0)))
+        if fresh:
+            for k in self.observed: self.observed[k] += counters.get(k, 0)
+            self.observed_missions += 1
+
+    def summary(self) -> str:
+        used = ", ".join(f"{k} {v}" + (f"/{self.budget[k]}" if k in self.budget else "") for k, v in self.used.items())
+        return f"Used: {used}. Deferred missions: {len(self.deferred)}."
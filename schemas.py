@@ -44,4 +44,25 @@ CYCLING_SCHEMA = ['event', 'festivalName', 'imageURL', 'raceVideo', 'type', 'dat
 # NEW: Schema for general Fitness Racing events
 FITNESS_RACING_SCHEMA = ['event', 'festivalName', 'imageURL', 'raceVideo', 'type', 'date', 'city', 'organiser', 'participationType', 'firstEdition', 'lastEdition', 'countEditions', 'mode', 'raceAccredition', 'theme', 'numberOfparticipants', 'startTime', 'scenic', 'registrationCost', 'ageLimitation', 'eventWebsite', 'organiserWebsite', 'bookingLink', 'newsCoverage', 'lastDate', 'participationCriteria', 'refundPolicy', 'organiserRating', 'standardTag', 'region', 'approvalStatus', 'difficultyLevel', 'month', 'primaryKey', 'latitude', 'longitude', 'country', 'editionYear', 'aidStations', 'restrictedTraffic', 'user_id']
 
-BLACKLISTED_DOMAINS = ["facebook.com", "instagram.com", "twitter.com", "x.com", "linkedin.com", "pinterest.com", "youtube.com", "tiktok.com", "indiamart.com", "allevents.in", "wikipedia.org", "about.com", "worldsmarathons.com", "triathlon-database.com", "triathlon.org", "strava.com", "podcasts.apple.com", "racingtheplanetstore.com", "aims-worldrunning.org/calendar", "reddit.com"]
\ No newline at end of file
+BLACKLISTED_DOMAINS = ["facebook.com", "instagram.com", "twitter.com", "x.com", "linkedin.com", "pinterest.com", "youtube.com", "tiktok.com", "indiamart.com", "allevents.in", "wikipedia.org", "about.com", "worldsmarathons.com", "triathlon-database.com", "triathlon.org", "strava.com", "podcasts.apple.com", "racingtheplanetstore.com", "aims-worldrunning.org/calendar", "reddit.com"]
+
+# Field scope: festival-level fields describe the whole event and are extracted once per festival, then shared
+# by all of its variants; every other field is variant-level and extracted per variant.
+FESTIVAL_LEVEL_FIELDS = [
+    'city', 'state', 'region', 'country', 'organiser', 'organiserWebsite', 'eventWebsite', 'bookingLink',
+    'firstEdition', 'lastEdition', 'countEditions', 'editionYear', 'mode', 'refundPolicy', 'newsCoverage',
+    'registrationOpentag', 'eventConcludedtag'
+]
+
+# spaCy entity types a passage must contain to be retrieved for a typed field (see INDEX_ENTITY_TYPES in config.py).
+# Fields not listed here are retrieved from the whole corpus.
+FIELD_ENTITY_TYPES = {
+    "date": ["DATE"], "lastDate": ["DATE"], "firstEdition": ["DATE"],
+    "startTime": ["TIME"],
+    "registrationCost": ["MONEY"],
+    "city": ["GPE"], "state": ["GPE"], "country": ["GPE"], "swimmingLocation": ["GPE"],
+    "swimDistance": ["QUANTITY"], "cyclingDistance": ["QUANTITY"], "runningDistance": ["QUANTITY"],
+    "cyclingElevationgain": ["QUANTITY"], "runningElevationgain": ["QUANTITY"], "runningElevationloss": ["QUANTITY"],
+    "waterTemperature": ["QUANTITY"],
+    "swimCutoff": ["TIME", "QUANTITY"], "cycleCutoff": ["TIME", "QUANTITY"], "runCutoff": ["TIME", "QUANTITY"]
+}
@@ -0,0 +1,134 @@
+# shard_manifest.py
+# This file contains the SQLite coordinator for sharded runs. A run's missions are written once (in scheduler
+# order) and worker processes claim them atomically under a renewable lease. Missions sharing a knowledge-cache
+# key are never in flight at the same time, so the second one reuses the first one's cache instead of repeating
+# the analysis. Missions whose worker died are re-claimed once their lease expires.
+
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+
+MISSION_STATUSES = ("pending", "running", "done", "failed", "skipped")
+
+
+class ShardManifest:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS runs (id TEXT PRIMARY KEY, input_file TEXT, created_at REAL, "
+                         "merged_at REAL, output_files TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS missions (run_id TEXT NOT NULL, idx INTEGER NOT NULL, "
+                         "name TEXT, race_type TEXT, priority INTEGER, cache_key TEXT, race TEXT NOT NULL, "
+                         "status TEXT NOT NULL, worker_id TEXT, lease_until REAL, attempts INTEGER NOT NULL "
+                         "DEFAULT 0, part_file TEXT, error TEXT, started_at REAL, finished_at REAL, "
+                         "PRIMARY KEY (run_id, idx))")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_missions_claim ON missions (run_id, status, idx)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row) -> dict | None:
+        if row is None: return None
+        mission = dict(row)
+        mission["race"] = json.loads(mission["race"])
+        return mission
+
+    # --- Run setup ---
+
+    def create_run(self, missions: list, input_file: str = None, run_id: str = None, cache_key=None) -> str:
+        """`missions` are scheduler.Mission objects in run order; `cache_key(name)` groups missions sharing a cache."""
+        run_id = run_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT INTO runs (id, input_file, created_at) VALUES (?, ?, ?)",
+                         (run_id, input_file, time.time()))
+            for idx, mission in enumerate(missions):
+                key = cache_key(mission.name) if cache_key and mission.name else None
+                conn.execute("INSERT INTO missions (run_id, idx, name, race_type, priority, cache_key, race, status) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, 'pending')",
+                             (run_id, idx, mission.name, mission.race_type, mission.priority, key,
+                              json.dumps(mission.race_info)))
+            conn.execute("COMMIT")
+        return run_id
+
+    def latest_run(self) -> str | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT id FROM runs ORDER BY created_at DESC LIMIT 1").fetchone()
+        return row["id"] if row else None
+
+    # --- Workers ---
+
+    def claim_next(self, run_id: str, worker_id: str, lease_seconds: float, max_attempts: int) -> dict | None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE missions SET status = 'failed', error = 'worker lost too many times', finished_at = ? "
+                         "WHERE run_id = ? AND status = 'running' AND lease_until < ? AND attempts >= ?",
+                         (now, run_id, now, max_attempts))
+            row = conn.execute(
+                "SELECT idx FROM missions m WHERE run_id = ? "
+                "AND (status = 'pending' OR (status = 'running' AND lease_until < ?)) "
+                "AND (cache_key IS NULL OR NOT EXISTS (SELECT 1 FROM missions o WHERE o.run_id = m.run_id "
+                "AND o.cache_key = m.cache_key AND o.idx != m.idx AND o.status = 'running' AND o.lease_until >= ?)) "
+                "ORDER BY idx LIMIT 1", (run_id, now, now)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE missions SET status = 'running', worker_id = ?, lease_until = ?, started_at = ?, "
+                         "attempts = attempts + 1 WHERE run_id = ? AND idx = ?",
+                         (worker_id, now + lease_seconds, now, run_id, row["idx"]))
+            mission = conn.execute("SELECT * FROM missions WHERE run_id = ? AND idx = ?",
+                                   (run_id, row["idx"])).fetchone()
+            conn.execute("COMMIT")
+        return self._to_dict(mission)
+
+    def renew_leases(self, worker_id: str, lease_seconds: float) -> int:
+        with self._connect() as conn:
+            cur = conn.execute("UPDATE missions SET lease_until = ? WHERE worker_id = ? AND status = 'running'",
+                               (time.time() + lease_seconds, worker_id))
+            return cur.rowcount
+
+    def complete(self, run_id: str, idx: int, worker_id: str, status: str, part_file: str = None,
+                 error: str = None) -> bool:
+        """Records the outcome; False if the mission was re-claimed by another worker after this one's lease lapsed."""
+        if status not in MISSION_STATUSES: raise ValueError(f"Unknown mission status '{status}'.")
+        with self._connect() as conn:
+            cur = conn.execute("UPDATE missions SET status = ?, part_file = ?, error = ?, finished_at = ?, "
+                               "lease_until = NULL WHERE run_id = ? AND idx = ? AND worker_id = ? "
+                               "AND status = 'running'", (status, part_file, error, time.time(), run_id, idx, worker_id))
+            return cur.rowcount > 0
+
+    def release(self, worker_id: str):
+        """Hands a stopping worker's in-flight missions straight back instead of waiting for the lease to expire."""
+        with self._connect() as conn:
+            conn.execute("UPDATE missions SET status = 'pending', worker_id = NULL, lease_until = NULL "
+                         "WHERE worker_id = ? AND status = 'running'", (worker_id,))
+
+    # --- Progress & merge ---
+
+    def counts(self, run_id: str) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM missions WHERE run_id = ? GROUP BY status",
+                                (run_id,)).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def missions(self, run_id: str, status: str = None) -> list[dict]:
+        query, params = "SELECT * FROM missions WHERE run_id = ?", [run_id]
+        if status: query, params = query + " AND status = ?", params + [status]
+        with self._connect() as conn:
+            return [self._to_dict(row) for row in conn.execute(query + " ORDER BY idx", params).fetchall()]
+
+    def mark_merged(self, run_id: str, output_files: list):
+        with self._connect() as conn:
+            conn.execute("UPDATE runs SET merged_at = ?, output_files = ? WHERE id = ?",
+                         (time.time(), json.dumps(output_files), run_id))
@@ -0,0 +1,246 @@
+# shard_runner.py
+# Sharded execution of one race list across several processes (or machines sharing CRAWL4AI_DATA_DIR).
+# Missions are claimed from a SQLite manifest (shard_manifest.py); each finished mission's rows are written
+# atomically to its own part file, and `merge` stitches the parts into one CSV per race type in mission order.
+#
+#   python shard_runner.py run --input-file races.json --processes 4       # init + local workers + merge
+#   python shard_runner.py init --input-file races.json                    # prints the run id
+#   python shard_runner.py work --run-id <id> --worker-name nodeA-1        # on each machine / process
+#   python shard_runner.py status --run-id <id>
+#   python shard_runner.py merge --run-id <id>
+#
+# Multi-machine runs need the data directory (caches, manifest, part files) on storage with working POSIX
+# file locks, which SQLite relies on. Each worker keeps its own VectorDB under vector_db/shards/<worker-name>,
+# since Chroma's persistent store is not safe for concurrent writers.
+
+import io
+import os
+import csv
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import threading
+import traceback
+import subprocess
+from datetime import datetime
+
+from config import (
+    SHARD_MANIFEST_DB, SHARD_PARTS_DIR, SHARD_LEASE_SECONDS, SHARD_HEARTBEAT_SECONDS, SHARD_MAX_ATTEMPTS,
+    RACE_INPUT_FILE, OUTPUT_DIR, CRAWL_CACHE_DIR, VECTOR_DB_PATH, METRICS_DIR
+)
+from atomic_io import write_text_atomic
+from knowledge import get_caching_key
+from metrics import metrics
+from resilience import dependencies, CircuitOpenError
+from scheduler import MissionScheduler
+from shard_manifest import ShardManifest
+
+POLL_SECONDS = 5
+
+
+def init_run(manifest: ShardManifest, input_file: str, run_id: str = None) -> str:
+    with open(input_file, 'r', encoding='utf-8') as f:
+        races = json.load(f)
+    # Same global (Priority, Deadline) order as a single-process run; budgets are not enforced across shards, so
+    # missions whose deadline has passed are queued after all live ones instead of being deferred.
+    scheduler = MissionScheduler(races)
+    missions = scheduler.pending + scheduler.deferred
+    run_id = manifest.create_run(missions, input_file=os.path.abspath(input_file), run_id=run_id,
+                                 cache_key=get_caching_key)
+    print(f"INFO: Created sharded run {run_id} with {len(missions)} missions in {manifest.db_path}")
+    return run_id
+
+
+def start_lease_renewal(manifest: ShardManifest, worker_id: str, stop_event: threading.Event) -> threading.Thread:
+    def renew():
+        while not stop_event.wait(SHARD_HEARTBEAT_SECONDS):
+            try:
+                manifest.renew_leases(worker_id, SHARD_LEASE_SECONDS)
+            except Exception as e:
+                print(f"WARNING: Lease renewal failed: {e}")
+    thread = threading.Thread(target=renew, name="lease-renewal", daemon=True)
+    thread.start()
+    return thread
+
+
+def part_path(run_id: str, mission: dict) -> str:
+    return os.path.join(SHARD_PARTS_DIR, run_id, f"{mission['idx']:06d}_{mission['race_type'].replace(' ', '-')}.csv")
+
+
+def serve_mission(manifest: ShardManifest, run_id: str, worker_id: str, mission: dict, agents: dict):
+    import main  # Deferred: loads the agent stack only in worker processes
+    from row_formatter import compile_schema
+    race_info, race_type, idx = mission["race"], mission["race_type"], mission["idx"]
+    schema = main.SCHEMA_MAP.get(race_type)
+    if not schema or not mission["name"]:
+        reason = f"unknown race type '{race_type}'" if not schema else "no 'Festival' name"
+        print(f"WARNING: Skipping mission #{idx + 1}: {reason}.")
+        manifest.complete(run_id, idx, worker_id, "skipped", error=reason)
+        return
+    if race_type not in agents: agents[race_type] = (main.build_agent(schema), compile_schema(schema))
+    agent, compiled_schema = agents[race_type]
+    buffer = io.StringIO(newline='')
+    writer = csv.DictWriter(buffer, fieldnames=schema)
+    writer.writeheader()
+    status, part_file, error = "failed", None, None
+    try:
+        success, _, _ = main.run_mission(agent, compiled_schema, writer, race_info, race_type,
+                                         priority=mission["priority"])
+        if success:
+            part_file = part_path(run_id, mission)
+            os.makedirs(os.path.dirname(part_file), exist_ok=True)
+            write_text_atomic(part_file, buffer.getvalue())
+            status = "done"
+        else:
+            error = "No data could be built."
+    except CircuitOpenError as e:
+        # Back to the queue: another worker (or this one, once the circuit recovers) picks it up again.
+        status, error = "pending", str(e)
+    except Exception as e:
+        traceback.print_exc()
+        error = f"{type(e).__name__}: {e}"
+    if not manifest.complete(run_id, idx, worker_id, status, part_file=part_file, error=error):
+        print(f"WARNING: Mission #{idx + 1} was re-claimed by another worker after this worker's lease lapsed.")
+
+
+def work(manifest: ShardManifest, run_id: str, worker_name: str):
+    from agent import load_shared_models
+    worker_id = f"{worker_name}:{os.getpid()}"
+    os.makedirs(CRAWL_CACHE_DIR, exist_ok=True)
+    load_shared_models(vector_db_path=os.path.join(VECTOR_DB_PATH, "shards", worker_name))
+    stop_event = threading.Event()
+    start_lease_renewal(manifest, worker_id, stop_event)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    metrics.reset()
+    agents, served = {}, 0
+    print(f"INFO: Worker {worker_id} serving run {run_id}.")
+    try:
+        while True:
+            mission = manifest.claim_next(run_id, worker_id, SHARD_LEASE_SECONDS, SHARD_MAX_ATTEMPTS)
+            if mission is None:
+                counts = manifest.counts(run_id)
+                if not counts.get("pending") and not counts.get("running"): break
+                # Remaining missions are in flight elsewhere (or wait on a shared cache key); stay around in
+                # case their worker dies and the lease expires.
+                time.sleep(POLL_SECONDS)
+                continue
+            serve_mission(manifest, run_id, worker_id, mission, agents)
+            served += 1
+            circuits = dependencies.open_circuits()
+            if circuits:
+                pause = max(circuits.values())
+                print(f"INFO: Circuit open for {', '.join(sorted(circuits))}. Worker pausing {pause:.0f}s.")
+                time.sleep(pause)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        manifest.release(worker_id)
+        try:
+            json_path, _ = metrics.export(METRICS_DIR, f"shard_{run_id}_{worker_name}")
+            print(f"INFO: Worker metrics written to {json_path}")
+        except OSError as e:
+            print(f"WARNING: Could not write worker metrics: {e}")
+        if dependencies.dependencies: print(f"INFO: Circuit breakers: {dependencies.summary()}")
+        print(f"INFO: Worker {worker_id} stopped after {served} mission(s).")
+
+
+def merge(manifest: ShardManifest, run_id: str, output_dir: str, partial: bool = False) -> list[str]:
+    """Concatenates the part files into one CSV per race type, in mission order."""
+    counts = manifest.counts(run_id)
+    if (counts.get("pending") or counts.get("running")) and not partial:
+        print(f"[ERROR] Run {run_id} is not finished yet ({counts}). Use --partial to merge what is done.")
+        return []
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    output_files, handles = [], {}
+    try:
+        for mission in manifest.missions(run_id, status="done"):
+            race_type = mission["race_type"]
+            with open(mission["part_file"], 'r', encoding='utf-8', newline='') as f:
+                header, _, body = f.read().partition('\n')
+            if race_type not in handles:
+                path = os.path.join(output_dir, f"Crawl4AI_v2_{race_type}_{timestamp}_{run_id}.csv")
+                handles[race_type] = open(path, 'w', encoding='utf-8', newline='')
+                handles[race_type].write(header + '\n')
+                output_files.append(path)
+            handles[race_type].write(body)
+    finally:
+        for f in handles.values(): f.close()
+    manifest.mark_merged(run_id, output_files)
+    for path in output_files: print(f"INFO: Wrote {path}")
+    failed = manifest.missions(run_id, status="failed")
+    if failed:
+        print("\nSummary of Failed Missions:")
+        for mission in failed: print(f"  - {mission['name']}: {mission['error']}")
+    return output_files
+
+
+def run_local(manifest: ShardManifest, input_file: str, processes: int, output_dir: str) -> list[str]:
+    run_id = init_run(manifest, input_file)
+    host = socket.gethostname()
+    workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "work", "--run-id", run_id,
+                                 "--worker-name", f"{host}-w{i}", "--db", manifest.db_path])
+               for i in range(processes)]
+    try:
+        for process in workers: process.wait()
+    except KeyboardInterrupt:
+        print("\nINFO: Stopping workers...")
+        for process in workers: process.terminate()
+        for process in workers: process.wait()
+        return []
+    print(f"INFO: All workers finished: {manifest.counts(run_id)}")
+    return merge(manifest, run_id, output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl4AI sharded runner")
+    parser.add_argument("--db", type=str, default=SHARD_MANIFEST_DB, help="Path to the shard manifest database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Create a run, work it with local processes, then merge.")
+    run_parser.add_argument("--input-file", type=str, default=RACE_INPUT_FILE)
+    run_parser.add_argument("--processes", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    run_parser.add_argument("--output-dir", type=str, default=OUTPUT_DIR)
+    init_parser = commands.add_parser("init", help="Create a run from a race list and print its id.")
+    init_parser.add_argument("--input-file", type=str, default=RACE_INPUT_FILE)
+    init_parser.add_argument("--run-id", type=str, default=None)
+    work_parser = commands.add_parser("work", help="Claim and run missions until the run is drained.")
+    work_parser.add_argument("--run-id", type=str, default=None, help="Defaults to the latest run.")
+    work_parser.add_argument("--worker-name", type=str, default=f"{socket.gethostname()}-{os.getpid()}",
+                             help="Stable names let a worker reuse its VectorDB across runs.")
+    for name in ("status", "merge"):
+        sub = commands.add_parser(name)
+        sub.add_argument("--run-id", type=str, default=None, help="Defaults to the latest run.")
+        if name == "merge":
+            sub.add_argument("--output-dir", type=str, default=OUTPUT_DIR)
+            sub.add_argument("--partial", action="store_true", help="Merge even if missions are still pending.")
+    # Also accept --db after the subcommand (as the local launcher passes it).
+    for sub in (run_parser, init_parser, work_parser, *[commands.choices[n] for n in ("status", "merge")]):
+        sub.add_argument("--db", type=str, default=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    manifest = ShardManifest(args.db)
+    if args.command == "run":
+        run_local(manifest, args.input_file, args.processes, args.output_dir)
+        return
+    if args.command == "init":
+        print(init_run(manifest, args.input_file, args.run_id))
+        return
+    run_id = args.run_id or manifest.latest_run()
+    if not run_id:
+        print("[ERROR] No sharded run found. Create one with: python shard_runner.py init --input-file races.json")
+        sys.exit(1)
+    if args.command == "work":
+        work(manifest, run_id, args.worker_name)
+    elif args.command == "status":
+        counts = manifest.counts(run_id)
+        print(f"Run {run_id}: " + ", ".join(f"{status} {n}" for status, n in sorted(counts.items())))
+    else:
+        merge(manifest, run_id, args.output_dir, partial=args.partial)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# streaming_download.py
+# Bounded page downloads for the crawler. Responses are streamed in chunks and abandoned as soon as the declared
+# content type, or the first bytes (PDF, image, archive and other binary signatures), show they are not a text
+# page. Accepted bodies are decoded incrementally as they arrive and cut off at a byte cap, so a crawler slot
+# never holds more than about CRAWL_MAX_BYTES of one page, whatever the search returned.
+
+import re
+import time
+import codecs
+
+import requests
+
+from config import CRAWL_MAX_BYTES, CRAWL_CHUNK_BYTES, CRAWL_TEXT_CONTENT_TYPES
+from metrics import metrics
+
+BINARY_SIGNATURES = {b"%PDF-": "PDF", b"PK\x03\x04": "ZIP/Office document", b"\x89PNG": "PNG image",
+                     b"\xff\xd8\xff": "JPEG image", b"GIF8": "GIF image", b"\x1f\x8b": "gzip archive",
+                     b"RIFF": "RIFF media", b"\xd0\xcf\x11\xe0": "Office document"}
+META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.IGNORECASE)
+
+
+def declared_type(response) -> tuple[str | None, str | None]:
+    """(mime type, charset) from the Content-Type header."""
+    header = response.headers.get("Content-Type")
+    if not header: return None, None
+    mime, _, params = header.partition(";")
+    charset = re.search(r'charset=["\']?([\w.:-]+)', params, re.IGNORECASE)
+    return mime.strip().lower() or None, charset.group(1) if charset else None
+
+
+def sniff_binary(head: bytes) -> str | None:
+    """Names the binary format the first bytes of a body belong to, or None if they look like text."""
+    for signature, kind in BINARY_SIGNATURES.items():
+        if head.startswith(signature): return kind
+    return "binary content" if b"\x00" in head[:1024] else None
+
+
+def _decoder(charset: str | None, head: bytes):
+    if not charset:
+        match = META_CHARSET.search(head[:4096])
+        charset = match.group(1).decode("ascii", "ignore") if match else "utf-8"
+    try:
+        return codecs.getincrementaldecoder(codecs.lookup(charset).name)(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def _reject(url: str, reason: str) -> None:
+    metrics.incr("crawl_rejected_content")
+    print(f"  - Skipping {url}: {reason} is not a text page.")
+    return None
+
+
+def download_text(url: str, timeout: float, headers: dict = None, max_bytes: int = CRAWL_MAX_BYTES,
+                  allowed_types=CRAWL_TEXT_CONTENT_TYPES, chunk_size: int = CRAWL_CHUNK_BYTES) -> str | None:
+    """
+    Streams `url` and returns its text, truncated at `max_bytes`, or None for non-text content.
+    HTTP errors raise as with requests; a body still arriving after `timeout` seconds raises requests.Timeout.
+    """
+    deadline = time.monotonic() + timeout
+    with requests.get(url, timeout=timeout, headers=headers, stream=True) as response:
+        response.raise_for_status()
+        mime, charset = declared_type(response)
+        if mime and mime not in allowed_types: return _reject(url, f"content type '{mime}'")
+        decoder, pieces, received = None, [], 0
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk: continue
+            if decoder is None:
+                kind = sniff_binary(chunk)
+                if kind: return _reject(url, kind)
+                decoder = _decoder(charset, chunk)
+            chunk = chunk[:max_bytes - received]
+            received += len(chunk)
+            pieces.append(decoder.decode(chunk))
+            if received >= max_bytes:
+                metrics.incr("crawl_truncated")
+                print(f"  - WARNING: {url} is over {max_bytes // 1024} KB; keeping the first {max_bytes // 1024} KB.")
+                break
+            if time.monotonic() > deadline: raise requests.Timeout(f"Download of {url} took longer than {timeout}s")
+        if decoder is None: return None
+        pieces.append(decoder.decode(b"", final=True))
+    metrics.incr("crawl_bytes", received)
+    return "".join(pieces) or None
@@ -9,64 +9,163 @@ import subprocess
 import time
 import uuid
 import io
+from datetime import datetime
+from collections import deque
 from pathlib import Path
 from dotenv import dotenv_values
 
 # --- Configuration ---
 from config import (
-    CRAWL_CACHE_DIR, KNOWLEDGE_CACHE_DIR, RACE_INPUT_FILE, OUTPUT_DIR
+    CRAWL_CACHE_DIR, KNOWLEDGE_CACHE_DIR, RACE_INPUT_FILE, OUTPUT_DIR, JOB_QUEUE_DB, JOB_WORKERS
 )
-from gemini import DEFAULT_INPUT_FOLDER
+from job_queue import JobQueue, ACTIVE_STATUSES
+from knowledge_store import open_knowledge_store
+from progress import read_new_lines, new_progress_state, apply_events
 
 # --- App Directories (Defined at the top for reliability) ---
 TEMP_DIR = Path("./temp_streamlit_files")
 TEMP_DIR.mkdir(exist_ok=True)
 LOG_DIR = Path("./streamlit_logs")
 LOG_DIR.mkdir(exist_ok=True)
+LOG_TAIL_LINES = 400  # Only the newest lines are kept in memory and rendered
+JOB_LIST_LIMIT = 20
+JOB_STATUS_TO_AGENT_STATUS = {"queued": "Queued", "running": "Running", "finished": "Finished",
+                              "cancelled": "Terminated", "failed": "Error"}
 
 # --- App State Management ---
 if 'agent_status' not in st.session_state:
-    st.session_state.agent_status = "Idle"  # Idle, Running, Finished, Terminated, Error
-if 'active_process' not in st.session_state:
-    st.session_state.active_process = None
+    st.session_state.agent_status = "Idle"  # Idle, Queued, Running, Finished, Terminated, Error
+if 'active_job_id' not in st.session_state:
+    st.session_state.active_job_id = None
 if 'log_file' not in st.session_state:
     st.session_state.log_file = None
 if 'final_log_content' not in st.session_state:
     st.session_state.final_log_content = ""
 if 'output_files' not in st.session_state:
     st.session_state.output_files = []
-if 'files_before_run' not in st.session_state:
-    st.session_state.files_before_run = set()
 if 'env_vars' not in st.session_state:
     st.session_state.env_vars = {}
+if 'log_offset' not in st.session_state:
+    st.session_state.log_offset = 0
+if 'log_tail' not in st.session_state:
+    st.session_state.log_tail = deque(maxlen=LOG_TAIL_LINES)
+if 'progress_file' not in st.session_state:
+    st.session_state.progress_file = None
+if 'progress_offset' not in st.session_state:
+    st.session_state.progress_offset = 0
+if 'progress_state' not in st.session_state:
+    st.session_state.progress_state = new_progress_state()
 
 
 # --- Helper Functions ---
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(JOB_QUEUE_DB)
+
+
+@st.cache_resource
+def get_spawned_workers():
+    """Worker processes started by this server, per job kind (shared by all sessions)."""
+    return {kind: [] for kind in JOB_WORKERS}
+
+
+def ensure_workers(kind):
+    """Starts warm workers for `kind` until JOB_WORKERS[kind] are alive. Workers outlive the UI session."""
+    spawned = get_spawned_workers()
+    spawned[kind] = [p for p in spawned[kind] if p.poll() is None]
+    alive = max(len(spawned[kind]), len(get_job_queue().live_workers(kind)))
+    for n in range(JOB_WORKERS.get(kind, 1) - alive):
+        worker_log = LOG_DIR / f"worker_{kind}_{uuid.uuid4().hex[:8]}.log"
+        with open(worker_log, 'w', encoding='utf-8') as log_f:
+            spawned[kind].append(subprocess.Popen([sys.executable, "-u", "worker.py", "--kind", kind],
+                                                  stdout=log_f, stderr=subprocess.STDOUT, env=os.environ.copy(),
+                                                  start_new_session=True))
+
+
+def watch_job(job_id):
+    """Points the status panel, log tail and progress readers at a job."""
+    job = get_job_queue().get_job(job_id)
+    st.session_state.active_job_id = job_id
+    st.session_state.log_file = Path(job["log_file"]) if job and job["log_file"] else None
+    st.session_state.progress_file = Path(job["progress_file"]) if job and job["progress_file"] else None
+    st.session_state.output_files = job["output_files"] if job else []
+    st.session_state.agent_status = JOB_STATUS_TO_AGENT_STATUS.get(job["status"], "Idle") if job else "Idle"
+    st.session_state.final_log_content = ""
+    st.session_state.log_offset, st.session_state.progress_offset = 0, 0
+    st.session_state.log_tail = deque(maxlen=LOG_TAIL_LINES)
+    st.session_state.progress_state = new_progress_state()
+    if st.session_state.agent_status not in ("Queued", "Running"):
+        st.session_state.final_log_content = read_log_file()
+        update_progress_state()
+
+
+def submit_job(kind, payload, priority, job_id):
+    """Enqueues a job with its own log/progress files, makes sure workers are up, and starts watching it."""
+    queue = get_job_queue()
+    queue.enqueue(kind, {**payload, "output_dir": OUTPUT_DIR}, priority=int(priority),
+                  log_file=str((LOG_DIR / f"job_{job_id}.log").resolve()),
+                  progress_file=str((LOG_DIR / f"job_{job_id}.progress.jsonl").resolve()), job_id=job_id,
+                  secrets=dict(st.session_state.env_vars))
+    ensure_workers(kind)
+    watch_job(job_id)
+
+
 def read_log_file():
-    """Reads the current log file's content safely."""
+    """Reads only the log bytes appended since the last call and returns the bounded tail."""
     if st.session_state.log_file and Path(st.session_state.log_file).exists():
-        try:
-            with open(st.session_state.log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
-        except Exception:
-            return "Reading log file..."
+        lines, st.session_state.log_offset = read_new_lines(st.session_state.log_file, st.session_state.log_offset)
+        st.session_state.log_tail.extend(lines)
+        return "\n".join(st.session_state.log_tail)
     return "Process has not started yet."
 
 
-def get_process_environment():
-    """Prepares the environment variables for the subprocess."""
-    env = os.environ.copy()
-    if st.session_state.env_vars:
-        env.update(st.session_state.env_vars)
-    return env
-
-
-def get_files_in_dir(directory):
-    """Returns a set of all CSV files in a directory."""
-    dir_path = Path(directory)
-    if not dir_path.is_dir():
-        dir_path.mkdir(exist_ok=True)
-    return {str(f) for f in dir_path.glob("*.csv")}
+def update_progress_state():
+    """Folds newly appended progress events into the session's progress summary."""
+    if st.session_state.progress_file and Path(st.session_state.progress_file).exists():
+        lines, st.session_state.progress_offset = read_new_lines(st.session_state.progress_file,
+                                                                 st.session_state.progress_offset)
+        apply_events(st.session_state.progress_state, lines)
+    return st.session_state.progress_state
+
+
+def render_progress(progress_state):
+    if not progress_state["total"]: return
+    done, total = progress_state["completed"], progress_state["total"]
+    current = f" — working on **{progress_state['current']}**" if progress_state["current"] else ""
+    st.progress(min(done / total, 1.0), text=f"{done}/{total} {progress_state['label']} missions complete{current}")
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Completed", done)
+    c2.metric("Failed", progress_state["failed"])
+    if progress_state["started_at"]: c3.metric("Elapsed", f"{time.time() - progress_state['started_at']:.0f}s")
+    if progress_state["stages"]:
+        st.dataframe(pd.DataFrame([{"stage": name, "calls": count, "total_s": round(seconds, 1),
+                                    "avg_s": round(seconds / count, 2)}
+                                   for name, (count, seconds) in progress_state["stages"].items()]),
+                     hide_index=True, use_container_width=True)
+
+
+def render_job_queue():
+    queue = get_job_queue()
+    jobs = queue.list_jobs(JOB_LIST_LIMIT)
+    workers = queue.live_workers()
+    st.caption(f"Live workers: " + (", ".join(f"{kind} × {sum(w['kind'] == kind for w in workers)}"
+                                              for kind in JOB_WORKERS) if workers else "none"))
+    if not jobs:
+        st.info("No jobs submitted yet.")
+        return
+    for job in jobs:
+        c1, c2, c3, c4 = st.columns([3, 2, 1, 1])
+        created = datetime.fromtimestamp(job["created_at"]).strftime("%H:%M:%S") if job["created_at"] else ""
+        marker = " 👁" if job["id"] == st.session_state.active_job_id else ""
+        c1.markdown(f"`{job['id']}` {job['kind']} (p{job['priority']}){marker}")
+        c2.write(f"{job['status']}{' (cancelling)' if job['cancel_requested'] and job['status'] == 'running' else ''}"
+                 f" · {created}")
+        if c3.button("View", key=f"view_{job['id']}"):
+            watch_job(job["id"])
+            st.rerun()
+        if job["status"] in ACTIVE_STATUSES and c4.button("Cancel", key=f"cancel_{job['id']}"):
+            queue.request_cancel(job["id"])
+            st.rerun()
 
 
 # --- UI Layout ---
@@ -97,8 +196,9 @@ with st.sidebar:
 
         if st.button("Clear Knowledge Cache"):
             try:
+                # Legacy JSON caches go too, or they would be imported into the store again.
                 if Path(KNOWLEDGE_CACHE_DIR).exists(): shutil.rmtree(KNOWLEDGE_CACHE_DIR)
-                Path(KNOWLEDGE_CACHE_DIR).mkdir(exist_ok=True)
+                open_knowledge_store(migrate_from=None).delete()
                 st.success("Cleared Knowledge Cache.")
             except Exception as e:
                 st.error(f"Error: {e}")
@@ -116,17 +216,15 @@ with col1:
         st.caption(f"Output files will be saved to: **{os.path.abspath(OUTPUT_DIR)}**")
 
         st.subheader("2. Execution")
-        is_running = st.session_state.agent_status == "Running"
-        if st.button("▶️ Start Mistral Agent", disabled=is_running):
+        mistral_priority = st.number_input("Priority (higher runs first)", value=0, step=1, key="mistral_priority")
+        if st.button("▶️ Queue Mistral Agent"):
             if not st.session_state.env_vars:
                 st.error("Please upload a .env file first.")
             elif not input_file:
                 st.error("Please upload an input data file.")
             else:
-                st.session_state.output_files = []
-                st.session_state.log_file = LOG_DIR / f"run_{uuid.uuid4()}.log"
-                st.session_state.final_log_content = ""
-                temp_input_path = TEMP_DIR / RACE_INPUT_FILE
+                job_id = uuid.uuid4().hex[:12]
+                temp_input_path = (TEMP_DIR / f"{job_id}_{RACE_INPUT_FILE}").resolve()
 
                 try:
                     file_contents = input_file.getvalue()
@@ -140,16 +238,7 @@ with col1:
                         with open(temp_input_path, "wb") as f:
                             f.write(file_contents)
 
-                    st.session_state.files_before_run = get_files_in_dir(OUTPUT_DIR)
-                    command = [sys.executable, "-u", "main.py", "--output-dir", OUTPUT_DIR, "--input-file",
-                               str(temp_input_path)]
-
-                    with open(st.session_state.log_file, 'w', encoding='utf-8') as log_f:
-                        process = subprocess.Popen(command, stdout=log_f, stderr=subprocess.STDOUT,
-                                                   env=get_process_environment(), text=True, encoding='utf-8')
-
-                    st.session_state.active_process = process
-                    st.session_state.agent_status = "Running"
+                    submit_job("mistral", {"input_file": str(temp_input_path)}, mistral_priority, job_id)
                     st.rerun()
                 except Exception as e:
                     st.error(f"Error during agent setup: {e}")
@@ -160,6 +249,7 @@ with col1:
                 st.success("Processing finished! You can now download your files.")
                 for file_path in st.session_state.output_files:
                     file = Path(file_path)
+                    if not file.exists(): continue
                     with open(file, "rb") as fp:
                         st.download_button(label=f"Download {file.name}", data=fp, file_name=file.name, mime="text/csv")
             else:
@@ -171,42 +261,38 @@ with col1:
         st.subheader("1. Inputs")
         uploaded_images = st.file_uploader("Upload Image Files", type=['png', 'jpg', 'jpeg'],
                                            accept_multiple_files=True)
-        st.caption(f"Image files will be temporarily saved to: **{os.path.abspath(DEFAULT_INPUT_FOLDER)}**")
+        st.caption(f"Image files will be temporarily saved under: **{os.path.abspath(TEMP_DIR / 'images')}**")
         st.caption(f"Result CSV will be saved to: **{os.path.abspath(OUTPUT_DIR)}**")
 
         st.subheader("2. Execution")
-        is_running = st.session_state.agent_status == "Running"
-        if st.button("▶️ Start Gemini Processor", disabled=is_running):
+        gemini_priority = st.number_input("Priority (higher runs first)", value=0, step=1, key="gemini_priority")
+        if st.button("▶️ Queue Gemini Processor"):
             if not st.session_state.env_vars:
                 st.error("Please upload a .env file first.")
             elif not uploaded_images:
                 st.error("Please upload at least one image.")
             else:
-                st.session_state.output_files = []
-                st.session_state.log_file = LOG_DIR / f"run_{uuid.uuid4()}.log"
-                st.session_state.final_log_content = ""
-                image_input_path = Path(DEFAULT_INPUT_FOLDER)
-                image_input_path.mkdir(exist_ok=True)
+                job_id = uuid.uuid4().hex[:12]
+                image_input_path = (TEMP_DIR / "images" / job_id).resolve()
+                image_input_path.mkdir(parents=True, exist_ok=True)
                 for image in uploaded_images:
                     with open(image_input_path / image.name, "wb") as f: f.write(image.getbuffer())
-
-                st.session_state.files_before_run = get_files_in_dir(OUTPUT_DIR)
-                command = [sys.executable, "-u", "gemini.py", "--output-dir", OUTPUT_DIR, "--input-dir",
-                           str(image_input_path)]
-
-                with open(st.session_state.log_file, 'w', encoding='utf-8') as log_f:
-                    process = subprocess.Popen(command, stdout=log_f, stderr=subprocess.STDOUT,
-                                               env=get_process_environment(), text=True, encoding='utf-8')
-                st.session_state.active_process = process
-                st.session_state.agent_status = "Running"
+                submit_job("gemini", {"input_dir": str(image_input_path)}, gemini_priority, job_id)
                 st.rerun()
 
+    with st.expander("Job Queue", expanded=True):
+        render_job_queue()
+
 with col2:
     st.header("Live Status & Logs")
 
     status = st.session_state.agent_status
+    is_active = status in ("Queued", "Running")
+    if st.session_state.active_job_id: st.caption(f"Watching job `{st.session_state.active_job_id}`")
     if status == "Idle":
         st.info("**Status:** Waiting to start a process.")
+    elif status == "Queued":
+        st.info("**Status:** Queued. Waiting for a free worker.")
     elif status == "Running":
         st.warning(f"**Status:** Running... Please wait.")
     elif status == "Finished":
@@ -216,36 +302,33 @@ with col2:
     elif status == "Error":
         st.error("**Status:** Process failed with an error. Check logs for details.")
 
-    if st.session_state.agent_status == "Running":
+    if is_active:
         if st.button("⏹️ Stop Active Process"):
-            if st.session_state.active_process:
-                st.session_state.active_process.terminate()
-                st.session_state.agent_status = "Terminated"
-                st.session_state.active_process = None
+            if st.session_state.active_job_id:
+                # Running jobs stop after the current mission/image; queued jobs are dropped immediately.
+                get_job_queue().request_cancel(st.session_state.active_job_id)
                 st.rerun()
 
-    log_content = st.session_state.final_log_content if status != "Running" else read_log_file()
-    st.text_area("Log Output", value=log_content, height=500, disabled=True, key="log_area")
+    render_progress(update_progress_state())
+    log_content = st.session_state.final_log_content if not is_active else read_log_file()
+    st.text_area(f"Log Output (last {LOG_TAIL_LINES} lines)", value=log_content, height=500, disabled=True,
+                 key="log_area")
+    if not is_active and st.session_state.log_file and Path(st.session_state.log_file).exists():
+        with open(st.session_state.log_file, "rb") as fp:
+            st.download_button("Download full log", data=fp, file_name=Path(st.session_state.log_file).name,
+                               mime="text/plain")
     st.caption(
         "Note: 'Telemetry' and 'huggingface_hub' messages are harmless warnings from libraries and can be safely ignored.")
 
 # --- Background Loop to Update UI State ---
-if st.session_state.agent_status == "Running":
-    process = st.session_state.active_process
-    if process and process.poll() is not None:
-        time.sleep(0.5)
+if st.session_state.agent_status in ("Queued", "Running"):
+    job = get_job_queue().get_job(st.session_state.active_job_id) if st.session_state.active_job_id else None
+    if job is None or job["status"] not in ACTIVE_STATUSES:
         st.session_state.final_log_content = read_log_file()
-
-        return_code = process.poll()
-        if return_code == 0:
-            st.session_state.agent_status = "Finished"
-            files_after_run = get_files_in_dir(OUTPUT_DIR)
-            st.session_state.output_files = sorted(list(files_after_run - st.session_state.files_before_run))
-        else:
-            st.session_state.agent_status = "Error"
-
-        st.session_state.active_process = None
+        st.session_state.agent_status = JOB_STATUS_TO_AGENT_STATUS.get(job["status"], "Error") if job else "Error"
+        st.session_state.output_files = job["output_files"] if job else []
         st.rerun()
     else:
+        st.session_state.agent_status = JOB_STATUS_TO_AGENT_STATUS[job["status"]]
         time.sleep(1.5)
         st.rerun()
\ No newline at end of file
@@ -0,0 +1,181 @@
+# url_ranker.py
+# This file contains the persistent domain reputation store and the local URL ranker used in URL selection.
+# After each mission, every crawled URL is labelled by whether it yielded high-confidence fields; the store keeps
+# per-domain crawl success, page yield and field yield, and a small logistic model is updated online from the
+# same labels. The ranker picks URLs by itself only when the boundary between selected and rejected is clear.
+
+import re
+import json
+import math
+import time
+import sqlite3
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from config import (
+    URL_RANKER_MIN_TRAINING, URL_RANKER_PRIMARY_PROB, URL_RANKER_SECONDARY_PROB, URL_RANKER_MARGIN,
+    URL_RANKER_LEARNING_RATE
+)
+
+# Starting weights (before any mission has been learned from): official-looking hosts and top search ranks win.
+PRIOR_WEIGHTS = {"bias": -1.0, "name_in_host": 2.5, "name_in_title": 1.0, "name_in_snippet": 0.5, "rank": 1.0,
+                 "shallow_path": 0.5, "domain_crawl_success": 1.0, "domain_field_yield": 2.0,
+                 "domain_page_yield": 0.5}
+NAME_STOPWORDS = {"the", "and", "for", "run", "race", "edition", "presents"}
+
+
+def domain_of(url: str) -> str:
+    host = urlparse(url).netloc.lower().split('@')[-1].split(':')[0]
+    return host[4:] if host.startswith("www.") else host
+
+
+def _name_tokens(event_name: str) -> set[str]:
+    tokens = re.findall(r'[a-z0-9]+', (event_name or "").lower())
+    return {t for t in tokens if len(t) >= 3 and not t.isdigit() and t not in NAME_STOPWORDS}
+
+
+def _match_ratio(tokens: set[str], text: str) -> float:
+    if not tokens or not text: return 0.0
+    text = re.sub(r'[^a-z0-9]', '', text.lower())
+    return sum(1 for t in tokens if t in text) / len(tokens)
+
+
+def _sigmoid(x: float) -> float:
+    return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, x))))
+
+
+class DomainReputationStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS domains (domain TEXT PRIMARY KEY, crawl_attempts INTEGER "
+                         "NOT NULL DEFAULT 0, crawl_successes INTEGER NOT NULL DEFAULT 0, passages INTEGER NOT NULL "
+                         "DEFAULT 0, useful_urls INTEGER NOT NULL DEFAULT 0, high_conf_fields INTEGER NOT NULL "
+                         "DEFAULT 0, updated_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS model (id INTEGER PRIMARY KEY CHECK (id = 1), weights TEXT "
+                         "NOT NULL, updates INTEGER NOT NULL DEFAULT 0)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def domains(self, names: list[str]) -> dict:
+        if not names: return {}
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM domains WHERE domain IN ({', '.join('?' * len(names))})",
+                                list(names)).fetchall()
+        return {row["domain"]: dict(row) for row in rows}
+
+    def model(self) -> tuple[dict, int]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT weights, updates FROM model WHERE id = 1").fetchone()
+        if row is None: return dict(PRIOR_WEIGHTS), 0
+        return {**PRIOR_WEIGHTS, **json.loads(row["weights"])}, row["updates"]
+
+    def record(self, outcomes: list[dict], update_model):
+        """
+        Adds one mission's per-URL outcomes to the domain totals and applies `update_model(weights) -> weights`
+        in the same transaction, so concurrent runner processes never lose each other's updates.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for o in outcomes:
+                conn.execute("INSERT INTO domains (domain, crawl_attempts, crawl_successes, passages, useful_urls, "
+                             "high_conf_fields, updated_at) VALUES (?, 1, ?, ?, ?, ?, ?) ON CONFLICT(domain) DO UPDATE "
+                             "SET crawl_attempts = crawl_attempts + 1, crawl_successes = crawl_successes + "
+                             "excluded.crawl_successes, passages = passages + excluded.passages, useful_urls = "
+                             "useful_urls + excluded.useful_urls, high_conf_fields = high_conf_fields + "
+                             "excluded.high_conf_fields, updated_at = excluded.updated_at",
+                             (o["domain"], int(o["crawled"]), o["passages"], int(o["fields"] > 0), o["fields"],
+                              time.time()))
+            row = conn.execute("SELECT weights, updates FROM model WHERE id = 1").fetchone()
+            weights = {**PRIOR_WEIGHTS, **json.loads(row["weights"])} if row else dict(PRIOR_WEIGHTS)
+            updates = (row["updates"] if row else 0) + len(outcomes)
+            conn.execute("INSERT OR REPLACE INTO model (id, weights, updates) VALUES (1, ?, ?)",
+                         (json.dumps(update_model(weights)), updates))
+            conn.execute("COMMIT")
+
+
+class UrlRanker:
+    def __init__(self, store: DomainReputationStore, min_training=URL_RANKER_MIN_TRAINING,
+                 primary_prob=URL_RANKER_PRIMARY_PROB, secondary_prob=URL_RANKER_SECONDARY_PROB,
+                 margin=URL_RANKER_MARGIN, learning_rate=URL_RANKER_LEARNING_RATE):
+        self.store = store
+        self.min_training, self.primary_prob, self.secondary_prob = min_training, primary_prob, secondary_prob
+        self.margin, self.learning_rate = margin, learning_rate
+
+    @staticmethod
+    def features(event_name: str, result: dict, rank: int, reputation: dict | None) -> dict:
+        url, tokens, rep = result.get('link') or "", _name_tokens(event_name), reputation or {}
+        attempts, useful = rep.get("crawl_attempts", 0), rep.get("useful_urls", 0)
+        # Smoothed rates, centred on 0 so an unseen domain contributes nothing either way.
+        return {"bias": 1.0, "name_in_host": _match_ratio(tokens, domain_of(url)),
+                "name_in_title": _match_ratio(tokens, result.get('title') or ""),
+                "name_in_snippet": _match_ratio(tokens, result.get('snippet') or ""),
+                "rank": 1.0 / (1.0 + rank),
+                "shallow_path": 1.0 / (1.0 + len([p for p in urlparse(url).path.split('/') if p])),
+                "domain_crawl_success": (rep.get("crawl_successes", 0) + 1.0) / (attempts + 2.0) - 0.5,
+                "domain_field_yield": (useful + 1.0) / (attempts + 2.0) - 0.5,
+                "domain_page_yield": math.log1p(rep.get("passages", 0) / max(1, attempts)) / 5.0 if attempts else 0.0}
+
+    def score(self, event_name: str, search_results: list, weights: dict = None) -> list[tuple[float, dict, dict]]:
+        """Returns (probability, result, features) per result, best first."""
+        if weights is None: weights, _ = self.store.model()
+        reputation = self.store.domains(list({domain_of(r.get('link') or "") for r in search_results}))
+        scored = []
+        for rank, result in enumerate(search_results):
+            if not result.get('link'): continue
+            features = self.features(event_name, result, rank, reputation.get(domain_of(result['link'])))
+            probability = _sigmoid(sum(weights.get(k, 0.0) * v for k, v in features.items()))
+            scored.append((probability, result, features))
+        return sorted(scored, key=lambda item: item[0], reverse=True)
+
+    def select(self, event_name: str, search_results: list, top_n: int) -> tuple[list[str], str]:
+        """Returns (urls, reason); urls is empty when the choice is ambiguous and the LLM should decide."""
+        weights, updates = self.store.model()
+        if updates < self.min_training: return [], f"ranker trained on {updates}/{self.min_training} URLs"
+        scored = self.score(event_name, search_results, weights)
+        if not scored: return [], "no candidate URLs"
+        if scored[0][0] < self.primary_prob: return [], f"best URL only {scored[0][0]:.2f} likely"
+        selected, rejected = [], []
+        for probability, result, _ in scored:
+            url = result['link']
+            if url in (u for u, _ in selected): continue
+            if len(selected) < top_n and (not selected or probability >= self.secondary_prob):
+                selected.append((url, probability))
+            else:
+                rejected.append(probability)
+        if rejected and rejected[0] > selected[-1][1] - self.margin:
+            return [], f"next URL ({rejected[0]:.2f}) too close to the last selected ({selected[-1][1]:.2f})"
+        return [u for u, _ in selected], f"top URL {scored[0][0]:.2f} likely, clear cut-off"
+
+    def record_mission(self, event_name: str, search_results: list, crawled: dict, passages: dict, fields: dict):
+        """
+        Learns from one mission: `crawled` maps each crawled URL to whether content came back, `passages` and
+        `fields` map URLs to the passages indexed from them and the high-confidence fields they supported.
+        """
+        if not crawled: return
+        by_url = {r['link']: (rank, r) for rank, r in reversed(list(enumerate(search_results))) if r.get('link')}
+        outcomes = [{"url": url, "domain": domain_of(url), "crawled": ok, "passages": passages.get(url, 0),
+                     "fields": fields.get(url, 0)} for url, ok in crawled.items()]
+        # Features are taken as they were before this mission's outcomes are added to the reputation.
+        reputation = self.store.domains(list({o["domain"] for o in outcomes}))
+        examples = []
+        for o in outcomes:
+            rank, result = by_url.get(o["url"], (len(search_results), {"link": o["url"]}))
+            examples.append((self.features(event_name, result, rank, reputation.get(o["domain"])),
+                             1.0 if o["fields"] > 0 else 0.0))
+
+        def update(weights: dict) -> dict:
+            for features, label in examples:
+                error = label - _sigmoid(sum(weights.get(k, 0.0) * v for k, v in features.items()))
+                for k, v in features.items(): weights[k] = weights.get(k, 0.0) + self.learning_rate * error * v
+            return weights
+
+        self.store.record(outcomes, update)
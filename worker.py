@@ -0,0 +1,129 @@
+# worker.py
+# Long-lived worker that serves jobs from the SQLite job queue. Models (and the Gemini client) are loaded
+# once at startup and stay warm between jobs, so a queued run starts without paying model startup again.
+#
+#   python worker.py --kind mistral
+#   python worker.py --kind gemini
+
+import os
+import sys
+import time
+import socket
+import signal
+import argparse
+import threading
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+
+from config import JOB_QUEUE_DB, WORKER_HEARTBEAT_SECONDS, WORKER_POLL_SECONDS, OUTPUT_DIR
+from job_queue import JobQueue
+from progress import reporter
+
+JOB_KINDS = ("mistral", "gemini")
+ORPHAN_TIMEOUT_SECONDS = 6 * WORKER_HEARTBEAT_SECONDS
+
+
+def start_heartbeat(queue: JobQueue, worker_id: str, stop_event: threading.Event) -> threading.Thread:
+    def beat():
+        while not stop_event.wait(WORKER_HEARTBEAT_SECONDS):
+            try:
+                queue.heartbeat(worker_id)
+            except Exception as e:
+                print(f"WARNING: Heartbeat failed: {e}")
+    thread = threading.Thread(target=beat, name="heartbeat", daemon=True)
+    thread.start()
+    return thread
+
+
+def warm_up(kind: str):
+    """Imports the runner and loads its models before the first job is claimed."""
+    start = time.perf_counter()
+    if kind == "mistral":
+        import main  # noqa: F401 (loads the agent stack)
+        from agent import load_shared_models
+        load_shared_models()
+    else:
+        import gemini  # noqa: F401
+    print(f"INFO: Worker warmed up in {time.perf_counter() - start:.1f}s.")
+
+
+def run_job(kind: str, job: dict, should_cancel) -> list[str]:
+    """Runs one job in-process and returns the output files it wrote."""
+    payload, job_env = job["payload"], job.get("secrets") or {}
+    output_dir = payload.get("output_dir", OUTPUT_DIR)
+    if kind == "mistral":
+        import main
+        return main.main(output_dir_override=output_dir, input_file_override=payload.get("input_file"),
+                         api_keys=job_env, output_tag=job["id"], should_cancel=should_cancel)
+    import gemini
+    gemini.reset_gemini_model()  # The job may carry a different GEMINI_API_KEY
+    output_path = gemini.main(output_dir_override=output_dir, input_dir_override=payload.get("input_dir"),
+                              output_tag=job["id"], should_cancel=should_cancel)
+    return [output_path] if output_path else []
+
+
+def serve_job(queue: JobQueue, kind: str, job: dict):
+    job_id = job["id"]
+    # Keys submitted with the job (handed over at claim, never stored); a re-queued job runs on the worker's own.
+    job_env = job.get("secrets") or {}
+    saved_env = {k: os.environ.get(k) for k in job_env}
+    os.environ.update(job_env)
+    reporter.path = job.get("progress_file")
+    status, output_files, error, interrupted = "failed", [], None, True
+    print(f"INFO: Running job {job_id} (priority {job['priority']}).")
+    start = time.perf_counter()
+    log_f = open(job["log_file"], 'a', encoding='utf-8', buffering=1) if job.get("log_file") else sys.stdout
+    try:
+        with redirect_stdout(log_f), redirect_stderr(log_f):
+            try:
+                output_files = run_job(kind, job, should_cancel=lambda: queue.is_cancel_requested(job_id))
+                status = "cancelled" if queue.is_cancel_requested(job_id) else "finished"
+            except Exception as e:
+                traceback.print_exc()
+                error = f"{type(e).__name__}: {e}"
+        interrupted = False
+    finally:
+        if log_f is not sys.stdout: log_f.close()
+        reporter.path = None
+        for k, v in saved_env.items():
+            if v is None: os.environ.pop(k, None)
+            else: os.environ[k] = v
+        # A worker stopped mid-job leaves it 'running'; the next worker to start re-queues it.
+        if not interrupted: queue.complete(job_id, status, output_files=output_files, error=error)
+    print(f"INFO: Job {job_id} {status} in {time.perf_counter() - start:.1f}s ({len(output_files)} output file(s)).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl4AI warm job worker")
+    parser.add_argument("--kind", choices=JOB_KINDS, required=True, help="Which runner this worker serves.")
+    parser.add_argument("--db", type=str, default=JOB_QUEUE_DB, help="Path to the job queue database.")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.db)
+    worker_id = f"{args.kind}-{socket.gethostname()}-{os.getpid()}"
+    queue.register_worker(worker_id, args.kind)
+    stop_event = threading.Event()
+    start_heartbeat(queue, worker_id, stop_event)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"INFO: Worker {worker_id} started.")
+    try:
+        if requeued := queue.requeue_orphaned(max_age=ORPHAN_TIMEOUT_SECONDS):
+            print(f"INFO: Re-queued {requeued} job(s) left behind by stopped workers.")
+        warm_up(args.kind)
+        while True:
+            job = queue.claim_next(worker_id, args.kind)
+            if job is None:
+                queue.requeue_orphaned(max_age=ORPHAN_TIMEOUT_SECONDS)
+                time.sleep(WORKER_POLL_SECONDS)
+                continue
+            serve_job(queue, args.kind, job)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        queue.unregister_worker(worker_id)
+        print(f"INFO: Worker {worker_id} stopped.")
+
+
+if __name__ == '__main__':
+    main()